@@ -0,0 +1,218 @@
+import inspect
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+import gym
+from layout import stream_seed, LevelCache
+from symbolic_env import SymbolicGoldRoom
+from utils import algorithm_params, plan_results, AllowedSimpleMovesFunction, GridMovesFunction, GridTables, HeuristicContext
+
+
+# Many planners on many envs in one call. The layouts are read once, with a single reset per env, and each one is
+# planned on a SymbolicGoldRoom rebuilt from it, so the planners never reset NLE. The layouts are grouped by size: the
+# GridTables of a size (moves of every cell and euclidean distance rows) are built once per worker and shared by all the
+# layouts of that size, through the HeuristicContext given to the planners that accept one and the moves function that
+# replaces the AllowedSimpleMovesFunction of their parameters. The groups are split into chunks planned by a pool of
+# worker processes; planners and their parameters are sent to the workers, so they must be picklable (functions of a
+# module and the moves functions of utils.py, not lambdas).
+
+
+# GridTables of the sizes planned by this process
+GRID_TABLES = LevelCache(maxsize=16)
+
+
+def grid_tables(width: int, height: int) -> GridTables:
+    grid = GRID_TABLES.get((width, height))
+    if grid == None:
+        grid = GridTables(width=width, height=height)
+        GRID_TABLES.put((width, height), grid)
+    return grid
+
+
+# Layout of env as the planners see it after a reset: the gold under the agent is not visible, so it is left out
+def env_layout(env: Any) -> dict:
+    state, _ = env.myreset()
+    normalize = lambda coord: (int(coord[0]), int(coord[1]))
+    return {
+        'width': int(env.width),
+        'height': int(env.height),
+        'gold_score': env.gold_score,
+        'stair_score': env.stair_score,
+        'time_penalty': env.time_penalty,
+        'agent_coord': normalize(state['agent_coord']),
+        'stair_coord': normalize(state['stair_coord']),
+        'gold_coords': [normalize(coord) for coord in state['gold_coords']],
+        'leprechaun_coords': [normalize(coord) for coord in state['leprechaun_coords']]
+    }
+
+
+def layout_room(layout: dict) -> SymbolicGoldRoom:
+    return SymbolicGoldRoom(**layout)
+
+
+# Parameters of a planner on a room of grid: the AllowedSimpleMovesFunction (given or default) becomes a
+# GridMovesFunction with the same cells to avoid, the context and the search limits are added where accepted. The
+# context only serves the default heuristic, so it is left out when the planner is given its own h.
+def planner_kwargs(algorithm: Callable, kwargs: dict, grid: GridTables, context: HeuristicContext, search_limits: dict) -> dict:
+    parameters = inspect.signature(algorithm).parameters
+    kwargs = dict(kwargs)
+    for key, parameter in parameters.items():
+        value = kwargs.get(key, parameter.default)
+        if type(value) == AllowedSimpleMovesFunction:
+            kwargs[key] = GridMovesFunction(grid=grid, to_avoid=value.to_avoid)
+    if 'context' in parameters and 'context' not in kwargs and 'h' not in kwargs:
+        kwargs['context'] = context
+    for key, value in search_limits.items():
+        if key in parameters and key not in kwargs:
+            kwargs[key] = value
+    return kwargs
+
+
+# Runs every planner on the layouts of a chunk (all of the same size)
+def _plan_chunk(layouts: List[Tuple[int, dict]], planners: List[Tuple[Callable, dict]], search_limits: dict) -> List[dict]:
+    records = []
+    for index, layout in layouts:
+        grid = grid_tables(width=layout['width'], height=layout['height'])
+        room = layout_room(layout=layout)
+        room.myreset()
+        context = HeuristicContext(env=room.to_dict(), grid=grid)
+        for planner_index, (algorithm, kwargs) in enumerate(planners):
+            start_time = time.perf_counter()
+            plan, expanded_nodes = algorithm(env=room, **planner_kwargs(algorithm=algorithm, kwargs=kwargs, grid=grid, context=context, search_limits=search_limits))
+            records.append({
+                'env': index,
+                'planner': planner_index,
+                'algorithm': {
+                    'name': algorithm.__name__,
+                    'params': algorithm_params(kwargs=kwargs)
+                },
+                'results': plan_results(plan_stats=plan.stats(env=room), expanded_nodes=expanded_nodes),
+                'seconds': time.perf_counter() - start_time,
+                'plan': plan
+            })
+    return records
+
+
+# Plans of every planner, given as (algorithm, kwargs) with the interface of a_star_search, on every env (or layout
+# dict of env_layout). With n_workers > 1 the chunks of at most chunk_size layouts are planned by a pool of processes,
+# otherwise in this process. The plans are ordered by env, then planner; each one has the Plan, the results of
+# design_plan and its seconds. search_limits are given to the planners that accept them, as in design_plan.
+def plan_many(
+    envs: List[Any],
+    planners: List[Tuple[Callable, dict]],
+    n_workers: int = 1,
+    chunk_size: int = 16,
+    search_limits: dict = None,
+    start_method: str = 'spawn'
+) -> dict:
+
+    start_time = time.perf_counter()
+
+    if n_workers < 1:
+        raise ValueError(f'At least one worker is needed, not {n_workers}')
+    if chunk_size < 1:
+        raise ValueError(f'Parameter chunk_size must be positive, not {chunk_size}')
+    search_limits = {} if search_limits == None else search_limits
+
+    layouts = [env if isinstance(env, dict) else env_layout(env=env) for env in envs]
+    extract_seconds = time.perf_counter() - start_time
+
+    groups: Dict[Tuple[int, int], List[Tuple[int, dict]]] = {}
+    for index, layout in enumerate(layouts):
+        groups.setdefault((layout['width'], layout['height']), []).append((index, layout))
+    chunks = [group[i:i + chunk_size] for group in groups.values() for i in range(0, len(group), chunk_size)]
+
+    if n_workers == 1:
+        records = [record for chunk in chunks for record in _plan_chunk(layouts=chunk, planners=planners, search_limits=search_limits)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context(start_method)) as executor:
+            futures = [executor.submit(_plan_chunk, layouts=chunk, planners=planners, search_limits=search_limits) for chunk in chunks]
+            records = [record for future in futures for record in future.result()]
+    records.sort(key=lambda record: (record['env'], record['planner']))
+
+    return {
+        'plans': records,
+        'stats': {
+            'envs': len(layouts),
+            'planners': len(planners),
+            'plans': len(records),
+            'grids': len(groups),
+            'chunks': len(chunks),
+            'workers': n_workers,
+            'extract_seconds': extract_seconds,
+            'plan_seconds': sum([record['seconds'] for record in records]),
+            'seconds': time.perf_counter() - start_time
+        }
+    }
+
+
+# (algorithm, kwargs) of every parameter set of a config of experiment_config.py
+def config_planners(config: dict) -> List[Tuple[Callable, dict]]:
+    return [(algorithm, kwargs) for algorithm, alg_params in zip(config['algorithms'], config['alg_paramss']) for kwargs in alg_params]
+
+
+# Layouts of the envs of design_plan for config (same grid and seeds), each with the init of its results. Every env is
+# closed as soon as its layout is read.
+def config_layouts(config: dict, max_fraction: float = 0.8, env_factory: Callable[..., Any] = None, seed: int = None) -> List[Tuple[dict, dict]]:
+
+    if env_factory == None:
+        env_factory = lambda **kwargs: gym.make('MiniHack-MyTask-Custom-v0', observation_mode='symbolic', **kwargs)
+
+    layouts = []
+    for width, height in zip(config['widths'], config['heights']):
+        for stair_score in config['stair_scores']:
+            for time_penalty in config['time_penalties']:
+                for gold_score in config['gold_scores']:
+                    for nl in config['n_leps']:
+                        if nl >= max_fraction*width*height:
+                            continue
+                        for ng in config['n_golds']:
+                            if ng >= max_fraction*width*height:
+                                continue
+                            init = {
+                                'width': width,
+                                'height': height,
+                                'n_golds': ng,
+                                'n_leps': nl,
+                                'gold_score': gold_score,
+                                'time_penalty': time_penalty
+                            }
+                            for episode_index in range(config['n_episodes']):
+                                env_kwargs = {}
+                                if seed != None:
+                                    env_kwargs['seed'] = stream_seed(seed, width, height, time_penalty, gold_score, stair_score, nl, ng, episode_index)
+                                env = env_factory(
+                                    width=width,
+                                    height=height,
+                                    n_leps=nl,
+                                    n_golds=ng,
+                                    max_episode_steps=config['max_steps'],
+                                    gold_score=gold_score,
+                                    stair_score=stair_score,
+                                    time_penalty=time_penalty,
+                                    **env_kwargs
+                                )
+                                layouts.append((init, env_layout(env=env)))
+                                if hasattr(env, 'close'):
+                                    env.close()
+    return layouts
+
+
+# A design_plan sweep of config as one plan_many call: the plans come back in the order of design_plan, each with the
+# init of its env
+def plan_config(
+    config: dict,
+    max_fraction: float = 0.8,
+    env_factory: Callable[..., Any] = None,
+    seed: int = None,
+    n_workers: int = 1,
+    chunk_size: int = 16,
+    search_limits: dict = None
+) -> dict:
+
+    layouts = config_layouts(config=config, max_fraction=max_fraction, env_factory=env_factory, seed=seed)
+    result = plan_many(envs=[layout for _, layout in layouts], planners=config_planners(config=config), n_workers=n_workers, chunk_size=chunk_size, search_limits=search_limits)
+    for record in result['plans']:
+        record['init'] = layouts[record['env']][0]
+    return result
@@ -0,0 +1,406 @@
+import numpy as np
+from typing import Callable, List, Tuple, Union
+from utils import action_to_move, ACTIONS
+from layout import check_layout_arguments, sample_layout
+from symbolic_env import FROZEN_STEP_PENALTY, NEIGHBOURS
+
+MOVE_TABLE = np.array([action_to_move(action) for action in ACTIONS])
+MOVE_NORMS = np.linalg.norm(MOVE_TABLE, axis=1)
+NEIGHBOUR_TABLE = np.array(NEIGHBOURS)
+
+LEPRECHAUN_MODELS = ['static', 'random', 'chasing']
+
+
+# Coordinates are compared and measured on their two components directly, which is much faster than reducing over
+# the last axis of the large broadcasted arrays
+def same_cell(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a[..., 0] == b[..., 0]) & (a[..., 1] == b[..., 1])
+
+
+def distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.hypot(a[..., 0] - b[..., 0], a[..., 1] - b[..., 1])
+
+
+# Column of the n-th (from 0) True of every row of mask
+def nth_true(mask: np.ndarray, n: np.ndarray) -> np.ndarray:
+    return np.argmax(np.cumsum(mask, axis=1) > n[:, None], axis=1)
+
+
+# Every room is a record of a structured array: golds and leprechauns are padded to the same number for all the rooms,
+# the masks tell which entries are actually in the room (for golds: still lying on the floor, so the gold under the
+# start cell, lost as in NLE, is masked out from the beginning).
+def room_dtype(n_golds: int, n_leps: int) -> np.dtype:
+    return np.dtype([
+        ('agent_coord', np.int64, 2),
+        ('stair_coord', np.int64, 2),
+        ('gold_coords', np.int64, (n_golds, 2)),
+        ('gold_mask', np.bool_, n_golds),
+        ('leprechaun_coords', np.int64, (n_leps, 2)),
+        ('leprechaun_mask', np.bool_, n_leps),
+        ('gold', np.float64),
+        ('steps', np.int64),
+        ('max_episode_steps', np.int64),
+        ('episode_return', np.float64),
+        ('done', np.bool_)
+    ])
+
+
+# N gold rooms of the same size stepped in lockstep, with the same dynamics of SymbolicGoldRoom. mystep takes one
+# action per room and returns the batched state together with the reward and done vectors. With auto_reset, finished
+# rooms restart from their initial layout in the same call; the returned 'episode_return' and 'episode_steps' still
+# refer to the episode that has just finished.
+class BatchedGoldRoom:
+
+    # Constructor ------------------------------------------------------------------------------------------------------
+    def __init__(
+        self,
+        n_rooms: int = None,
+        width: int = 2,
+        height: int = 2,
+        gold_score: float = 1.0,
+        stair_score: float = 1.0,
+        time_penalty: float = -1.0,
+        n_golds: int = 0,
+        n_leps: int = 0,
+        max_episode_steps: Union[int, List[int]] = 100,
+        layouts: List[dict] = None,
+        leprechaun_model: str = 'chasing',
+        theft_prob: float = 1.0,
+        prob_stay: float = 0.0,
+        auto_reset: bool = True,
+        seed: int = None
+    ):
+        if n_rooms == None and layouts == None:
+            raise RuntimeError('Either n_rooms or layouts must be given')
+
+        if layouts != None and n_rooms != None and n_rooms != len(layouts):
+            raise RuntimeError(f'n_rooms = {n_rooms} does not match the number of layouts ({len(layouts)})')
+
+        if leprechaun_model not in LEPRECHAUN_MODELS:
+            raise ValueError(f'Parameter leprechaun_model must be one of {LEPRECHAUN_MODELS}, not {leprechaun_model}')
+
+        if theft_prob < 0 or theft_prob > 1:
+            raise RuntimeError(f'Invalid argument theft_prob = {theft_prob}')
+
+        # layout sampling, leprechaun moves and thefts are drawn from this stream only
+        self.rng = np.random.default_rng(seed)
+
+        if layouts == None:
+            layouts = []
+            for _ in range(n_rooms):
+                check_layout_arguments(
+                    width=width, height=height, gold_score=gold_score, stair_score=stair_score,
+                    time_penalty=time_penalty, agent_coord=None, stair_coord=None, gold_coords=None,
+                    leprechaun_coords=None, n_golds=n_golds, n_leps=n_leps, max_episode_steps=0
+                )
+                agent_coord, stair_coord, gold_coords, leprechaun_coords = sample_layout(
+                    width=width, height=height, n_golds=n_golds, n_leps=n_leps, rng=self.rng
+                )
+                layouts.append({
+                    'agent_coord': agent_coord,
+                    'stair_coord': stair_coord,
+                    'gold_coords': gold_coords,
+                    'leprechaun_coords': leprechaun_coords
+                })
+
+        self.n_rooms = len(layouts)
+        self.width = width
+        self.height = height
+        self.gold_score = gold_score
+        self.stair_score = stair_score
+        self.time_penalty = time_penalty
+        self.leprechaun_model = leprechaun_model
+        self.theft_prob = theft_prob
+        # probability that a leprechaun of the random model does not move, as in RandomLeprechaunModel
+        self.prob_stay = prob_stay
+        self.auto_reset = auto_reset
+
+        max_golds = max([len(layout['gold_coords']) for layout in layouts])
+        max_leps = max([len(layout.get('leprechaun_coords', [])) for layout in layouts])
+
+        self.init_rooms = np.zeros(self.n_rooms, dtype=room_dtype(n_golds=max_golds, n_leps=max_leps))
+        self.init_rooms['max_episode_steps'] = max_episode_steps
+
+        for i, layout in enumerate(layouts):
+            check_layout_arguments(
+                width=width, height=height, gold_score=gold_score, stair_score=stair_score,
+                time_penalty=time_penalty, agent_coord=tuple(layout['agent_coord']),
+                stair_coord=tuple(layout['stair_coord']), gold_coords=[tuple(c) for c in layout['gold_coords']],
+                leprechaun_coords=[tuple(c) for c in layout.get('leprechaun_coords', [])], n_golds=0, n_leps=0,
+                max_episode_steps=int(self.init_rooms['max_episode_steps'][i])
+            )
+            room = self.init_rooms[i]
+            room['agent_coord'] = layout['agent_coord']
+            room['stair_coord'] = layout['stair_coord']
+            n = len(layout['gold_coords'])
+            if n > 0:
+                room['gold_coords'][:n] = layout['gold_coords']
+                room['gold_mask'][:n] = ~same_cell(room['gold_coords'][:n], room['agent_coord'])
+            n = len(layout.get('leprechaun_coords', []))
+            if n > 0:
+                room['leprechaun_coords'][:n] = layout['leprechaun_coords']
+                room['leprechaun_mask'][:n] = True
+
+        self.rooms = self.init_rooms.copy()
+
+    # Build the batch from existing environments (SymbolicGoldRoom or MiniHackGoldRoom) of the same size
+    @classmethod
+    def from_envs(cls, envs: list, **kwargs) -> 'BatchedGoldRoom':
+        layouts = []
+        for env in envs:
+            if env.width != envs[0].width or env.height != envs[0].height:
+                raise RuntimeError('All the environments of a batch must have the same size')
+            layouts.append({
+                'agent_coord': env.agent_coord,
+                'stair_coord': env.stair_coord,
+                'gold_coords': env.gold_coords,
+                'leprechaun_coords': env.leprechaun_coords
+            })
+        return cls(
+            width=envs[0].width,
+            height=envs[0].height,
+            gold_score=envs[0].gold_score,
+            stair_score=envs[0].stair_score,
+            time_penalty=envs[0].time_penalty,
+            max_episode_steps=[env.max_episode_steps for env in envs],
+            layouts=layouts,
+            **kwargs
+        )
+
+    # Reset the environments -------------------------------------------------------------------------------------------
+    def myreset(self) -> Tuple[dict, np.ndarray]:
+        self.rooms = self.init_rooms.copy()
+        return self.state(), np.zeros(self.n_rooms)
+
+    # Perform a step in every environment ------------------------------------------------------------------------------
+    def mystep(self, actions: np.ndarray) -> Tuple[dict, np.ndarray, np.ndarray]:
+        actions = np.asarray(actions)
+        if actions.shape != (self.n_rooms,):
+            raise RuntimeError(f'Expected {self.n_rooms} actions, got an array of shape {actions.shape}')
+
+        rooms = self.rooms
+        active = ~rooms['done']
+        agent = rooms['agent_coord']
+        rewards = np.where(active, self.time_penalty * MOVE_NORMS[actions], 0.0)
+
+        # the agent cannot leave the room, and bumping into a leprechaun is an attack: in both cases it does not move
+        target = agent + MOVE_TABLE[actions]
+        in_bounds = (target[:, 0] >= 0) & (target[:, 0] < self.width) & (target[:, 1] >= 0) & (target[:, 1] < self.height)
+        hit = (same_cell(rooms['leprechaun_coords'], target[:, None]) & rooms['leprechaun_mask']).any(axis=1)
+        moved = active & in_bounds & ~hit
+        agent[moved] = target[moved]
+        # attacking a leprechaun takes a turn, walking into a wall does not
+        rewards += FROZEN_STEP_PENALTY * (active & ~in_bounds)
+
+        on_gold = same_cell(rooms['gold_coords'], agent[:, None]) & rooms['gold_mask'] & moved[:, None]
+        picked = on_gold.any(axis=1)
+        rooms['gold_mask'] &= ~on_gold
+        rewards += self.gold_score * picked
+
+        stair_reached = active & same_cell(agent, rooms['stair_coord'])
+        rewards += self.stair_score * stair_reached
+
+        stolen = self._move_leprechauns(active=active & ~stair_reached)
+        rewards -= rooms['gold'] * stolen
+        rooms['gold'] = np.where(stolen, 0, rooms['gold']) + self.gold_score * picked
+
+        rooms['steps'] += active
+        rooms['episode_return'] += rewards
+        dones = active & (stair_reached | (rooms['steps'] >= rooms['max_episode_steps']))
+        rooms['done'] |= dones
+
+        episode_return = rooms['episode_return'].copy()
+        episode_steps = rooms['steps'].copy()
+
+        if self.auto_reset and dones.any():
+            rooms[dones] = self.init_rooms[dones]
+
+        state = self.state()
+        state['episode_return'] = episode_return
+        state['episode_steps'] = episode_steps
+        state['stair_reached'] = stair_reached
+
+        return state, rewards, dones
+
+    # Leprechauns next to an agent carrying gold try to steal it and teleport to a random free cell, the others move
+    # according to the leprechaun model and pick up the gold of the cell they move to. The models are the ones of
+    # symbolic_env.py ('chasing': ChasingLeprechaunModel, 'random': RandomLeprechaunModel with prob_stay), with the same
+    # candidate cells in the same order, and every draw is taken only for the rooms that need it, in the order of
+    # SymbolicGoldRoom: a batch of one room follows the same random stream. Returns the rooms whose purse has been
+    # stolen.
+    def _move_leprechauns(self, active: np.ndarray) -> np.ndarray:
+        rooms = self.rooms
+        agent = rooms['agent_coord']
+        leps = rooms['leprechaun_coords']
+        stolen = np.zeros(self.n_rooms, dtype=bool)
+
+        for j in range(leps.shape[1]):
+            lep = leps[:, j]
+            lep_active = active & rooms['leprechaun_mask'][:, j]
+            adjacent = np.max(np.abs(lep - agent), axis=1) == 1
+            attempt = lep_active & adjacent & (rooms['gold'] > 0) & ~stolen
+            steal = attempt.copy()
+            steal[attempt] = self.rng.random(attempt.sum()) < self.theft_prob
+            stolen |= steal
+
+            if steal.any():
+                self._teleport(rooms=steal, j=j)
+
+            move = lep_active & ~attempt
+            if self.leprechaun_model == 'static' or not move.any():
+                continue
+            # free neighbours in the order of NEIGHBOURS, then (chasing model only) the cell of the leprechaun
+            candidates = lep[move][:, None] + NEIGHBOUR_TABLE[None]
+            free = np.all((candidates >= 0) & (candidates < np.array([self.width, self.height])), axis=-1)
+            free &= ~same_cell(candidates, agent[move][:, None])
+            others = rooms['leprechaun_mask'][move].copy()
+            others[:, j] = False
+            free &= ~(same_cell(leps[move][:, :, None], candidates[:, None]) & others[:, :, None]).any(axis=1)
+            if self.leprechaun_model == 'chasing':
+                candidates = np.concatenate([candidates, lep[move][:, None]], axis=1)
+                free = np.concatenate([free, np.ones((len(free), 1), dtype=bool)], axis=1)
+                dists = np.max(np.abs(candidates - agent[move][:, None]), axis=-1)
+                best = free & (dists == np.where(free, dists, np.inf).min(axis=1, keepdims=True))
+                picks = self.rng.integers(0, best.sum(axis=1))
+                new = candidates[np.arange(len(best)), nth_true(mask=best, n=picks)]
+            else:
+                new = lep[move].copy()
+                can_move = free.any(axis=1)
+                can_move[can_move] = self.rng.random(can_move.sum()) >= self.prob_stay
+                picks = self.rng.integers(0, free[can_move].sum(axis=1))
+                new[can_move] = candidates[can_move][np.arange(can_move.sum()), nth_true(mask=free[can_move], n=picks)]
+            moved = move.copy()
+            moved[move] = ~same_cell(new, lep[move])
+            lep[move] = new
+            rooms['gold_mask'] &= ~(same_cell(rooms['gold_coords'], lep[:, None]) & moved[:, None])
+
+        return stolen
+
+    # Leprechaun j of the given rooms goes to a cell drawn uniformly among the ones not taken by the agent, by the other
+    # leprechauns or by itself, as in SymbolicGoldRoom; it stays where it is if there is none
+    def _teleport(self, rooms: np.ndarray, j: int) -> None:
+        cells = np.array([(x, y) for x in range(self.width) for y in range(self.height)])
+        agent = self.rooms['agent_coord'][rooms]
+        lep = self.rooms['leprechaun_coords'][rooms, j]
+        others = self.rooms['leprechaun_mask'][rooms].copy()
+        others[:, j] = False
+        free = ~same_cell(cells[None], agent[:, None]) & ~same_cell(cells[None], lep[:, None])
+        free &= ~(same_cell(self.rooms['leprechaun_coords'][rooms][:, :, None], cells[None, None]) & others[:, :, None]).any(axis=1)
+        some_free = free.any(axis=1)
+        picks = self.rng.integers(0, free[some_free].sum(axis=1))
+        lep[some_free] = cells[nth_true(mask=free[some_free], n=picks)]
+        self.rooms['leprechaun_coords'][rooms, j] = lep
+
+    def _occupied(self, coords: np.ndarray, exclude: int) -> np.ndarray:
+        mask = self.rooms['leprechaun_mask'].copy()
+        mask[:, exclude] = False
+        return (same_cell(self.rooms['leprechaun_coords'], coords[:, None]) & mask).any(axis=1)
+
+    # Moves that keep the agent in the room and do not hit a leprechaun, as a (n_rooms, 8) mask over ACTIONS
+    def allowed_actions(self) -> np.ndarray:
+        target = self.rooms['agent_coord'][:, None] + MOVE_TABLE[None]
+        in_bounds = np.all((target >= 0) & (target < np.array([self.width, self.height])), axis=-1)
+        hit = (
+            same_cell(self.rooms['leprechaun_coords'][:, None], target[:, :, None])
+            & self.rooms['leprechaun_mask'][:, None]
+        ).any(axis=-1)
+        return in_bounds & ~hit
+
+    # Golds visible in the map: still on the floor and not under the agent
+    def visible_golds(self) -> np.ndarray:
+        under_agent = same_cell(self.rooms['gold_coords'], self.rooms['agent_coord'][:, None])
+        return self.rooms['gold_mask'] & ~under_agent
+
+    def state(self) -> dict:
+        return {
+            'gold': self.rooms['gold'].copy(),
+            'time': self.rooms['steps'].copy(),
+            'agent_coord': self.rooms['agent_coord'].copy(),
+            'stair_coord': self.rooms['stair_coord'].copy(),
+            'gold_coords': self.rooms['gold_coords'].copy(),
+            'gold_mask': self.visible_golds(),
+            'leprechaun_coords': self.rooms['leprechaun_coords'].copy(),
+            'leprechaun_mask': self.rooms['leprechaun_mask'].copy(),
+            'done': self.rooms['done'].copy()
+        }
+
+
+# Vectorized version of the value function of online_search_f (scaled_default_score + w * scaled_default_heuristic),
+# evaluated for the 8 moves of every room. Golds on the stair are ignored, as in online_search_f.
+def batched_online_values(batch: BatchedGoldRoom, w: float = 1.0) -> np.ndarray:
+    rooms = batch.rooms
+    tp, gs, ss = batch.time_penalty, batch.gold_score, batch.stair_score
+    agent = rooms['agent_coord']
+    stair = rooms['stair_coord']
+    golds = rooms['gold_coords']
+    next_agent = agent[:, None] + MOVE_TABLE[None]
+
+    on_stair = same_cell(golds, stair[:, None])
+    state_golds = batch.visible_golds() & ~on_stair
+    init_golds = batch.init_rooms['gold_mask'] & ~on_stair & ~same_cell(golds, batch.init_rooms['agent_coord'][:, None])
+
+    # scaled_default_score
+    next_on_gold = (same_cell(golds[:, None], next_agent[:, :, None]) & state_golds[:, None]).any(axis=-1)
+    next_on_stair = same_cell(next_agent, stair[:, None])
+    score = gs * next_on_gold + ss * next_on_stair + tp * MOVE_NORMS[None]
+    if gs + ss == 0:
+        scaled_g = np.zeros(score.shape)
+    else:
+        scaled_g = (score - tp) / (gs + ss)
+
+    # default_heuristic
+    agent_stair_dist = distance(next_agent, stair[:, None])
+    actual_golds = state_golds[:, None] & ~same_cell(golds[:, None], next_agent[:, :, None])
+    n_actual = actual_golds.sum(axis=-1)
+    agent_gold_dists = distance(next_agent[:, :, None], golds[:, None])
+    gold_stair_dists = distance(golds, stair[:, None])
+    path_lengths = np.where(actual_golds, agent_gold_dists + gold_stair_dists[:, None], np.inf).min(axis=-1, initial=np.inf)
+    strategy1 = tp * agent_stair_dist + ss
+    strategy2 = np.where(n_actual > 0, tp * path_lengths + gs * n_actual + ss, -np.inf)
+    h = np.where(agent_stair_dist == 0, 0.0, np.maximum(strategy1, strategy2))
+
+    # scaled_default_heuristic
+    min_gold_stair = np.where(state_golds, gold_stair_dists, np.inf).min(axis=-1, initial=np.inf)
+    max_h = np.maximum((tp + tp * min_gold_stair + gs * init_golds.sum(axis=-1) + ss)[:, None], strategy1)
+    vertices = np.array([(0, 0), (0, batch.height - 1), (batch.width - 1, 0), (batch.width - 1, batch.height - 1)])
+    min_h = (tp * distance(stair[:, None], vertices[None]).max(axis=-1))[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled_h = np.where(max_h == min_h, 0.0, (h - min_h) / (max_h - min_h))
+    scaled_h = np.where(state_golds.any(axis=-1)[:, None], scaled_h, strategy1)
+
+    return scaled_g + w * scaled_h
+
+
+# Batched counterpart of online_greedy_search / weighted_online_greedy_search: in every room the allowed move with the
+# highest value is taken, ties are broken at random.
+def greedy_policy(w: float = 1.0) -> Callable[[BatchedGoldRoom], np.ndarray]:
+
+    def policy(batch: BatchedGoldRoom) -> np.ndarray:
+        values = np.where(batch.allowed_actions(), batched_online_values(batch=batch, w=w), -np.inf)
+        best = values == values.max(axis=1, keepdims=True)
+        return np.argmax(np.where(best, batch.rng.random(values.shape), -1), axis=1)
+
+    return policy
+
+
+# Runs the first episode of every room with the given policy and returns, for each room, the total reward, the number
+# of steps and whether the stair has been reached.
+def run_policy(batch: BatchedGoldRoom, policy: Callable[[BatchedGoldRoom], np.ndarray]) -> List[dict]:
+    batch.myreset()
+    finished = np.zeros(batch.n_rooms, dtype=bool)
+    total_rewards = np.zeros(batch.n_rooms)
+    steps = np.zeros(batch.n_rooms, dtype=np.int64)
+    stair_reached = np.zeros(batch.n_rooms, dtype=bool)
+
+    while not finished.all():
+        state, _, dones = batch.mystep(actions=policy(batch))
+        new = dones & ~finished
+        total_rewards[new] = state['episode_return'][new]
+        steps[new] = state['episode_steps'][new]
+        stair_reached[new] = state['stair_reached'][new]
+        finished |= dones
+
+    return [
+        {'reward': float(r), 'steps': int(s), 'done': bool(d)}
+        for r, s, d in zip(total_rewards, steps, stair_reached)
+    ]
@@ -0,0 +1,401 @@
+import time
+import numpy as np
+from queue import PriorityQueue
+from typing import Any, Callable, List, Tuple
+from gold_room_env import AGENT_CHAR, GOLD_CHAR, LEPRECHAUN_CHAR, STAIR_CHAR, MiniHackGoldRoom, crop_window, parse_entities, decode_message
+from planning import Frontier, Node, a_star_search
+from pattern_database import PatternDatabaseHeuristic
+from incremental_search import IncrementalPlanner
+from parallel_search import HdaStarPool
+from symbolic_env import SymbolicGoldRoom, RandomLeprechaunModel
+from batch_planning import config_layouts, config_planners, layout_room, plan_many
+from distance_tables import SUBPLAN_CACHE
+from experiment_config import CONFIG_PLANNING
+from layout import stream_seed
+from utils import plan_results, ACTIONS, ALLOWED_SIMPLE_MOVES, ALLOWED_JUMP_POINT_MOVES, AllowedSimpleMovesFunction
+
+CHARS_SHAPE = (21, 79)
+
+
+# Chars array of a room drawn in the middle of the NLE screen, as MiniHack returns it
+def synthetic_chars(width: int, height: int, n_golds: int, n_leps: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    chars = np.full(CHARS_SHAPE, 32, dtype=np.uint8)
+    top = (CHARS_SHAPE[0] - height) // 2
+    left = (CHARS_SHAPE[1] - width) // 2
+    chars[top:top + height, left:left + width] = ord('.')
+    cells = rng.choice(width * height, size=2 + n_golds + n_leps, replace=False)
+    rows, cols = top + cells // width, left + cells % width
+    chars[rows[0], cols[0]] = AGENT_CHAR
+    chars[rows[1], cols[1]] = STAIR_CHAR
+    chars[rows[2:2 + n_golds], cols[2:2 + n_golds]] = GOLD_CHAR
+    chars[rows[2 + n_golds:], cols[2 + n_golds:]] = LEPRECHAUN_CHAR
+    return chars
+
+
+def synthetic_message(text: str = '$ - a gold piece.') -> np.ndarray:
+    message = np.zeros(256, dtype=np.uint8)
+    message[:len(text)] = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+    return message
+
+
+# Parsing done by mystep (and again by the reward function) before the crop window and the single-pass extraction
+def legacy_parse(chars: np.ndarray, message: np.ndarray, height: int) -> Tuple[np.ndarray, Tuple[int, int], List[Tuple[int, int]], List[Tuple[int, int]], str]:
+    non_empty_rows = ~np.all(chars == 32, axis=1)
+    non_empty_cols = ~np.all(chars == 32, axis=0)
+    env_map = chars[non_empty_rows][:, non_empty_cols]
+    x, y = np.where(env_map == AGENT_CHAR)
+    agent_coord = (y[0], height - x[0] - 1)
+    rows, cols = np.where(env_map == GOLD_CHAR)
+    gold_coords = [(col, height - row - 1) for row, col in zip(rows, cols)]
+    rows, cols = np.where(env_map == LEPRECHAUN_CHAR)
+    leprechaun_coords = [(col, height - row - 1) for row, col in zip(rows, cols)]
+    text = bytes(message).decode('utf-8').rstrip('\x00')
+    return env_map, agent_coord, gold_coords, leprechaun_coords, text
+
+
+def fused_parse(chars: np.ndarray, message: np.ndarray, height: int, crop: Tuple[slice, slice]) -> Tuple[np.ndarray, Tuple[int, int], List[Tuple[int, int]], List[Tuple[int, int]], str]:
+    env_map = chars[crop].copy()
+    agent_coord, gold_coords, leprechaun_coords = parse_entities(env_map=env_map, height=height)
+    return env_map, agent_coord, gold_coords, leprechaun_coords, decode_message(message)
+
+
+# Per-step observation parsing cost of the gold room. The legacy step parsed every observation twice (reward function
+# and mystep), the current one parses it once with the crop window computed at reset.
+def benchmark_parsing(width: int = 10, height: int = 10, n_golds: int = 5, n_leps: int = 2, n_steps: int = 10000, seed: int = 0) -> dict:
+    chars = synthetic_chars(width=width, height=height, n_golds=n_golds, n_leps=n_leps, seed=seed)
+    message = synthetic_message()
+    crop = crop_window(chars=chars)
+
+    legacy = legacy_parse(chars=chars, message=message, height=height)
+    fused = fused_parse(chars=chars, message=message, height=height, crop=crop)
+    if not np.array_equal(legacy[0], fused[0]) or legacy[1:] != fused[1:]:
+        raise RuntimeError('The fused parsing does not match the legacy one')
+
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        legacy_parse(chars=chars, message=message, height=height)
+        legacy_parse(chars=chars, message=message, height=height)
+    legacy_time = (time.perf_counter() - start) / n_steps
+
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        fused_parse(chars=chars, message=message, height=height, crop=crop)
+    fused_time = (time.perf_counter() - start) / n_steps
+
+    return {
+        'legacy_us_per_step': legacy_time * 1e6,
+        'fused_us_per_step': fused_time * 1e6,
+        'speedup': legacy_time / fused_time
+    }
+
+
+# Speed of SymbolicGoldRoom against MiniHackGoldRoom (NLE, symbolic observations) on the same layout: steps per second
+# replaying the same random actions on one instance (reset at the end of each episode), and episodes per second when
+# every episode builds its own environment, as the sweeps of run_episodes do. Leprechauns are left out by default, as
+# in check_parity, so that both rooms play the same episodes. The symbolic room is meant to be at least 100 times
+# faster.
+def benchmark_symbolic_env(
+    width: int = 10,
+    height: int = 10,
+    n_golds: int = 5,
+    n_leps: int = 0,
+    n_steps: int = 5000,
+    n_episodes: int = 10,
+    max_episode_steps: int = 100,
+    seed: int = 0
+) -> dict:
+    rng = np.random.default_rng(seed)
+    actions = [ACTIONS[i] for i in rng.integers(len(ACTIONS), size=n_steps)]
+    nle_env = MiniHackGoldRoom(
+        width=width, height=height, n_golds=n_golds, n_leps=n_leps, max_episode_steps=max_episode_steps,
+        observation_mode='symbolic', seed=stream_seed(seed, width, height, n_golds, n_leps)
+    )
+    layout = {
+        'width': width, 'height': height, 'agent_coord': nle_env.agent_coord, 'stair_coord': nle_env.stair_coord,
+        'gold_coords': nle_env.gold_coords, 'leprechaun_coords': nle_env.leprechaun_coords,
+        'max_episode_steps': max_episode_steps, 'seed': seed
+    }
+    factories = [
+        ('nle', lambda: MiniHackGoldRoom(observation_mode='symbolic', **layout)),
+        ('symbolic', lambda: SymbolicGoldRoom(**layout))
+    ]
+
+    result = {}
+    for name, factory in factories:
+        env = nle_env if name == 'nle' else factory()
+        start = time.perf_counter()
+        env.myreset()
+        for action in actions:
+            _, _, done = env.mystep(action=action)
+            if done:
+                env.myreset()
+        result[f'{name}_steps_per_second'] = n_steps / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for episode in range(n_episodes):
+            env = factory()
+            env.myreset()
+            for action in actions[episode * max_episode_steps:(episode + 1) * max_episode_steps]:
+                _, _, done = env.mystep(action=action)
+                if done:
+                    break
+            if hasattr(env, 'close'):
+                env.close()
+        result[f'{name}_episodes_per_second'] = n_episodes / (time.perf_counter() - start)
+
+    nle_env.close()
+    result['step_speedup'] = result['symbolic_steps_per_second'] / result['nle_steps_per_second']
+    result['episode_speedup'] = result['symbolic_episodes_per_second'] / result['nle_episodes_per_second']
+    return result
+
+
+# Frontier of a_star_search before the binary heap: a locked PriorityQueue ordered by Node.__lt__, where improved nodes
+# are pushed again and every entry is returned
+class PriorityQueueFrontier(Frontier):
+
+    def __init__(self):
+        super().__init__()
+        self.queue = PriorityQueue()
+
+    def __len__(self) -> int:
+        return self.queue.qsize()
+
+    def push(self, node: Node) -> None:
+        self.best[node] = node
+        self.queue.put(node)
+
+    def pop(self) -> Node:
+        if self.queue.empty():
+            return None
+        return self.queue.get()
+
+
+# Expansions per second of a_star_search with the heap frontier and with the PriorityQueue one, on the room sizes of
+# a planning configuration (CONFIG_PLANNING in experiment_config.py). The rooms are symbolic and seeded, so both
+# frontiers search the same layouts.
+def benchmark_frontier(
+    config: dict,
+    n_golds: int = None,
+    time_penalty: float = None,
+    allowed_moves_function: Any = ALLOWED_SIMPLE_MOVES,
+    env_factory: Callable[..., Any] = SymbolicGoldRoom,
+    seed: int = 0
+) -> List[dict]:
+    n_golds = max(config['n_golds']) if n_golds == None else n_golds
+    time_penalty = config['time_penalties'][0] if time_penalty == None else time_penalty
+    results = []
+    for width, height in zip(config['widths'], config['heights']):
+        env = env_factory(
+            width=width, height=height, n_golds=min(n_golds, width * height - 2), gold_score=config['gold_scores'][0],
+            stair_score=config['stair_scores'][0], time_penalty=time_penalty, max_episode_steps=config['max_steps'],
+            seed=stream_seed(seed, width, height)
+        )
+        result = {'width': width, 'height': height}
+        for name, make_frontier in [('priority_queue', PriorityQueueFrontier), ('heap', Frontier)]:
+            start = time.perf_counter()
+            plan, expanded_nodes = a_star_search(env=env, allowed_moves_function=allowed_moves_function, frontier=make_frontier())
+            elapsed = time.perf_counter() - start
+            result[f'{name}_expanded_nodes'] = expanded_nodes
+            result[f'{name}_expansions_per_s'] = expanded_nodes / elapsed
+            result[f'{name}_score'] = plan.stats(env=env)['score']
+        results.append(result)
+    return results
+
+
+# Expanded nodes of a_star_search with state_heuristic and with the PatternDatabaseHeuristic of each room, on the grid
+# of a planning configuration (CONFIG_PLANNING in experiment_config.py): every room size, number of golds and time
+# penalty, with seeded symbolic rooms. Both heuristics are admissible, so the scores must be the same.
+def benchmark_heuristics(
+    config: dict,
+    allowed_moves_function: Any = ALLOWED_SIMPLE_MOVES,
+    pattern_size: int = 3,
+    env_factory: Callable[..., Any] = SymbolicGoldRoom,
+    seed: int = 0
+) -> List[dict]:
+    results = []
+    for width, height in zip(config['widths'], config['heights']):
+        for n_golds in config['n_golds']:
+            for time_penalty in config['time_penalties']:
+                env = env_factory(
+                    width=width, height=height, n_golds=min(n_golds, width * height - 2), gold_score=config['gold_scores'][0],
+                    stair_score=config['stair_scores'][0], time_penalty=time_penalty, max_episode_steps=config['max_steps'],
+                    seed=stream_seed(seed, width, height, n_golds)
+                )
+                result = {'width': width, 'height': height, 'n_golds': n_golds, 'time_penalty': time_penalty}
+                start = time.perf_counter()
+                plan, result['default_expanded_nodes'] = a_star_search(env=env, allowed_moves_function=allowed_moves_function)
+                result['default_seconds'] = time.perf_counter() - start
+                default_score = plan.stats(env=env)['score']
+
+                start = time.perf_counter()
+                h = PatternDatabaseHeuristic(env=env, allowed_moves_function=allowed_moves_function, pattern_size=pattern_size)
+                result['pdb_build_seconds'] = time.perf_counter() - start
+                plan, result['pdb_expanded_nodes'] = a_star_search(env=env, h=h, allowed_moves_function=allowed_moves_function)
+                result['pdb_seconds'] = time.perf_counter() - start
+                result['score'] = plan.stats(env=env)['score']
+                if abs(result['score'] - default_score) > 1e-6:
+                    raise RuntimeError(f'The pattern database plan scores {result["score"]}, the optimal one {default_score}')
+                results.append(result)
+    return results
+
+
+# Expanded nodes and seconds of a_star_search with the simple moves and with the jump point ones, on large open rooms
+# (seeded symbolic rooms of size x size). The jump points only prune equivalent paths, so the scores must be the same.
+def benchmark_jump_points(
+    sizes: List[int] = [50, 60, 80],
+    n_golds: int = 5,
+    gold_score: float = 100,
+    time_penalty: float = -1,
+    env_factory: Callable[..., Any] = SymbolicGoldRoom,
+    seed: int = 0
+) -> List[dict]:
+    results = []
+    for size in sizes:
+        env = env_factory(
+            width=size, height=size, n_golds=n_golds, gold_score=gold_score, stair_score=0, time_penalty=time_penalty,
+            max_episode_steps=100 * size, seed=stream_seed(seed, size, size)
+        )
+        result = {'size': size}
+        for name, allowed_moves_function in [('simple', ALLOWED_SIMPLE_MOVES), ('jump_point', ALLOWED_JUMP_POINT_MOVES)]:
+            start = time.perf_counter()
+            plan, result[f'{name}_expanded_nodes'] = a_star_search(env=env, allowed_moves_function=allowed_moves_function)
+            result[f'{name}_seconds'] = time.perf_counter() - start
+            result[f'{name}_score'] = plan.stats(env=env)['score']
+        if abs(result['simple_score'] - result['jump_point_score']) > 1e-6:
+            raise RuntimeError(f'The jump point plan scores {result["jump_point_score"]}, the optimal one {result["simple_score"]}')
+        results.append(result)
+    return results
+
+
+# Per-step replanning latency in a room with moving leprechauns, following the plan of an IncrementalPlanner: the
+# incremental planner repairs its distance fields, a planner built again at every step computes them from scratch, and
+# a_star_search restarts on a room with the current layout and the leprechauns as cells to avoid. The three plans must
+# have the same value.
+def benchmark_replanning(
+    width: int = 20,
+    height: int = 20,
+    n_golds: int = 5,
+    n_leps: int = 4,
+    gold_score: float = 100,
+    time_penalty: float = -1,
+    max_steps: int = 200,
+    seed: int = 0
+) -> dict:
+    env = SymbolicGoldRoom(
+        width=width, height=height, n_golds=n_golds, n_leps=n_leps, gold_score=gold_score, stair_score=0,
+        time_penalty=time_penalty, max_episode_steps=max_steps, leprechaun_model=RandomLeprechaunModel(), theft_prob=0.0,
+        seed=stream_seed(seed, width, height, n_golds, n_leps)
+    )
+    state, _ = env.myreset()
+    planner = IncrementalPlanner(env=env)
+    times = {'incremental': [], 'from_scratch': [], 'a_star_restart': []}
+    updates = []
+    done = False
+    while not done:
+        start = time.perf_counter()
+        plan = planner.plan(state=state)
+        times['incremental'].append(time.perf_counter() - start)
+        updates.append(planner.n_updates)
+
+        start = time.perf_counter()
+        scratch_plan = IncrementalPlanner(env=env).plan(state=state)
+        times['from_scratch'].append(time.perf_counter() - start)
+
+        room = env.copy(agent_coord=state['agent_coord'], gold_coords=list(state['gold_coords']), leprechaun_coords=[], n_golds=0, n_leps=0)
+        start = time.perf_counter()
+        a_star_plan, _ = a_star_search(env=room, allowed_moves_function=AllowedSimpleMovesFunction(to_avoid=list(state['leprechaun_coords'])))
+        times['a_star_restart'].append(time.perf_counter() - start)
+
+        if plan['action'] == None:
+            break
+        a_star_score = a_star_plan.stats(env=room)['score']
+        if abs(plan['value'] - scratch_plan['value']) > 1e-6 or abs(plan['value'] - a_star_score) > 1e-3:
+            raise RuntimeError(f'The incremental plan is worth {plan["value"]}, the other ones {scratch_plan["value"]} and {a_star_score}')
+        state, _, done = env.mystep(action=plan['action'])
+
+    result = {'steps': len(updates), 'mean_updates_per_step': float(np.mean(updates))}
+    for name, values in times.items():
+        result[f'{name}_ms_per_step'] = float(np.mean(values)) * 1e3
+    return result
+
+
+# Seconds of hda_star_search with pools of worker_counts processes against a_star_search, on large rooms with many
+# golds. The pools are started (and warmed up on the first room) before timing. The speedups are relative to a_star
+# and to the pool with one worker; they are only meaningful with at least as many cores as workers.
+def benchmark_parallel(
+    sizes: List[int] = [20, 30],
+    n_golds: int = 8,
+    worker_counts: List[int] = [1, 2, 4, 8],
+    gold_score: float = 100,
+    time_penalty: float = -1,
+    allowed_moves_function: Any = ALLOWED_SIMPLE_MOVES,
+    seed: int = 0
+) -> List[dict]:
+    envs = [
+        SymbolicGoldRoom(
+            width=size, height=size, n_golds=n_golds, gold_score=gold_score, stair_score=0, time_penalty=time_penalty,
+            max_episode_steps=100 * size, seed=stream_seed(seed, size, size, n_golds)
+        )
+        for size in sizes
+    ]
+    pools = {n_workers: HdaStarPool(n_workers=n_workers) for n_workers in worker_counts}
+    try:
+        for pool in pools.values():
+            pool.search(env=envs[0], allowed_moves_function=allowed_moves_function)
+        results = []
+        for size, env in zip(sizes, envs):
+            start = time.perf_counter()
+            plan, expanded_nodes = a_star_search(env=env, allowed_moves_function=allowed_moves_function)
+            a_star_seconds = time.perf_counter() - start
+            score = plan.stats(env=env)['score']
+            result = {'size': size, 'n_golds': n_golds, 'a_star_seconds': a_star_seconds, 'a_star_expanded_nodes': expanded_nodes}
+            for n_workers, pool in pools.items():
+                start = time.perf_counter()
+                plan, expanded_nodes = pool.search(env=env, allowed_moves_function=allowed_moves_function)
+                seconds = time.perf_counter() - start
+                if abs(plan.stats(env=env)['score'] - score) > 1e-6:
+                    raise RuntimeError(f'The plan of {n_workers} workers scores {plan.stats(env=env)["score"]}, the optimal one {score}')
+                result[f'hda_{n_workers}_seconds'] = seconds
+                result[f'hda_{n_workers}_expanded_nodes'] = expanded_nodes
+                result[f'hda_{n_workers}_speedup'] = a_star_seconds / seconds
+                result[f'hda_{n_workers}_scaling'] = result[f'hda_{worker_counts[0]}_seconds'] / seconds
+            results.append(result)
+        return results
+    finally:
+        for pool in pools.values():
+            pool.close()
+
+
+# Seconds of a design_plan sweep of config against plan_many with pools of worker_counts processes, on the layouts of
+# config_layouts (symbolic rooms by default). The sweep calls every planner on the room of each layout with its own
+# parameters, as design_plan does. SUBPLAN_CACHE is emptied before each run, and the results must be the same.
+def benchmark_plan_many(
+    config: dict = CONFIG_PLANNING,
+    worker_counts: List[int] = [1, 2],
+    env_factory: Callable[..., Any] = SymbolicGoldRoom,
+    seed: int = 0
+) -> dict:
+    layouts = [layout for _, layout in config_layouts(config=config, env_factory=env_factory, seed=seed)]
+    planners = config_planners(config=config)
+
+    SUBPLAN_CACHE.clear()
+    start = time.perf_counter()
+    sweep = []
+    for layout in layouts:
+        room = layout_room(layout=layout)
+        for algorithm, kwargs in planners:
+            plan, expanded_nodes = algorithm(env=room, **kwargs)
+            sweep.append(plan_results(plan_stats=plan.stats(env=room), expanded_nodes=expanded_nodes))
+    result = {'envs': len(layouts), 'plans': len(sweep), 'sweep_seconds': time.perf_counter() - start}
+
+    for n_workers in worker_counts:
+        SUBPLAN_CACHE.clear()
+        start = time.perf_counter()
+        batch = plan_many(envs=layouts, planners=planners, n_workers=n_workers)
+        seconds = time.perf_counter() - start
+        if [record['results'] for record in batch['plans']] != sweep:
+            raise RuntimeError(f'The results of plan_many with {n_workers} workers differ from those of the sweep')
+        result[f'batch_{n_workers}_seconds'] = seconds
+        result[f'batch_{n_workers}_speedup'] = result['sweep_seconds'] / seconds
+    return result
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from symbolic_env import SymbolicGoldRoom, StaticLeprechaunModel
+
+
+# States, rewards (and done) of an episode played with a fixed sequence of actions, with the arrays as lists so that
+# the episodes can be compared
+def play_episode(env, actions: list) -> list:
+    steps = [env.myreset()]
+    for action in actions:
+        steps.append(env.mystep(action=action))
+    as_list = lambda value: value.tolist() if isinstance(value, np.ndarray) else value
+    return [({key: as_list(value) for key, value in step[0].items()},) + tuple(step[1:]) for step in steps]
+
+
+@pytest.fixture
+def play():
+    return play_episode
+
+
+# Factory of the small symbolic rooms of the tests, keyword arguments override the defaults
+@pytest.fixture
+def room():
+    def make_room(**kwargs) -> SymbolicGoldRoom:
+        params = {'width': 4, 'height': 3, 'gold_score': 100, 'stair_score': 10, 'time_penalty': -1, 'max_episode_steps': 50, 'leprechaun_model': StaticLeprechaunModel()}
+        params.update(kwargs)
+        return SymbolicGoldRoom(**params)
+    return make_room
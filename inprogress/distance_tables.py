@@ -0,0 +1,225 @@
+import heapq
+import math
+import os
+import pickle
+from typing import Dict, Iterable, List, Tuple
+from layout import LevelCache
+from utils import move_to_action, DIAGONAL_ACTIONS, N_ARR, E_ARR, S_ARR, W_ARR, NW_ARR, NE_ARR, SW_ARR, SE_ARR
+
+SQRT2 = math.sqrt(2)
+
+# same order of utils.allowed_moves
+GRID_MOVES = [tuple(int(c) for c in move) for move in [W_ARR, E_ARR, S_ARR, N_ARR, NW_ARR, NE_ARR, SW_ARR, SE_ARR]]
+MOVE_ACTIONS = {move: move_to_action(move) for move in GRID_MOVES}
+
+
+# Bounded LRU cache of the shortest path trees of PathTable (all the subplans from one source), keyed by subplan_key.
+# It outlives the searches, so the subplans of an env are shared by every planner and parameter variant run on it, and
+# it can be saved to disk between sweep runs. A tree holds a parent for every cell of the room it reaches, about 200
+# bytes per cell, so besides maxsize trees the cache holds at most max_cells cells in total (least recently used trees
+# evicted first): the default is about 100 MB, or 550 trees of a 30x30 room.
+class SubplanCache(LevelCache):
+
+    def __init__(self, maxsize: int = 100000, max_cells: int = 500000):
+        if max_cells < 0:
+            raise RuntimeError(f'Invalid argument max_cells = {max_cells}')
+        self.max_cells = max_cells
+        self.n_cells = 0
+        super().__init__(maxsize=maxsize)
+
+    # entries are (parents, number of cells expanded)
+    def put(self, key: tuple, tree: tuple) -> None:
+        if key in self.entries:
+            self.n_cells -= len(self.entries[key][0])
+        self.n_cells += len(tree[0])
+        super().put(key, tree)
+
+    def clear(self) -> None:
+        super().clear()
+        self.n_cells = 0
+
+    def _evict(self) -> None:
+        while len(self.entries) > self.maxsize or self.n_cells > self.max_cells:
+            _, tree = self.entries.popitem(last=False)
+            self.n_cells -= len(tree[0])
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats['cells'] = self.n_cells
+        stats['max_cells'] = self.max_cells
+        return stats
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            pickle.dump(list(self.entries.items()), f)
+
+    # Adds the entries saved in path (if it exists) to the cache
+    def load(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            entries = pickle.load(f)
+        for key, entry in entries:
+            self.put(key, entry)
+
+
+# The golds are part of the key because they break the ties between paths of the same length
+def subplan_key(
+    width: int,
+    height: int,
+    source: Tuple[int, int],
+    to_avoid: List[Tuple[int, int]],
+    gold_coords: List[Tuple[int, int]]
+) -> tuple:
+    normalize = lambda coord: (int(coord[0]), int(coord[1]))
+    return (
+        int(width),
+        int(height),
+        normalize(source),
+        tuple(sorted([normalize(coord) for coord in to_avoid])),
+        tuple(sorted([normalize(coord) for coord in gold_coords]))
+    )
+
+
+SUBPLAN_CACHE = SubplanCache()
+
+
+# Shortest paths between the points of interest (agent, golds, stair) of a room, used for the composite moves. Paths
+# are computed with a Dijkstra over the grid, once per source, with the euclidean length of the moves as cost; among
+# paths of the same length the one passing over more golds is kept. The cells to avoid (the stair) can end a path but
+# are never crossed. Each entry also records the golds the path passes over, endpoints included.
+class PathTable:
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        gold_coords: List[Tuple[int, int]] = [],
+        to_avoid: List[Tuple[int, int]] = [],
+        cache: SubplanCache = None
+    ):
+        self.width = width
+        self.height = height
+        self.gold_coords = set(tuple(coord) for coord in gold_coords)
+        self.to_avoid = set(tuple(coord) for coord in to_avoid)
+        self.cache = cache
+        self.trees: Dict[Tuple[int, int], dict] = {}
+        self.entries: Dict[Tuple[Tuple[int, int], Tuple[int, int]], dict] = {}
+        self.n_expanded = 0
+
+    # Shortest path tree from source: for each reached cell, the previous cell and the action taken from it. Lengths
+    # are kept as (straight moves, diagonal moves) so that equal paths have exactly the same cost.
+    def _tree(self, source: Tuple[int, int]) -> Tuple[dict, int]:
+        parents = {source: None}
+        counts = {source: (0, 0, -(source in self.gold_coords))}
+        queue = [(self._cost(counts[source]), 0, source)]
+        counter = 1
+        closed = set()
+        while queue != []:
+            _, _, cell = heapq.heappop(queue)
+            if cell in closed:
+                continue
+            closed.add(cell)
+            if cell in self.to_avoid and cell != source:
+                continue
+            straight, diagonal, golds = counts[cell]
+            for move in GRID_MOVES:
+                x, y = cell[0] + move[0], cell[1] + move[1]
+                if not (0 <= x < self.width and 0 <= y < self.height) or (x, y) in closed:
+                    continue
+                golds_next = golds - ((x, y) in self.gold_coords)
+                count = (straight + 1, diagonal, golds_next) if move[0] == 0 or move[1] == 0 else (straight, diagonal + 1, golds_next)
+                cost = self._cost(count)
+                if (x, y) not in counts or cost < self._cost(counts[(x, y)]):
+                    counts[(x, y)] = count
+                    parents[(x, y)] = (cell, MOVE_ACTIONS[move])
+                    heapq.heappush(queue, (cost, counter, (x, y)))
+                    counter += 1
+        return parents, len(closed)
+
+    # (length, -golds passed over), compared lexicographically
+    def _cost(self, count: Tuple[int, int, int]) -> Tuple[float, int]:
+        return count[0] + count[1] * SQRT2, count[2]
+
+    # Shortest path tree of source and the number of cells its Dijkstra expands, from the cache if possible
+    def _cached_tree(self, source: Tuple[int, int]) -> Tuple[dict, int]:
+        if self.cache == None:
+            return self._tree(source)
+        key = subplan_key(width=self.width, height=self.height, source=source, to_avoid=self.to_avoid, gold_coords=self.gold_coords)
+        tree = self.cache.get(key)
+        if tree == None:
+            tree = self._tree(source)
+            self.cache.put(key, tree)
+        return tree
+
+    # Path from source to target: {'actions', 'path', 'golds', 'length'}, None if the target cannot be reached.
+    # Also returns the number of cells expanded to build the tree of source the first time it is used by this table
+    # (0 afterwards). A tree taken from the cache counts as computed, so the expansions reported by the planners do not
+    # depend on the state of the cache.
+    def lookup(self, source: Tuple[int, int], target: Tuple[int, int]) -> Tuple[dict, int]:
+        source, target = tuple(source), tuple(target)
+        key = (source, target)
+        if key in self.entries:
+            return self.entries[key], 0
+
+        n_expanded = 0
+        if source not in self.trees:
+            self.trees[source], n_expanded = self._cached_tree(source)
+            self.n_expanded += n_expanded
+        parents = self.trees[source]
+
+        if target not in parents:
+            entry = None
+        else:
+            actions = []
+            path = [target]
+            cell = target
+            while parents[cell] != None:
+                cell, action = parents[cell]
+                actions.insert(0, action)
+                path.insert(0, cell)
+            entry = {
+                'actions': actions,
+                'path': path,
+                'golds': [cell for cell in path if cell in self.gold_coords],
+                'length': sum([SQRT2 if action in DIAGONAL_ACTIONS else 1.0 for action in actions])
+            }
+        self.entries[key] = entry
+        return entry, n_expanded
+
+
+# Reverse Dijkstra from target: the length of the shortest path from every cell (indexed as y * width + x) to target,
+# math.inf if there is none. Moves are those of utils.allowed_moves, the cells in to_avoid are never entered and the
+# cells in blocked (the stair, which ends the episode) can only be the target.
+def distance_field(
+    width: int,
+    height: int,
+    target: Tuple[int, int],
+    to_avoid: Iterable[Tuple[int, int]] = [],
+    blocked: Iterable[Tuple[int, int]] = []
+) -> List[float]:
+    target = (int(target[0]), int(target[1]))
+    to_avoid = set(tuple(coord) for coord in to_avoid)
+    blocked = set(tuple(coord) for coord in blocked)
+    dists = [math.inf] * (width * height)
+    if target in to_avoid:
+        return dists
+    dists[target[1] * width + target[0]] = 0.0
+    queue = [(0.0, target)]
+    while queue != []:
+        dist, cell = heapq.heappop(queue)
+        if dist > dists[cell[1] * width + cell[0]]:
+            continue
+        # paths cannot go through a blocked cell
+        if cell in blocked and cell != target:
+            continue
+        for move in GRID_MOVES:
+            x, y = cell[0] - move[0], cell[1] - move[1]
+            if not (0 <= x < width and 0 <= y < height) or (x, y) in to_avoid:
+                continue
+            next_dist = dist + (1.0 if move[0] == 0 or move[1] == 0 else SQRT2)
+            if next_dist < dists[y * width + x]:
+                dists[y * width + x] = next_dist
+                heapq.heappush(queue, (next_dist, (x, y)))
+    return dists
@@ -0,0 +1,76 @@
+from typing import Any, Callable, Dict, List, Tuple
+from vector_env import make_nle_gold_room
+
+# arguments of relayout, the same of the environment constructor
+LAYOUT_ARGUMENTS = (
+    'agent_coord', 'stair_coord', 'gold_coords', 'leprechaun_coords', 'n_golds', 'n_leps', 'gold_score', 'stair_score',
+    'time_penalty', 'max_episode_steps', 'seed'
+)
+
+
+# Pool of gold room instances keyed by (width, height, observation_keys, observation_mode) and by the other constructor
+# options (level_cache, leprechaun models...), which relayout cannot change. A free instance with the right key is
+# reused by loading the requested layout through relayout(), so getting an environment costs a reset instead of a new
+# des file, reward manager and NLE boot.
+class EnvPool:
+
+    def __init__(self, env_factory: Callable[..., Any] = make_nle_gold_room):
+        self.env_factory = env_factory
+        self.free: Dict[tuple, List[Any]] = {}
+        self.keys: Dict[int, tuple] = {}
+        self.last: Dict[tuple, Any] = {}
+        self.n_created = 0
+        self.n_relayouts = 0
+
+    # The options (constructor arguments other than the layout ones) must be hashable
+    def key(self, width: int, height: int, observation_keys: Tuple[str, ...] = None, observation_mode: str = None, **kwargs) -> tuple:
+        options = tuple(sorted([(name, value) for name, value in kwargs.items() if name not in LAYOUT_ARGUMENTS]))
+        return (width, height, None if observation_keys == None else tuple(observation_keys), observation_mode, options)
+
+    # Layout arguments (LAYOUT_ARGUMENTS) go to relayout when an instance is reused, the other ones select the instance
+    def acquire(self, width: int = 2, height: int = 2, observation_keys: Tuple[str, ...] = None, observation_mode: str = None, **kwargs) -> Any:
+        key = self.key(width=width, height=height, observation_keys=observation_keys, observation_mode=observation_mode, **kwargs)
+        if self.free.get(key, []) != []:
+            env = self.free[key].pop()
+            env.relayout(**{name: value for name, value in kwargs.items() if name in LAYOUT_ARGUMENTS})
+            self.n_relayouts += 1
+        else:
+            if observation_keys != None:
+                kwargs['observation_keys'] = observation_keys
+            if observation_mode != None:
+                kwargs['observation_mode'] = observation_mode
+            env = self.env_factory(width=width, height=height, **kwargs)
+            self.keys[id(env)] = key
+            self.n_created += 1
+        return env
+
+    def release(self, env: Any) -> None:
+        key = self.keys[id(env)]
+        if env not in self.free.setdefault(key, []):
+            self.free[key].append(env)
+
+    # Drop-in replacement of the env_factory of run_episodes/design_plan: the environment returned by the previous
+    # call with the same key is considered finished and gets reused.
+    def make(self, width: int = 2, height: int = 2, observation_keys: Tuple[str, ...] = None, observation_mode: str = None, **kwargs) -> Any:
+        key = self.key(width=width, height=height, observation_keys=observation_keys, observation_mode=observation_mode, **kwargs)
+        if key in self.last:
+            self.release(self.last.pop(key))
+        env = self.acquire(width=width, height=height, observation_keys=observation_keys, observation_mode=observation_mode, **kwargs)
+        self.last[key] = env
+        return env
+
+    def stats(self) -> dict:
+        return {
+            'created': self.n_created,
+            'relayouts': self.n_relayouts,
+            'free': sum([len(envs) for envs in self.free.values()])
+        }
+
+    def close(self) -> None:
+        envs = {id(env): env for env in [env for envs in self.free.values() for env in envs] + list(self.last.values())}
+        for env in envs.values():
+            if hasattr(env, 'close'):
+                env.close()
+        self.free = {}
+        self.keys = {}
+        self.last = {}
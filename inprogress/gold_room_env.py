@@ -1,6 +1,6 @@
 from minihack import LevelGenerator, RewardManager, MiniHack
 from minihack.envs import register
-import random
+import copy
 import numpy as np
 from nle import nethack
 import enum
@@ -8,7 +8,8 @@ import warnings
 from nle.nethack import Command, CompassCardinalDirection, CompassIntercardinalDirection
 import gym
 from typing import Any, List, Tuple
-from utils import action_to_move, DIAGONAL_ACTIONS
+from utils import action_to_move, state_pixel, DIAGONAL_ACTIONS
+from layout import check_layout_arguments, sample_layout, layout_key, LevelCache
 
 Actions = enum.IntEnum(
     "Actions",
@@ -26,6 +27,58 @@ LEPRECHAUN_CHAR = 108
 AGENT_CHAR = 64
 STAIR_CHAR = 62
 
+# symbolic: no pixels at all, on_demand: glyphs are kept and turned into pixels only when asked, full: pixels every step
+OBSERVATION_MODES = {
+    'symbolic': ('blstats', 'chars', 'message'),
+    'on_demand': ('blstats', 'chars', 'glyphs', 'message'),
+    'full': ('blstats', 'chars', 'pixel', 'message')
+}
+OBSERVATION_KEYS = OBSERVATION_MODES['full']
+
+PURSE_MESSAGE = b'Your purse feels lighter'
+GOLD_MESSAGE = b'$ - a gold piece'
+
+# lookup table of the chars of the entities we track, used to find all of them with a single pass over the map
+ENTITY_CHARS = np.zeros(256, dtype=bool)
+ENTITY_CHARS[[AGENT_CHAR, GOLD_CHAR, LEPRECHAUN_CHAR]] = True
+
+MOVE_LENGTHS = {action: float(np.linalg.norm(action_to_move(action))) for action in range(len(ACTIONS))}
+
+# attributes that describe the episode state on top of the NLE game
+SNAPSHOT_FIELDS = ['collected_gold', 'instant', 'agent_coord', 'gold_coords', 'leprechaun_coords', 'matrix_map', 'pixel', 'glyphs', 'message']
+
+# levels generated by every MiniHackGoldRoom of the process, shared across algorithms and sweep cells
+LEVEL_CACHE = LevelCache(maxsize=1024)
+
+# The room is drawn in the same place of the chars array for the whole episode: the crop window is the bounding box
+# of the non-empty chars.
+def crop_window(chars: np.ndarray) -> Tuple[slice, slice]:
+    rows = np.flatnonzero(~np.all(chars == 32, axis=1))
+    cols = np.flatnonzero(~np.all(chars == 32, axis=0))
+    return slice(int(rows[0]), int(rows[-1]) + 1), slice(int(cols[0]), int(cols[-1]) + 1)
+
+
+# Coordinates of agent (None if hidden), golds and leprechauns of a cropped map
+def parse_entities(env_map: np.ndarray, height: int) -> Tuple[Tuple[int, int], List[Tuple[int, int]], List[Tuple[int, int]]]:
+    rows, cols = np.nonzero(ENTITY_CHARS[env_map])
+    agent_coord = None
+    gold_coords = []
+    leprechaun_coords = []
+    for row, col, char in zip(rows.tolist(), cols.tolist(), env_map[rows, cols].tolist()):
+        coord = (col, height - row - 1)
+        if char == GOLD_CHAR:
+            gold_coords.append(coord)
+        elif char == LEPRECHAUN_CHAR:
+            leprechaun_coords.append(coord)
+        elif agent_coord == None:
+            agent_coord = coord
+    return agent_coord, gold_coords, leprechaun_coords
+
+
+def decode_message(message: np.ndarray) -> str:
+    return message.tobytes().decode('utf-8').rstrip('\x00')
+
+
 # this is the class that we use to create our custom environment, we can customize the number of gold, leprechauns, the size
 # of the map. 
 # We can also set the rewards and penalties for each of the action we are able to do.
@@ -46,119 +99,23 @@ class MiniHackGoldRoom(MiniHack):
         leprechaun_coords: List[Tuple[int, int]] = None,
         n_golds: int = 0,
         n_leps: int = 0,
-        max_episode_steps: int = 100
+        max_episode_steps: int = 100,
+        observation_mode: str = 'full',
+        observation_keys: Tuple[str, ...] = None,
+        level_cache: LevelCache = LEVEL_CACHE,
+        seed: int = None
     ):
         # Argument checks ---------------------------------------------------------------------
 
-        # Type checks for each variable of the class
-
-        if not isinstance(width, int):
-            raise TypeError(f'width parameter must be of type int, not {type(width)}')
-        
-        if not isinstance(height, int):
-            raise TypeError(f'height parameter must be of type int, not {type(height)}')
-        
-        if not isinstance(gold_score, (int, float)):
-            raise TypeError(f'gold_score parameter must be of type int or float, not {type(gold_score)}')
-        
-        if not isinstance(stair_score, (int, float)):
-            raise TypeError(f'stair_score parameter must be of type int or float, not {type(stair_score)}')
-
-        if not isinstance(time_penalty, (int, float)):
-            raise TypeError(f'time_penalty parameter must be of type int or float, not {type(time_penalty)}')
-
-        if not isinstance(agent_coord, Tuple) and agent_coord != None:
-            raise TypeError(f'agent_coord parameter must be of type Tuple, not {type(agent_coord)}')
-        
-        if not isinstance(stair_coord, Tuple) and stair_coord != None:
-            raise TypeError(f'stair_coord parameter must be of type Tuple, not {type(stair_coord)}')
-        
-        if not isinstance(gold_coords, List) and gold_coords != None:
-            raise TypeError(f'gold_coords parameter must be of type List, not {type(gold_coords)}')
-        
-        if gold_coords != None:
-            for item in gold_coords:
-                if not isinstance(item, Tuple):
-                    raise TypeError(f'gold_coords parameter must be of type List[Tuple], not {type(gold_coords)}')
-
-            if not isinstance(leprechaun_coords, List) and leprechaun_coords != None:
-                raise TypeError(f'leprechaun_coords parameter must be of type List, not {type(leprechaun_coords)}')
-
-        if leprechaun_coords != None:
-            for item in leprechaun_coords:
-                if not isinstance(item, Tuple):
-                    raise TypeError(f'leprechaun_coords parameter must be of type List[Tuple], not {type(leprechaun_coords)}')
-
-        if not isinstance(n_golds, int):
-            raise TypeError(f'n_golds parameter must be of type int, not {type(n_golds)}')
-        
-        if not isinstance(n_leps, int):
-            raise TypeError(f'n_leps parameter must be of type int, not {type(n_leps)}')
-
-        # Value checks
-
-        if max_episode_steps < 0:
-            raise RuntimeError(f'Invalid argument max_episode_steps = {max_episode_steps}')
-
-        if width < 0:
-            raise RuntimeError(f'Invalid argument width = {w}')
-
-        if height < 0:
-            raise RuntimeError(f'Invalid argument height = {h}')
-
-        if n_golds < 0:
-            raise RuntimeError(f'Invalid argument n_stairs = {n_golds}')
-        elif n_golds > width * height:
-            raise RuntimeError(f'Too many golds ({n_golds}) for a {width}x{height} grid')
-
-        if n_leps < 0:
-            raise RuntimeError(f'Invalid argument n_stairs = {n_leps}')
-        elif n_leps > width * height - 2:
-            raise RuntimeError(f'Too many leprechauns ({n_leps}) for a {width}x{height} grid')
-        
-        if gold_score <= 0:
-            raise RuntimeError(f'Invalid argument gold_score = {gold_score} <= 0')
-        
-        if agent_coord != None:
-            x, y = agent_coord
-            if x not in range(width):
-                    raise RuntimeError(f'Agent coordinate out of bound [0, {width}): x = {x}')
-            if y not in range(height):
-                raise RuntimeError(f'Agent coordinate out of bound [0, {height}): y = {y}')
-            if agent_coord == stair_coord:
-                raise RuntimeError(f'Overlapping start and end coordinates')
-        
-        if stair_coord != None:
-            x, y = stair_coord
-            if x not in range(width):
-                    raise RuntimeError(f'Stair coordinate out of bound [0, {width}): x = {x}')
-            if y not in range(height):
-                raise RuntimeError(f'Stair coordinate out of bound [0, {height}): y = {y}')
-        
-        if gold_coords != None:
-            seen = set()
-            duplicate = False
-            for (x, y) in gold_coords:
-                if (x, y) in seen:
-                    duplicate = True
-                if x not in range(width):
-                    raise RuntimeError(f'Gold coordinate out of bound [0, {width}): x = {x}')
-                if y not in range(height):
-                    raise RuntimeError(f'Gold coordinate out of bound [0, {height}): y = {y}')
-                seen.add((x, y))
-            if duplicate:
-                warnings.warn(f'Multiple gold items in the same position: only one added', Warning)
-            if len(gold_coords) > width * height:
-                raise RuntimeError(f'Too many golds ({len(gold_coords)}) for a {width}x{height} grid')
-        
-        if leprechaun_coords != None:
-            for (x, y) in leprechaun_coords:
-                if x not in range(width):
-                    raise RuntimeError(f'Leprechaun coordinate out of bound [0, {width}): x = {x}')
-                if y not in range(height):
-                    raise RuntimeError(f'Leprechaun coordinate out of bound [0, {height}): y = {y}')
-            if len(leprechaun_coords) > width * height - 2:
-                raise RuntimeError(f'Too many leprechauns ({len(leprechaun_coords)}) for a {width}x{height} grid')
+        check_layout_arguments(
+            width=width, height=height, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty,
+            agent_coord=agent_coord, stair_coord=stair_coord, gold_coords=gold_coords,
+            leprechaun_coords=leprechaun_coords, n_golds=n_golds, n_leps=n_leps, max_episode_steps=max_episode_steps
+        )
+        if observation_mode not in OBSERVATION_MODES:
+            raise ValueError(f'observation_mode parameter must be one of {list(OBSERVATION_MODES)}, not {observation_mode}')
+        if observation_keys == None:
+            observation_keys = OBSERVATION_MODES[observation_mode]
 
         # Set class variables -----------------------------------------------------------------
 
@@ -170,40 +127,75 @@ class MiniHackGoldRoom(MiniHack):
         self.stair_score = stair_score
         self.time_penalty = time_penalty
         self.max_episode_steps = max_episode_steps
+        self.observation_mode = observation_mode
+        self.observation_keys = tuple(observation_keys)
+        self.level_cache = level_cache
+        # layout sampling and the seeds of the NLE episodes are drawn from this stream only; the policies derive their
+        # own stream from the seed sequence (see utils.policy_rng)
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
         
-        coords = [(x, y) for x in range(width) for y in range(height)]
-
-        if gold_coords == None:
-            self.gold_coords = random.sample(population=coords, k=n_golds)
-        else:
-            self.gold_coords = gold_coords
-
-        if leprechaun_coords == None:
-            self.leprechaun_coords = random.sample(population=coords, k=n_leps)
-        else:
-            self.leprechaun_coords = leprechaun_coords
-        
-        if agent_coord == None:
-            if stair_coord == None:
-                self.agent_coord, self.stair_coord = tuple(random.sample(population=coords, k=2))
-            else:
-                self.stair_coord = stair_coord
-                coords.remove(self.stair_coord)
-                self.agent_coord = random.sample(population=coords, k=1)[0]
-        else:
-            self.agent_coord = agent_coord
-            if stair_coord == None:
-                coords.remove(self.agent_coord)
-                self.stair_coord = random.sample(population=coords, k=1)[0]
-            else:
-                self.stair_coord = stair_coord
+        self.agent_coord, self.stair_coord, self.gold_coords, self.leprechaun_coords = sample_layout(
+            width=width, height=height, agent_coord=agent_coord, stair_coord=stair_coord,
+            gold_coords=gold_coords, leprechaun_coords=leprechaun_coords, n_golds=n_golds, n_leps=n_leps,
+            rng=self.rng
+        )
         
         self.matrix_map = None
         self.pixel = None
+        self.glyphs = None
         self.message = None
+        self.observation = None
+        self.episode_seeds = None
+        # actions taken since myreset, replayed by restore (self.actions is the action table of NLE)
+        self.episode_actions = []
+        self.crop = None
+        self.parsed = None
+
+        # Generate (or fetch from the cache) the des file and the reward manager -------------
 
-        # Generate the des file using the level generator -------------------------------------
+        level = self._load_level()
+        des_file = level['des_file']
+        reward_manager = self._make_reward_manager(level=level)
+
+        # Call the constructor of the superclass ----------------------------------------------
+
+        super().__init__(
+            *args, des_file=des_file, reward_manager=reward_manager,
+            actions=ACTIONS, allow_all_yn_questions=False, allow_all_modes=False,
+            character='rog-hum-cha-mal', max_episode_steps=max_episode_steps,
+            observation_keys=observation_keys
+        )
 
+    register(
+        id="MiniHack-MyTask-Custom-v0",
+        entry_point="gold_room_env:MiniHackGoldRoom",
+    )
+
+    # Copy method ----------------------------------------------------------------------------------------------------
+    # Keyword arguments override the corresponding attribute of the copied environment.
+    def copy(self, **kwargs):
+        params = {
+            'width': self.width,
+            'height': self.height,
+            'max_episode_steps': self.max_episode_steps,
+            'gold_score': self.gold_score,
+            'stair_score': self.stair_score,
+            'time_penalty': self.time_penalty,
+            'agent_coord': self.agent_coord,
+            'stair_coord': self.stair_coord,
+            'gold_coords': self.gold_coords,
+            'leprechaun_coords': self.leprechaun_coords,
+            'observation_mode': self.observation_mode,
+            'observation_keys': self.observation_keys,
+            'level_cache': self.level_cache,
+            'seed': int(self.rng.integers(2**63))
+        }
+        params.update(kwargs)
+        return gym.make('MiniHack-MyTask-Custom-v0', **params)
+
+    # Des file of the current layout -----------------------------------------------------------------------------------
+    def _make_des_file(self) -> str:
         level_generator = LevelGenerator(w=self.width, h=self.height)
         level_generator.set_start_pos(coord=self._coords_to_idxs(self.agent_coord))
         level_generator.add_goal_pos(place=self._coords_to_idxs(self.stair_coord))
@@ -212,116 +204,250 @@ class MiniHackGoldRoom(MiniHack):
         for leprechaun_coord in self.leprechaun_coords:
             level_generator.add_monster(name='leprechaun', place=self._coords_to_idxs(leprechaun_coord), args=['awake', 'hostile'])
         
-        des_file = level_generator.get_des()
-
-        # Define the reward manager -----------------------------------------------------------
+        return level_generator.get_des()
 
+    # Level of the current layout, generated only if it is not in the level cache --------------------------------------
+    def _load_level(self) -> dict:
+        key = layout_key(
+            width=self.width, height=self.height, agent_coord=self.agent_coord, stair_coord=self.stair_coord,
+            gold_coords=self.gold_coords, leprechaun_coords=self.leprechaun_coords
+        )
+        self.level_key = key
+        level = None if self.level_cache == None else self.level_cache.get(key)
+        if level == None:
+            level = {
+                'des_file': self._make_des_file(),
+                'stair_event_coordinates': (int(self.stair_coord[0]), int(self.height - self.stair_coord[1] - 1))
+            }
+            if self.level_cache != None:
+                self.level_cache.put(key, level)
+        return level
+
+    # Reward manager of the current layout -----------------------------------------------------------------------------
+    def _make_reward_manager(self, level: dict) -> RewardManager:
         reward_manager = RewardManager()
 
         def my_reward_function(env: MiniHackGoldRoom, previous_observation: Any, action: int, current_observation: Any) -> float:
-            reward = env.time_penalty * np.linalg.norm(action_to_move(action))
+            # NLE also checks the end of the episode at reset, without an action: nothing to reward there
+            if action == None:
+                return 0.0
 
-            current_message = bytes(current_observation[env._original_observation_keys.index('message')]).decode('utf-8').rstrip('\x00')
+            reward = env.time_penalty * MOVE_LENGTHS[action]
 
-            current_map = current_observation[env._original_observation_keys.index('chars')]
-            non_empty_rows = ~np.all(current_map == 32, axis=1)
-            non_empty_cols = ~np.all(current_map == 32, axis=0)
-            current_map = current_map[non_empty_rows][:, non_empty_cols]
-
-            current_agent_coord = env.get_agent_coord(env_map=current_map)
+            # parsed once here and reused by mystep
+            env.parsed = env._parse_observation(
+                chars=current_observation[env._original_observation_keys.index('chars')],
+                message=current_observation[env._original_observation_keys.index('message')]
+            )
 
-            if 'Your purse feels lighter' in current_message:
+            if PURSE_MESSAGE in env.parsed['raw_message']:
                 reward -= env.collected_gold
 
-            if '$ - a gold piece' in current_message:
+            if GOLD_MESSAGE in env.parsed['raw_message']:
                 reward += env.gold_score
             
-            if current_agent_coord == env.stair_coord:
+            if env.parsed['agent_coord'] == env.stair_coord:
                 reward += env.stair_score
 
             return reward
         
         reward_manager.add_custom_reward_fn(my_reward_function)
         reward_manager.add_coordinate_event(
-            coordinates=(self.stair_coord[0], self.height - self.stair_coord[1] - 1),
+            coordinates=level['stair_event_coordinates'],
             reward=self.stair_score,
             repeatable=False,
             terminal_required=True,
             terminal_sufficient=True
         )
 
-        # Call the constructor of the superclass ----------------------------------------------
+        return reward_manager
 
-        super().__init__(
-            *args, des_file=des_file, reward_manager=reward_manager,
-            actions=ACTIONS, allow_all_yn_questions=False, allow_all_modes=False,
-            character='rog-hum-cha-mal', max_episode_steps=max_episode_steps,
-            observation_keys=('blstats', 'chars', 'pixel', 'message')
+    # Load a new layout in this instance -------------------------------------------------------------------------------
+    # The des file is recompiled into the running NLE and the reward manager is rebuilt for the new stair, so that the
+    # next myreset starts the new level without booting a new environment. The size of the room cannot change.
+    def relayout(
+        self,
+        agent_coord: Tuple[int, int] = None,
+        stair_coord: Tuple[int, int] = None,
+        gold_coords: List[Tuple[int, int]] = None,
+        leprechaun_coords: List[Tuple[int, int]] = None,
+        n_golds: int = 0,
+        n_leps: int = 0,
+        gold_score: float = None,
+        stair_score: float = None,
+        time_penalty: float = None,
+        max_episode_steps: int = None,
+        seed: int = None
+    ) -> None:
+        gold_score = self.gold_score if gold_score == None else gold_score
+        stair_score = self.stair_score if stair_score == None else stair_score
+        time_penalty = self.time_penalty if time_penalty == None else time_penalty
+        max_episode_steps = self.max_episode_steps if max_episode_steps == None else max_episode_steps
+
+        check_layout_arguments(
+            width=self.width, height=self.height, gold_score=gold_score, stair_score=stair_score,
+            time_penalty=time_penalty, agent_coord=agent_coord, stair_coord=stair_coord, gold_coords=gold_coords,
+            leprechaun_coords=leprechaun_coords, n_golds=n_golds, n_leps=n_leps, max_episode_steps=max_episode_steps
         )
 
-    register(
-        id="MiniHack-MyTask-Custom-v0",
-        entry_point="gold_room_env:MiniHackGoldRoom",
-    )
+        self.gold_score = gold_score
+        self.stair_score = stair_score
+        self.time_penalty = time_penalty
+        self.max_episode_steps = max_episode_steps
+        self._max_episode_steps = max_episode_steps
+        self.collected_gold = 0
+        self.instant = -1
+        if seed != None:
+            self.seed_sequence = np.random.SeedSequence(seed)
+            self.rng = np.random.default_rng(self.seed_sequence)
+
+        self.agent_coord, self.stair_coord, self.gold_coords, self.leprechaun_coords = sample_layout(
+            width=self.width, height=self.height, agent_coord=agent_coord, stair_coord=stair_coord,
+            gold_coords=gold_coords, leprechaun_coords=leprechaun_coords, n_golds=n_golds, n_leps=n_leps,
+            rng=self.rng
+        )
 
-    # Copy method ----------------------------------------------------------------------------------------------------
-    def copy(self):
-        return gym.make(
-            'MiniHack-MyTask-Custom-v0',
-            width=self.width,
-            height=self.height,
-            max_episode_steps=self.max_episode_steps,
-            gold_score=self.gold_score,
-            stair_score=self.stair_score,
-            time_penalty=self.time_penalty,
-            agent_coord=self.agent_coord,
-            stair_coord=self.stair_coord,
-            gold_coords=self.gold_coords,
-            leprechaun_coords=self.leprechaun_coords
-            )
+        level = self._load_level()
+        self.update(level['des_file'])
+        self.reward_manager = self._make_reward_manager(level=level)
+
+    # NLE >= 1.0 follows the gymnasium API: reset also returns the info and step splits done into terminated and
+    # truncated. Both are brought back to the gym API used by the rest of the class. The end check of the reset reads
+    # the last action taken, which belongs to the previous episode: it is cleared so that the check rewards nothing.
+    def _reset(self) -> dict:
+        self._previous_action = None
+        result = self.reset()
+        return result[0] if isinstance(result, tuple) else result
+
+    def _step(self, action: int) -> Tuple[dict, float, bool, dict]:
+        result = self.step(action)
+        if len(result) == 5:
+            observation, reward, terminated, truncated, info = result
+            return observation, reward, terminated or truncated, info
+        return result
 
     # Reset the environment  -------------------------------------------------------------------------------------------
     def myreset(self) -> Tuple[dict, float]:
-        minihack_state = self.reset()
-        non_empty_rows = ~np.all(minihack_state['chars'] == 32, axis=1)
-        non_empty_cols = ~np.all(minihack_state['chars'] == 32, axis=0)
-        self.matrix_map = minihack_state['chars'][non_empty_rows][:, non_empty_cols]
-        self.agent_coord = self.get_agent_coord()
-        self.gold_coords = self._get_gold_coords()
-        self.leprechaun_coords = self._get_leprechaun_coords()
+        # explicit seeds without reseeding, so that the episode can be replayed by restore
+        self.episode_seeds = tuple(int(s) for s in self.rng.integers(2**63, size=2))
+        self.seed(*self.episode_seeds, False)
+        minihack_state = self._reset()
+        self.observation = minihack_state
+        self.episode_actions = []
+        self.collected_gold = 0
+        self.crop = crop_window(chars=minihack_state['chars'])
+        parsed = self._parse_observation(chars=minihack_state['chars'], message=minihack_state['message'])
+        self.matrix_map = parsed['map']
+        self.agent_coord = parsed['agent_coord']
+        self.gold_coords = parsed['gold_coords']
+        self.leprechaun_coords = parsed['leprechaun_coords']
         #self.stair_coord = self._get_stair_coord()
-        self.pixel = minihack_state['pixel']
-        self.message = bytes(minihack_state['message']).decode('utf-8').rstrip('\x00')
+        self.pixel = minihack_state.get('pixel')
+        self.glyphs = self._get_glyphs()
+        self.message = parsed['message']
         self.instant += 1
         return self.state(), 0.0
 
     # Perform a step in the environment --------------------------------------------------------------------------------
     def mystep(self, action: int) -> Tuple[dict, float, bool]:
-        minihack_state, reward, done, info = self.step(action)
+        self.parsed = None
+        minihack_state, reward, done, info = self._step(action)
+        self.observation = minihack_state
+        self.episode_actions.append(action)
+
+        # the reward function has already parsed this observation, unless the reward manager has been replaced
+        parsed = self.parsed
+        if parsed == None:
+            parsed = self._parse_observation(chars=minihack_state['chars'], message=minihack_state['message'])
+        self.parsed = None
 
         self.instant += 1
-        non_empty_rows = ~np.all(minihack_state['chars'] == 32, axis=1)
-        non_empty_cols = ~np.all(minihack_state['chars'] == 32, axis=0)
-        self.matrix_map = minihack_state['chars'][non_empty_rows][:, non_empty_cols]
-        self.pixel = minihack_state['pixel']
-        self.message = bytes(minihack_state['message']).decode('utf-8').rstrip('\x00')
+        self.matrix_map = parsed['map']
+        self.pixel = minihack_state.get('pixel')
+        self.glyphs = self._get_glyphs()
+        self.message = parsed['message']
 
         if not done:
-            self.agent_coord = self.get_agent_coord()
-            self.gold_coords = self._get_gold_coords()
-            self.leprechaun_coords = self._get_leprechaun_coords()
+            self.agent_coord = parsed['agent_coord']
+            self.gold_coords = parsed['gold_coords']
+            self.leprechaun_coords = parsed['leprechaun_coords']
         else:
             self.agent_coord = self.stair_coord
 
-        if 'Your purse feels lighter' in self.message:
+        if PURSE_MESSAGE in parsed['raw_message']:
             self.collected_gold = 0
 
-        if '$ - a gold piece' in self.message:
+        if GOLD_MESSAGE in parsed['raw_message']:
             self.collected_gold += self.gold_score
     
         return self.state(), reward, done #, info
 
 
+    # Snapshot of the current episode state ----------------------------------------------------------------------------
+    # NLE cannot clone a running game, so the token stores the seeds of the episode and the actions taken since
+    # myreset: restore replays them on this same instance. Restoring a descendant of the current state only replays
+    # the missing actions.
+    def snapshot(self) -> dict:
+        return {
+            'level_key': self.level_key,
+            'seeds': self.episode_seeds,
+            'actions': tuple(self.episode_actions),
+            'fields': {name: copy.copy(getattr(self, name)) for name in SNAPSHOT_FIELDS}
+        }
+
+    def restore(self, token: dict) -> dict:
+        if token['level_key'] != self.level_key:
+            raise RuntimeError('The snapshot has been taken on a different layout')
+
+        actions = token['actions']
+        prefix = len(self.episode_actions) <= len(actions) and tuple(self.episode_actions) == actions[:len(self.episode_actions)]
+
+        if token['seeds'] == self.episode_seeds and prefix:
+            missing = actions[len(self.episode_actions):]
+        else:
+            self.seed(*token['seeds'], False)
+            self.observation = self._reset()
+            missing = actions
+
+        for action in missing:
+            self.observation, _, _, _ = self._step(action)
+
+        self.episode_seeds = token['seeds']
+        self.episode_actions = list(actions)
+        for name, value in token['fields'].items():
+            setattr(self, name, copy.copy(value))
+
+        return self.state()
+
+    # Crop the map with the window computed at reset and extract all the entities in a single pass
+    def _parse_observation(self, chars: np.ndarray, message: np.ndarray) -> dict:
+        if self.crop == None:
+            self.crop = crop_window(chars=chars)
+        env_map = chars[self.crop].copy()
+        agent_coord, gold_coords, leprechaun_coords = parse_entities(env_map=env_map, height=self.height)
+        if agent_coord == None:
+            print('Hidden agent')
+            agent_coord = self.agent_coord
+        return {
+            'map': env_map,
+            'agent_coord': agent_coord,
+            'gold_coords': gold_coords,
+            'leprechaun_coords': leprechaun_coords,
+            'raw_message': message.tobytes(),
+            # nobody reads the text of the messages in the sweeps
+            'message': None if self.observation_mode == 'symbolic' else decode_message(message)
+        }
+
+    # Glyphs are copied because NLE reuses its observation buffers
+    def _get_glyphs(self) -> np.ndarray:
+        if 'glyphs' not in self.observation:
+            return None
+        return self.observation['glyphs'].copy()
+
+    # Pixels of the current frame, rendered from the glyphs if the environment does not produce them every step
+    def render_pixel(self) -> np.ndarray:
+        return state_pixel(state=self.state())
+
     #def _agent_idxs(self):
     #    x, y = np.where(self.curr_state['map'] == AGENT_CHAR)
     #    return x[0], y[0]
@@ -365,6 +491,7 @@ class MiniHackGoldRoom(MiniHack):
             'leprechaun_coords': self.leprechaun_coords,
             'map': self.matrix_map,
             'pixel': self.pixel,
+            'glyphs': self.glyphs,
             'message': self.message
         }
         return env_state
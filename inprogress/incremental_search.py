@@ -0,0 +1,237 @@
+import heapq
+import math
+from typing import Any, Dict, List, Set, Tuple
+from gold_room_env import MiniHackGoldRoom
+from distance_tables import GRID_MOVES, MOVE_ACTIONS, SQRT2
+from utils import policy_rng, ACTIONS
+from trajectory import record_step, TrajectoryRecorder
+
+
+# Incremental replanning for rooms whose obstacles (the leprechauns) move at every step. The plan of a state is a
+# sequence of golds ending on the stair and only depends on the grid distances between the agent and the points of
+# interest, so the planner keeps one distance field per point of interest and repairs them when the obstacles change,
+# instead of searching again from scratch. The orders of the golds (at most 2^n n^2 operations with the repaired
+# distances) are evaluated again at every step.
+
+
+# Lifelong Planning A* (Koenig, Likhachev and Furcy, 2004) of the distances from every cell to target, without the
+# heuristic since every cell is needed. g is the current estimate, rhs its one-step lookahead (the best move to a
+# neighbour plus its g) and the queue holds the inconsistent cells (g != rhs): when the obstacles change, only the
+# changed cells become inconsistent and the repair stops where the distances are unchanged. Moves are those of
+# utils.allowed_moves: the obstacles are never entered and the blocked cells (the stair) can only be the target.
+class IncrementalDistanceField:
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        target: Tuple[int, int],
+        blocked: List[Tuple[int, int]] = [],
+        obstacles: Set[Tuple[int, int]] = set()
+        ):
+
+        self.width = width
+        self.height = height
+        self.target = self.cell(target)
+        self.blocked = set(self.cell(coord) for coord in blocked)
+        self.obstacles = set(self.cell(coord) for coord in obstacles)
+        self.neighbours = [self._neighbours(cell=cell) for cell in range(width * height)]
+        self.g = [math.inf] * (width * height)
+        self.rhs = [math.inf] * (width * height)
+        self.queue = []
+        # cells made consistent, over all the repairs
+        self.n_updates = 0
+
+        self._update(cell=self.target)
+        self.compute()
+
+    def cell(self, coord: Tuple[int, int]) -> int:
+        return int(coord[1]) * self.width + int(coord[0])
+
+    def _neighbours(self, cell: int) -> List[Tuple[int, float]]:
+        x, y = cell % self.width, cell // self.width
+        neighbours = []
+        for move in GRID_MOVES:
+            next_x, next_y = x + move[0], y + move[1]
+            if 0 <= next_x < self.width and 0 <= next_y < self.height:
+                neighbours.append((next_y * self.width + next_x, 1.0 if move[0] == 0 or move[1] == 0 else SQRT2))
+        return neighbours
+
+    def _lookahead(self, cell: int) -> float:
+        if cell in self.obstacles:
+            return math.inf
+        if cell == self.target:
+            return 0.0
+        if cell in self.blocked:
+            return math.inf
+        return min([length + self.g[neighbour] for neighbour, length in self.neighbours[cell]], default=math.inf)
+
+    def _update(self, cell: int) -> None:
+        self.rhs[cell] = self._lookahead(cell=cell)
+        if self.g[cell] != self.rhs[cell]:
+            heapq.heappush(self.queue, (min(self.g[cell], self.rhs[cell]), cell))
+
+    # Makes every cell consistent. Entries whose key is outdated are skipped when popped.
+    def compute(self) -> None:
+        while self.queue != []:
+            key, cell = heapq.heappop(self.queue)
+            g, rhs = self.g[cell], self.rhs[cell]
+            if g == rhs or key != min(g, rhs):
+                continue
+            self.n_updates += 1
+            if g > rhs:
+                self.g[cell] = rhs
+            else:
+                self.g[cell] = math.inf
+                self._update(cell=cell)
+            for neighbour, _ in self.neighbours[cell]:
+                self._update(cell=neighbour)
+
+    # Repairs the distances after a change of the obstacles, returns the number of cells made consistent
+    def set_obstacles(self, obstacles: Set[Tuple[int, int]]) -> int:
+        obstacles = set(self.cell(coord) for coord in obstacles)
+        changed = obstacles ^ self.obstacles
+        self.obstacles = obstacles
+        n_updates = self.n_updates
+        for cell in changed:
+            self._update(cell=cell)
+        self.compute()
+        return self.n_updates - n_updates
+
+    def distance(self, coord: Tuple[int, int]) -> float:
+        return self.g[self.cell(coord)]
+
+
+# Plan-then-act planner over the distance fields of the stair and of the golds. plan returns the best plan of a state
+# dict as the value of the rest of the episode (gold_score per gold, stair_score and time_penalty per unit of length,
+# as in planning.state_score), the golds to collect in order and the first action. The cells in to_avoid and the
+# leprechauns of the state are obstacles; the fields of the golds already collected are dropped.
+class IncrementalPlanner:
+
+    def __init__(self, env: MiniHackGoldRoom, to_avoid: List[Tuple[int, int]] = []):
+        self.width = env.width
+        self.height = env.height
+        self.gold_score, self.stair_score, self.time_penalty = env.gold_score, env.stair_score, env.time_penalty
+        self.stair_coord = tuple(int(c) for c in env.stair_coord)
+        self.to_avoid = set(tuple(int(c) for c in coord) for coord in to_avoid)
+        self.obstacles = set(self.to_avoid)
+        self.stair_field = IncrementalDistanceField(width=self.width, height=self.height, target=self.stair_coord, obstacles=self.obstacles)
+        # built when a gold first appears in a state (the one under the agent at the start is not visible)
+        self.gold_fields: Dict[Tuple[int, int], IncrementalDistanceField] = {}
+        # cells made consistent by the last call of plan
+        self.n_updates = 0
+
+    @property
+    def total_updates(self) -> int:
+        return self.stair_field.n_updates + sum([field.n_updates for field in self.gold_fields.values()])
+
+    # time_penalty times the length, -inf for the unreachable targets (also when time_penalty is 0)
+    def _path_score(self, length: float) -> float:
+        return -math.inf if length == math.inf else self.time_penalty * length
+
+    def update(self, state: dict) -> None:
+        gold_coords = set(tuple(int(c) for c in coord) for coord in state['gold_coords'])
+        gold_coords.discard(self.stair_coord)
+        for coord in [coord for coord in self.gold_fields if coord not in gold_coords]:
+            del self.gold_fields[coord]
+        obstacles = self.to_avoid | set(tuple(int(c) for c in coord) for coord in state['leprechaun_coords'])
+        self.n_updates = 0
+        if obstacles != self.obstacles:
+            self.obstacles = obstacles
+            for field in [self.stair_field] + list(self.gold_fields.values()):
+                self.n_updates += field.set_obstacles(obstacles=obstacles)
+        for coord in gold_coords:
+            if coord not in self.gold_fields:
+                self.gold_fields[coord] = IncrementalDistanceField(width=self.width, height=self.height, target=coord, blocked=[self.stair_coord], obstacles=obstacles)
+                self.n_updates += self.gold_fields[coord].n_updates
+
+    # Held-Karp over the golds still on the floor: lengths[mask][i] is the shortest path from the agent collecting the
+    # golds of mask and ending on golds[i]
+    def plan(self, state: dict) -> dict:
+        self.update(state=state)
+        agent_coord = tuple(int(c) for c in state['agent_coord'])
+        golds = [coord for coord in self.gold_fields if coord != agent_coord]
+        fields = [self.gold_fields[coord] for coord in golds]
+        n = len(golds)
+        collected_on_stair = self.stair_score + self.gold_score * (self.stair_coord in [tuple(coord) for coord in state['gold_coords']])
+
+        if agent_coord == self.stair_coord:
+            return {'value': 0.0, 'golds': [], 'action': None}
+
+        lengths = [[math.inf] * n for _ in range(1 << n)]
+        parents = [[None] * n for _ in range(1 << n)]
+        for i in range(n):
+            lengths[1 << i][i] = fields[i].distance(agent_coord)
+        for mask in range(1, 1 << n):
+            for i in range(n):
+                if not mask >> i & 1 or lengths[mask][i] == math.inf:
+                    continue
+                for j in range(n):
+                    if mask >> j & 1:
+                        continue
+                    length = lengths[mask][i] + fields[j].distance(golds[i])
+                    if length < lengths[mask | 1 << j][j]:
+                        lengths[mask | 1 << j][j] = length
+                        parents[mask | 1 << j][j] = i
+
+        best_value, best_mask, best_last = self._path_score(self.stair_field.distance(agent_coord)), 0, None
+        for mask in range(1, 1 << n):
+            for i in range(n):
+                if mask >> i & 1:
+                    value = self.gold_score * bin(mask).count('1') + self._path_score(lengths[mask][i] + self.stair_field.distance(golds[i]))
+                    if value > best_value:
+                        best_value, best_mask, best_last = value, mask, i
+
+        order = []
+        mask, i = best_mask, best_last
+        while i != None:
+            order.insert(0, golds[i])
+            mask, i = mask & ~(1 << i), parents[mask][i]
+
+        if best_value == -math.inf:
+            return {'value': best_value, 'golds': [], 'action': None}
+        field = self.stair_field if order == [] else self.gold_fields[order[0]]
+        return {'value': best_value + collected_on_stair, 'golds': order, 'action': self._first_action(agent_coord=agent_coord, field=field)}
+
+    # Step towards the target of field along its distances (the first of the best moves, in the order of GRID_MOVES)
+    def _first_action(self, agent_coord: Tuple[int, int], field: IncrementalDistanceField) -> int:
+        best_action, best_length = None, math.inf
+        for move in GRID_MOVES:
+            x, y = agent_coord[0] + move[0], agent_coord[1] + move[1]
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                continue
+            length = (1.0 if move[0] == 0 or move[1] == 0 else SQRT2) + field.distance((x, y))
+            if length < best_length:
+                best_action, best_length = MOVE_ACTIONS[move], length
+        return best_action
+
+
+# Online policy that follows the plan of an IncrementalPlanner, computed again after every step with the distances
+# repaired where the leprechauns moved. When the stair cannot be reached (the leprechauns block every path) the agent
+# takes a random action, as online_search_f does without allowed moves. Same outputs (and recorder) as the other online
+# policies.
+def incremental_online_search(env: MiniHackGoldRoom, max_steps: int = 1000, to_avoid: List[Tuple[int, int]] = [], rng: Any = None, recorder: TrajectoryRecorder = None):
+
+    rng = policy_rng(env=env, rng=rng, algorithm='incremental_online_search')
+
+    state, reward = env.myreset()
+    planner = IncrementalPlanner(env=env, to_avoid=to_avoid)
+    done = False
+
+    rewards = [reward]
+    states = [] if recorder == None else recorder
+    record_step(states=states, state=state, reward=reward)
+
+    i = 0
+    for i in range(max_steps):
+        if done:
+            break
+
+        action = planner.plan(state=state)['action']
+        if action == None:
+            action = ACTIONS[rng.integers(len(ACTIONS))]
+        state, reward, done = env.mystep(action=action)
+        rewards.append(reward)
+        record_step(states=states, state=state, reward=reward, action=action)
+
+    return states, rewards, done, i, i
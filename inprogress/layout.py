@@ -0,0 +1,254 @@
+import hashlib
+import warnings
+import numpy as np
+from collections import OrderedDict
+from typing import List, Tuple
+
+# Layout handling shared by every gold room backend (NLE-backed or symbolic): argument validation and random sampling
+# of the missing coordinates. This module must not depend on minihack/nle.
+
+
+def check_layout_arguments(
+    width: int,
+    height: int,
+    gold_score: float,
+    stair_score: float,
+    time_penalty: float,
+    agent_coord: Tuple[int, int],
+    stair_coord: Tuple[int, int],
+    gold_coords: List[Tuple[int, int]],
+    leprechaun_coords: List[Tuple[int, int]],
+    n_golds: int,
+    n_leps: int,
+    max_episode_steps: int
+) -> None:
+
+    # Type checks for each variable of the class
+
+    if not isinstance(width, int):
+        raise TypeError(f'width parameter must be of type int, not {type(width)}')
+
+    if not isinstance(height, int):
+        raise TypeError(f'height parameter must be of type int, not {type(height)}')
+
+    if not isinstance(gold_score, (int, float)):
+        raise TypeError(f'gold_score parameter must be of type int or float, not {type(gold_score)}')
+
+    if not isinstance(stair_score, (int, float)):
+        raise TypeError(f'stair_score parameter must be of type int or float, not {type(stair_score)}')
+
+    if not isinstance(time_penalty, (int, float)):
+        raise TypeError(f'time_penalty parameter must be of type int or float, not {type(time_penalty)}')
+
+    if not isinstance(agent_coord, Tuple) and agent_coord != None:
+        raise TypeError(f'agent_coord parameter must be of type Tuple, not {type(agent_coord)}')
+
+    if not isinstance(stair_coord, Tuple) and stair_coord != None:
+        raise TypeError(f'stair_coord parameter must be of type Tuple, not {type(stair_coord)}')
+
+    if not isinstance(gold_coords, List) and gold_coords != None:
+        raise TypeError(f'gold_coords parameter must be of type List, not {type(gold_coords)}')
+
+    if gold_coords != None:
+        for item in gold_coords:
+            if not isinstance(item, Tuple):
+                raise TypeError(f'gold_coords parameter must be of type List[Tuple], not {type(gold_coords)}')
+
+        if not isinstance(leprechaun_coords, List) and leprechaun_coords != None:
+            raise TypeError(f'leprechaun_coords parameter must be of type List, not {type(leprechaun_coords)}')
+
+    if leprechaun_coords != None:
+        for item in leprechaun_coords:
+            if not isinstance(item, Tuple):
+                raise TypeError(f'leprechaun_coords parameter must be of type List[Tuple], not {type(leprechaun_coords)}')
+
+    if not isinstance(n_golds, int):
+        raise TypeError(f'n_golds parameter must be of type int, not {type(n_golds)}')
+
+    if not isinstance(n_leps, int):
+        raise TypeError(f'n_leps parameter must be of type int, not {type(n_leps)}')
+
+    # Value checks
+
+    if max_episode_steps < 0:
+        raise RuntimeError(f'Invalid argument max_episode_steps = {max_episode_steps}')
+
+    if width < 0:
+        raise RuntimeError(f'Invalid argument width = {width}')
+
+    if height < 0:
+        raise RuntimeError(f'Invalid argument height = {height}')
+
+    if n_golds < 0:
+        raise RuntimeError(f'Invalid argument n_stairs = {n_golds}')
+    elif n_golds > width * height:
+        raise RuntimeError(f'Too many golds ({n_golds}) for a {width}x{height} grid')
+
+    if n_leps < 0:
+        raise RuntimeError(f'Invalid argument n_stairs = {n_leps}')
+    elif n_leps > width * height - 2:
+        raise RuntimeError(f'Too many leprechauns ({n_leps}) for a {width}x{height} grid')
+
+    if gold_score <= 0:
+        raise RuntimeError(f'Invalid argument gold_score = {gold_score} <= 0')
+
+    if agent_coord != None:
+        x, y = agent_coord
+        if x not in range(width):
+                raise RuntimeError(f'Agent coordinate out of bound [0, {width}): x = {x}')
+        if y not in range(height):
+            raise RuntimeError(f'Agent coordinate out of bound [0, {height}): y = {y}')
+        if agent_coord == stair_coord:
+            raise RuntimeError(f'Overlapping start and end coordinates')
+
+    if stair_coord != None:
+        x, y = stair_coord
+        if x not in range(width):
+                raise RuntimeError(f'Stair coordinate out of bound [0, {width}): x = {x}')
+        if y not in range(height):
+            raise RuntimeError(f'Stair coordinate out of bound [0, {height}): y = {y}')
+
+    if gold_coords != None:
+        seen = set()
+        duplicate = False
+        for (x, y) in gold_coords:
+            if (x, y) in seen:
+                duplicate = True
+            if x not in range(width):
+                raise RuntimeError(f'Gold coordinate out of bound [0, {width}): x = {x}')
+            if y not in range(height):
+                raise RuntimeError(f'Gold coordinate out of bound [0, {height}): y = {y}')
+            seen.add((x, y))
+        if duplicate:
+            warnings.warn(f'Multiple gold items in the same position: only one added', Warning)
+        if len(gold_coords) > width * height:
+            raise RuntimeError(f'Too many golds ({len(gold_coords)}) for a {width}x{height} grid')
+
+    if leprechaun_coords != None:
+        for (x, y) in leprechaun_coords:
+            if x not in range(width):
+                raise RuntimeError(f'Leprechaun coordinate out of bound [0, {width}): x = {x}')
+            if y not in range(height):
+                raise RuntimeError(f'Leprechaun coordinate out of bound [0, {height}): y = {y}')
+        if len(leprechaun_coords) > width * height - 2:
+            raise RuntimeError(f'Too many leprechauns ({len(leprechaun_coords)}) for a {width}x{height} grid')
+
+
+def sample_layout(
+    width: int,
+    height: int,
+    agent_coord: Tuple[int, int] = None,
+    stair_coord: Tuple[int, int] = None,
+    gold_coords: List[Tuple[int, int]] = None,
+    leprechaun_coords: List[Tuple[int, int]] = None,
+    n_golds: int = 0,
+    n_leps: int = 0,
+    rng: np.random.Generator = None
+) -> Tuple[Tuple[int, int], Tuple[int, int], List[Tuple[int, int]], List[Tuple[int, int]]]:
+
+    rng = np.random.default_rng(rng)
+    coords = [(x, y) for x in range(width) for y in range(height)]
+
+    def sample(population: List[Tuple[int, int]], k: int) -> List[Tuple[int, int]]:
+        return [population[i] for i in rng.choice(len(population), size=k, replace=False).tolist()]
+
+    if gold_coords == None:
+        gold_coords = sample(population=coords, k=n_golds)
+
+    if leprechaun_coords == None:
+        leprechaun_coords = sample(population=coords, k=n_leps)
+
+    if agent_coord == None:
+        if stair_coord == None:
+            agent_coord, stair_coord = tuple(sample(population=coords, k=2))
+        else:
+            coords.remove(stair_coord)
+            agent_coord = sample(population=coords, k=1)[0]
+    elif stair_coord == None:
+        coords.remove(agent_coord)
+        stair_coord = sample(population=coords, k=1)[0]
+
+    return agent_coord, stair_coord, gold_coords, leprechaun_coords
+
+
+# Seed of an independent random stream, derived from a root seed and the keys of a unit of work (e.g. the sweep cell and
+# the episode index). The keys are hashed with sha1 instead of hash() so that every process derives the same stream.
+def stream_seed(seed: int, *keys) -> int:
+    digest = hashlib.sha1(repr(keys).encode('utf-8')).digest()
+    spawn_key = [int.from_bytes(digest[i:i + 4], 'little') for i in range(0, 16, 4)]
+    return int(np.random.SeedSequence(entropy=seed, spawn_key=spawn_key).generate_state(1, dtype=np.uint64)[0])
+
+
+# Content address of a layout: equivalent layouts (same size and entities, in any order) share the same key
+def layout_key(
+    width: int,
+    height: int,
+    agent_coord: Tuple[int, int],
+    stair_coord: Tuple[int, int],
+    gold_coords: List[Tuple[int, int]],
+    leprechaun_coords: List[Tuple[int, int]]
+) -> str:
+    normalize = lambda coord: (int(coord[0]), int(coord[1]))
+    content = (
+        int(width),
+        int(height),
+        normalize(agent_coord),
+        normalize(stair_coord),
+        tuple(sorted([normalize(coord) for coord in gold_coords])),
+        tuple(sorted([normalize(coord) for coord in leprechaun_coords]))
+    )
+    return hashlib.sha1(repr(content).encode('utf-8')).hexdigest()
+
+
+# Bounded LRU cache of generated levels (des file and reward manager configuration), keyed by layout_key
+class LevelCache:
+
+    def __init__(self, maxsize: int = 1024):
+        if maxsize < 0:
+            raise RuntimeError(f'Invalid argument maxsize = {maxsize}')
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> dict:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, level: dict) -> None:
+        self.entries[key] = level
+        self.entries.move_to_end(key)
+        self._evict()
+
+    def resize(self, maxsize: int) -> None:
+        if maxsize < 0:
+            raise RuntimeError(f'Invalid argument maxsize = {maxsize}')
+        self.maxsize = maxsize
+        self._evict()
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evict(self) -> None:
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups > 0 else 0.0
+        }
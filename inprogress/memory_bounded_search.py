@@ -0,0 +1,401 @@
+import heapq
+import math
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+from gold_room_env import MiniHackGoldRoom
+from distance_tables import PathTable, SubplanCache, SUBPLAN_CACHE
+from layout import LevelCache
+from planning import Plan, Node, State, StateSpace, successors, state_score, state_heuristic
+from utils import HeuristicContext, AllowedMovesFunction, AllowedSimpleMovesFunction, ALLOWED_SIMPLE_MOVES
+
+
+# Memory-bounded versions of a_star_search, with its g, h and allowed_moves_function interfaces. They keep at most a
+# path (IDA*) or a fixed number of nodes (SMA*) in memory and pay for it with re-expansions. The returned plan has
+# memory_stats with the peak number of nodes held, the expansions and the re-expansions (and the peak of the memory
+# allocated by Python during the search, in bytes, if trace_memory is set).
+
+
+def setup_search(
+    env: MiniHackGoldRoom,
+    g: Callable[[State, State, float], float],
+    h: Callable[[State], float],
+    allowed_moves_function: AllowedMovesFunction,
+    subplan_cache: SubplanCache,
+    context: HeuristicContext
+) -> Tuple[Callable, Callable, StateSpace, PathTable, Node]:
+
+    if not isinstance(allowed_moves_function, AllowedMovesFunction):
+        raise ValueError('Parameter allowed_moves_function must be of type AllowedMovesFunction')
+
+    if isinstance(allowed_moves_function, AllowedSimpleMovesFunction):
+        allowed_moves_function.width = env.width
+        allowed_moves_function.height = env.height
+
+    gold_score, stair_score, time_penalty = env.gold_score, env.stair_score, env.time_penalty
+
+    if g == None:
+        g = lambda next_state, curr_state, curr_g: state_score(next_state=next_state, curr_state=curr_state, curr_g=curr_g, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty)
+
+    if h == None:
+        h = lambda state: state_heuristic(state=state, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty)
+
+    _, init_g = env.myreset()
+    space = StateSpace(width=env.width, height=env.height, stair_coord=env.stair_coord, gold_coords=env.gold_coords, context=context)
+    path_table = PathTable(width=env.width, height=env.height, gold_coords=env.gold_coords, to_avoid=[env.stair_coord], cache=subplan_cache)
+    init_state = space.state(agent_coord=env.agent_coord, gold_coords=env.gold_coords)
+    init_node = Node(state=init_state, g_value=init_g, priority=init_g + h(state=init_state), action=[])
+    return g, h, space, path_table, init_node
+
+
+def node_plan(node: Node) -> Plan:
+    plan = Plan()
+    while node != None:
+        plan.add_reverse(action=node.action, coords=node.state.agent_coord)
+        node = node.parent
+    return plan
+
+
+# IDA*: depth-first searches bounded by a threshold on f = g + h, the optimistic value of the plans through a node.
+# Each search explores the nodes with f >= threshold (and better than the best plan found), so if it finds a plan
+# worth at least the threshold that plan is optimal; otherwise the threshold is lowered to the best f pruned, and at
+# least by threshold_step (one straight move by default) so that the searches are not repeated for tiny changes of f.
+# States already reached with a higher g in the current search are skipped through a bounded table (table_size
+# states, least recently used evicted), which also catches the cycles of the path. The search stops at max_expansions
+# or max_seconds and the plan has the outcome of a_star_search: when no plan is proven optimal it is the best plan
+# found if any, otherwise the path to the expanded node with the highest g. The re-expansions are the node expansions
+# of the searches before the last one, which the last one repeats (the expansions of the PathTable are not counted).
+def ida_star_search(
+    env: MiniHackGoldRoom,
+    g: Callable[[State, State, float], float] = None,
+    h: Callable[[State], float] = None,
+    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+    threshold_step: float = None,
+    table_size: int = 100000,
+    subplan_cache: SubplanCache = SUBPLAN_CACHE,
+    context: HeuristicContext = None,
+    trace_memory: bool = False,
+    max_expansions: int = None,
+    max_seconds: float = None
+) -> Tuple[Plan, int]:
+
+    start_time = time.perf_counter()
+
+    if trace_memory:
+        tracemalloc.start()
+
+    g, h, space, path_table, init_node = setup_search(env=env, g=g, h=h, allowed_moves_function=allowed_moves_function, subplan_cache=subplan_cache, context=context)
+    threshold_step = abs(env.time_penalty) if threshold_step == None else threshold_step
+
+    # children sorted by decreasing f, the best ones are explored first
+    def children_of(node: Node) -> Tuple[List[Node], int]:
+        children, n_expanded_nodes = successors(env=env, node=node, space=space, g=g, allowed_moves_function=allowed_moves_function, path_table=path_table)
+        for child in children:
+            child.priority = child.g_value + h(state=child.state)
+        children.sort(key=lambda child: child.priority, reverse=True)
+        return children, n_expanded_nodes
+
+    def limit_hit() -> str:
+        if max_expansions != None and n_expanded >= max_expansions:
+            return 'max_expansions'
+        if max_seconds != None and time.perf_counter() - start_time >= max_seconds:
+            return 'max_seconds'
+        return None
+
+    threshold = init_node.priority
+    best_plan = init_node if init_node.state.cell == space.stair_cell else None
+    best_partial = init_node
+    n_expanded = 0
+    node_expanded = 0
+    iteration_expanded = 0
+    iterations = 0
+    peak_nodes = 0
+    limit = None
+    done = (best_plan != None)
+
+    while not done:
+        limit = limit_hit()
+        if limit != None:
+            break
+        iterations += 1
+        iteration_expanded = 0
+        next_threshold = -math.inf
+        table = LevelCache(maxsize=table_size)
+        table.put(init_node.state, init_node.g_value)
+
+        children, n_expanded_nodes = children_of(init_node)
+        n_expanded += 1 + n_expanded_nodes
+        node_expanded += 1
+        iteration_expanded += 1
+        stack = [(init_node, iter(children), len(children))]
+        n_nodes = len(children)
+
+        while stack != []:
+            peak_nodes = max(peak_nodes, n_nodes + len(table.entries))
+            node, remaining, n_children = stack[-1]
+            child = next(remaining, None)
+            if child == None:
+                stack.pop()
+                n_nodes -= n_children
+                continue
+
+            if best_plan != None and child.priority <= best_plan.g_value:
+                continue
+            if child.priority < threshold:
+                next_threshold = max(next_threshold, child.priority)
+                continue
+            # the stair ends the episode: its nodes are plans, not nodes to expand
+            if child.state.cell == space.stair_cell:
+                if best_plan == None or child.g_value > best_plan.g_value:
+                    best_plan = child
+                continue
+            seen = table.get(child.state)
+            if seen != None and seen >= child.g_value:
+                continue
+            limit = limit_hit()
+            if limit != None:
+                break
+            table.put(child.state, child.g_value)
+            if child.g_value > best_partial.g_value:
+                best_partial = child
+
+            grandchildren, n_expanded_nodes = children_of(child)
+            n_expanded += 1 + n_expanded_nodes
+            node_expanded += 1
+            iteration_expanded += 1
+            stack.append((child, iter(grandchildren), len(grandchildren)))
+            n_nodes += len(grandchildren)
+
+        if limit != None:
+            break
+        # every plan worth at least the threshold has been explored
+        done = (best_plan != None and (best_plan.g_value >= threshold or best_plan.g_value >= next_threshold)) or next_threshold == -math.inf
+        threshold = min(next_threshold, threshold - threshold_step)
+
+    if limit == None:
+        status = 'solved' if best_plan != None else 'no_solution'
+    else:
+        status = 'limit_hit'
+
+    plan = node_plan(best_plan if best_plan != None else best_partial)
+    plan.outcome = {
+        'status': status,
+        'limit': limit,
+        'complete': best_plan != None,
+        'seconds': time.perf_counter() - start_time
+    }
+    plan.memory_stats = {
+        'mode': 'ida*',
+        'peak_nodes': peak_nodes,
+        'expansions': n_expanded,
+        'reexpansions': node_expanded - iteration_expanded,
+        'iterations': iterations
+    }
+    if trace_memory:
+        plan.memory_stats['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return plan, n_expanded
+
+
+# Node of the SMA* tree: the children in memory and the best f among the children forgotten to make room
+class BoundedNode(Node):
+
+    def __init__(self, node: Node):
+        super().__init__(state=node.state, g_value=node.g_value, priority=node.priority, parent=node.parent, action=node.action)
+        self.depth = node.depth
+        # nodes on its path from the root, besides itself (depth counts the actions of the composite moves)
+        self.tree_depth = 0 if node.parent == None else node.parent.tree_depth + 1
+        self.children = []
+        self.forgotten = -math.inf
+        self.alive = True
+        self.n_expansions = 0
+        # counter of its last push among the open nodes, older heap entries are stale
+        self.open_counter = None
+
+    # value of the plans of the node still to explore: all of them before its expansion, then the forgotten ones
+    def open_priority(self) -> float:
+        return self.priority if self.n_expansions == 0 else self.forgotten
+
+
+# SMA*: A* with at most max_nodes nodes in memory (plus the children of one expansion). When the memory is full the
+# worst leaf (lowest f, shallowest first) is forgotten and its f is backed up in its parent, which goes back among the
+# open nodes with that f and regenerates its forgotten children when it is popped again. f is never higher than the f
+# of the parent (pathmax), so the first plan popped is optimal as long as the memory can hold its path; with much
+# less memory than that the search thrashes. States reached again with a lower g are skipped, states reached with a
+# higher g replace the subtree of the old node. A node max_nodes - 1 levels below the root and not on the stair gets
+# f = -inf, since no plan through it fits in memory: when the best open node has f = -inf the search fails. The cutoff
+# bounds the search, but thrashing (or a stair that cannot be reached) can still take exponential time before every
+# open node is cut, so the search also stops at max_expansions (a few tens of seconds by default) or max_seconds. The
+# plan has the outcome of a_star_search; when no plan is found it is the path to the expanded node with the highest g.
+def sma_star_search(
+    env: MiniHackGoldRoom,
+    g: Callable[[State, State, float], float] = None,
+    h: Callable[[State], float] = None,
+    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+    max_nodes: int = 100000,
+    subplan_cache: SubplanCache = SUBPLAN_CACHE,
+    context: HeuristicContext = None,
+    trace_memory: bool = False,
+    max_expansions: int = 100000,
+    max_seconds: float = None
+) -> Tuple[Plan, int]:
+
+    start_time = time.perf_counter()
+
+    if max_nodes < 2:
+        raise RuntimeError(f'Invalid argument max_nodes = {max_nodes}')
+
+    if trace_memory:
+        tracemalloc.start()
+
+    g, h, space, path_table, init_node = setup_search(env=env, g=g, h=h, allowed_moves_function=allowed_moves_function, subplan_cache=subplan_cache, context=context)
+    root = BoundedNode(init_node)
+
+    # nodes in memory by state, open nodes (highest f, deepest first) and leaves to forget (lowest f, shallowest first)
+    nodes = {root.state: root}
+    open_nodes = []
+    worst_leaves = []
+    counter = 0
+
+    def push_open(node: BoundedNode) -> None:
+        nonlocal counter
+        node.open_counter = counter
+        heapq.heappush(open_nodes, (-node.open_priority(), -node.depth, counter, node))
+        if node.children == []:
+            heapq.heappush(worst_leaves, (node.open_priority(), node.depth, counter, node))
+        counter += 1
+
+    def is_open(entry: tuple) -> bool:
+        return entry[-1].alive and entry[2] == entry[-1].open_counter
+
+    # removes node from the tree, backing up its f in the parent, which is opened again. A parent left without
+    # children and without anything interesting forgotten is removed too.
+    def forget(node: BoundedNode, backup: float) -> None:
+        node.alive = False
+        del nodes[node.state]
+        parent = node.parent
+        if parent == None:
+            return
+        parent.children.remove(node)
+        parent.forgotten = max(parent.forgotten, backup)
+        if parent.children == [] and parent.forgotten == -math.inf:
+            forget(parent, backup=-math.inf)
+        elif backup != -math.inf or parent.children == []:
+            if parent.children == []:
+                parent.priority = min(parent.priority, parent.forgotten)
+            push_open(parent)
+
+    # removes node and its descendants, whose states have been reached by a better path
+    def forget_subtree(node: BoundedNode) -> None:
+        descendants = list(node.children)
+        while descendants != []:
+            descendant = descendants.pop()
+            descendant.alive = False
+            del nodes[descendant.state]
+            descendants += descendant.children
+            descendant.children = []
+        node.children = []
+        node.forgotten = -math.inf
+        forget(node, backup=-math.inf)
+
+    def is_ancestor(node: BoundedNode, descendant: BoundedNode) -> bool:
+        while descendant != None:
+            if descendant is node:
+                return True
+            descendant = descendant.parent
+        return False
+
+    push_open(root)
+    n_expanded = 0
+    n_reexpansions = 0
+    peak_nodes = 1
+    best_plan = None
+    best_partial = root
+    limit = None
+
+    while open_nodes != []:
+        if max_expansions != None and n_expanded >= max_expansions:
+            limit = 'max_expansions'
+        elif max_seconds != None and time.perf_counter() - start_time >= max_seconds:
+            limit = 'max_seconds'
+        if limit != None:
+            break
+
+        entry = heapq.heappop(open_nodes)
+        if not is_open(entry):
+            continue
+        node = entry[-1]
+        # the stair ends the episode: the best open node on the stair is the best plan
+        if node.state.cell == space.stair_cell:
+            best_plan = node
+            break
+        # the open nodes left are all too deep for memory
+        if node.open_priority() == -math.inf:
+            break
+        if node.g_value > best_partial.g_value:
+            best_partial = node
+
+        children, n_expanded_nodes = successors(env=env, node=node, space=space, g=g, allowed_moves_function=allowed_moves_function, path_table=path_table)
+        n_expanded += 1 + n_expanded_nodes
+        n_reexpansions += (node.n_expansions > 0)
+        # the children in memory are kept, the others are generated again with at most the f backed up for them
+        cap = node.open_priority()
+        in_memory = set([child.state for child in node.children])
+        node.n_expansions += 1
+        node.forgotten = -math.inf
+
+        new_children = []
+        for child in children:
+            if child.state in in_memory:
+                continue
+            existing = nodes.get(child.state)
+            if existing != None:
+                if existing.g_value >= child.g_value or is_ancestor(existing, node):
+                    continue
+                forget_subtree(existing)
+            child = BoundedNode(child)
+            if child.tree_depth >= max_nodes - 1 and child.state.cell != space.stair_cell:
+                child.priority = -math.inf
+            else:
+                child.priority = min(cap, child.g_value + h(state=child.state))
+            nodes[child.state] = child
+            new_children.append(child)
+        node.children += new_children
+
+        if node.children == []:
+            forget(node, backup=-math.inf)
+            continue
+        for child in new_children:
+            push_open(child)
+        peak_nodes = max(peak_nodes, len(nodes))
+
+        while len(nodes) > max_nodes and worst_leaves != []:
+            entry = heapq.heappop(worst_leaves)
+            leaf = entry[-1]
+            if is_open(entry) and leaf.children == [] and leaf is not root:
+                forget(leaf, backup=leaf.open_priority())
+
+    if best_plan != None:
+        status = 'solved'
+    else:
+        status = 'limit_hit' if limit != None else 'no_solution'
+
+    plan = node_plan(best_plan if best_plan != None else best_partial)
+    plan.outcome = {
+        'status': status,
+        'limit': limit,
+        'complete': best_plan != None,
+        'seconds': time.perf_counter() - start_time
+    }
+    plan.memory_stats = {
+        'mode': 'sma*',
+        'peak_nodes': peak_nodes,
+        'expansions': n_expanded,
+        'reexpansions': n_reexpansions
+    }
+    if trace_memory:
+        plan.memory_stats['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return plan, n_expanded
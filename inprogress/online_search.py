@@ -1,25 +1,41 @@
 from gold_room_env import MiniHackGoldRoom
-from utils import allowed_moves, move_to_action, scaled_default_heuristic, scaled_default_score, default_heuristic, default_score, ACTIONS
-from typing import Callable, List, Tuple
-import random
+from utils import allowed_moves, move_to_action, policy_rng, scaled_default_heuristic, scaled_default_score, default_heuristic, default_score, HeuristicContext, MemoizedHeuristic, ACTIONS
+from trajectory import record_step, TrajectoryRecorder
+from typing import Any, Callable, List, Tuple
 import numpy as np
 
-def online_search_f(env: MiniHackGoldRoom, value_function: Callable[[dict, dict], float] = None, max_steps: int = 1000, selection_policy: Callable[List[float], int] = None, prob_move: Callable[[int, float, float], float] = None, greedy_alternative = False):
-
-    allowed_moves_function = lambda state: allowed_moves(width=env.width, height=env.height, state=state)
 
+# Context of the online policies: the states they see never contain the gold on the stair
+def online_context(env: MiniHackGoldRoom) -> HeuristicContext:
     env_dict = env.to_dict()
     env_dict['gold_coords'] = [coord for coord in env_dict['gold_coords'] if coord != env_dict['stair_coord']]
-    
+    return HeuristicContext(env=env_dict)
+
+
+# The default value function is evaluated through a HeuristicContext of the env, without the gold on the stair (see
+# online_context); a context built beforehand can be passed to share it between runs on the same layout. With
+# heuristic_cache_size its heuristic is memoized, which also covers the states evaluated again after a nop. With a
+# recorder, every step is appended to it with its action instead of being kept as a state dict, and the recorder is
+# returned in place of the list of states.
+def online_search_f(env: MiniHackGoldRoom, value_function: Callable[[dict, dict], float] = None, max_steps: int = 1000, selection_policy: Callable[List[float], int] = None, prob_move: Callable[[int, float, float], float] = None, greedy_alternative = False, rng: Any = None, context: HeuristicContext = None, heuristic_cache_size: int = None, recorder: TrajectoryRecorder = None):
+
+    rng = policy_rng(env=env, rng=rng, algorithm='online_search_f')
+
+    allowed_moves_function = lambda state: allowed_moves(width=env.width, height=env.height, state=state)
+
     if value_function == None:
-        h = lambda state: scaled_default_heuristic(state=state, env=env_dict)
-        g = lambda next_state, curr_state: scaled_default_score(next_state=next_state, curr_state=curr_state, env=env_dict)
+        if context == None:
+            context = online_context(env=env)
+        h = context.scaled_heuristic
+        if heuristic_cache_size != None:
+            h = MemoizedHeuristic(h=h, maxsize=heuristic_cache_size)
+        g = lambda next_state, curr_state: context.scaled_score(next_state=next_state, curr_state=curr_state)
         value_function = lambda next_state, curr_state: g(next_state=next_state, curr_state=curr_state) + h(state=next_state)
     
     def greedy_selection(values: List[float]) -> int:
         max_value = max(values)
         max_value_indexes = [i for i, value in enumerate(values) if value == max_value]
-        return random.sample(population=max_value_indexes, k=1)[0]
+        return max_value_indexes[rng.integers(len(max_value_indexes))]
 
     if selection_policy == None:
         selection_policy = greedy_selection
@@ -32,7 +48,8 @@ def online_search_f(env: MiniHackGoldRoom, value_function: Callable[[dict, dict]
     done = False
     
     rewards = [reward]
-    states = [state]
+    states = [] if recorder == None else recorder
+    record_step(states=states, state=state, reward=reward)
     curr_value = value_function(next_state=state, curr_state=None)
     nop = 0
 
@@ -43,7 +60,7 @@ def online_search_f(env: MiniHackGoldRoom, value_function: Callable[[dict, dict]
         moves = allowed_moves_function(state=state)
 
         if moves == []:
-            action = random.sample(population=ACTIONS, k=1)[0]
+            action = ACTIONS[rng.integers(len(ACTIONS))]
 
         else:
             next_agent_coords = [tuple(np.array(state['agent_coord']) + move) for move in moves]
@@ -65,12 +82,12 @@ def online_search_f(env: MiniHackGoldRoom, value_function: Callable[[dict, dict]
             next_value_index = selection_policy(next_values)
             next_value = next_values[next_value_index]
 
-            if random.uniform(0, 1) <= prob_move(t=i, curr_value=curr_value, next_value=next_value):
+            if rng.random() <= prob_move(t=i, curr_value=curr_value, next_value=next_value):
                 action = move_to_action(moves[next_value_index])
                 state, reward, done = env.mystep(action=action)
                 state['gold_coords'] = [coord for coord in state['gold_coords'] if coord != state['stair_coord']]
                 rewards.append(reward)
-                states.append(state)
+                record_step(states=states, state=state, reward=reward, action=action)
 
             elif greedy_alternative:
                 next_value_index = greedy_selection(next_values)
@@ -79,27 +96,31 @@ def online_search_f(env: MiniHackGoldRoom, value_function: Callable[[dict, dict]
                 state, reward, done = env.mystep(action=action)
                 state['gold_coords'] = [coord for coord in state['gold_coords'] if coord != state['stair_coord']]
                 rewards.append(reward)
-                states.append(state)
+                record_step(states=states, state=state, reward=reward, action=action)
             
             else:
                 nop += 1
 
     return states, rewards, done, i, i-nop
 
-def online_greedy_search(env: MiniHackGoldRoom, value_function: Callable[[dict, dict], float] = None, max_steps: int = 1000):
-    return online_search_f(env=env, value_function=value_function, max_steps=max_steps)
+def online_greedy_search(env: MiniHackGoldRoom, value_function: Callable[[dict, dict], float] = None, max_steps: int = 1000, rng: Any = None, context: HeuristicContext = None, recorder: TrajectoryRecorder = None):
+    return online_search_f(env=env, value_function=value_function, max_steps=max_steps, rng=rng, context=context, recorder=recorder)
 
 
-def weighted_online_greedy_search(env: MiniHackGoldRoom, w: float, max_steps: int = 1000):
-    env_dict = env.to_dict()
-    env_dict['gold_coords'] = [coord for coord in env_dict['gold_coords'] if coord != env_dict['stair_coord']]
-    h = lambda state: w*scaled_default_heuristic(state=state, env=env_dict)
-    g = lambda next_state, curr_state: scaled_default_score(next_state=next_state, curr_state=curr_state, env=env_dict)
+def weighted_online_greedy_search(env: MiniHackGoldRoom, w: float, max_steps: int = 1000, rng: Any = None, context: HeuristicContext = None, heuristic_cache_size: int = None, recorder: TrajectoryRecorder = None):
+    if context == None:
+        context = online_context(env=env)
+    h = lambda state: w*context.scaled_heuristic(state=state)
+    if heuristic_cache_size != None:
+        h = MemoizedHeuristic(h=h, maxsize=heuristic_cache_size)
+    g = lambda next_state, curr_state: context.scaled_score(next_state=next_state, curr_state=curr_state)
     value_function = lambda next_state, curr_state: g(next_state=next_state, curr_state=curr_state) + h(state=next_state)
-    return online_search_f(env=env, value_function=value_function, max_steps=max_steps)
+    return online_search_f(env=env, value_function=value_function, max_steps=max_steps, rng=rng, recorder=recorder)
 
 
-def simulated_annealing(env: MiniHackGoldRoom, value_function: Callable[[dict, dict], float] = None, max_steps: int = 1000, temperature: Callable[[int, float, float], float] = None, k = 1):
+def simulated_annealing(env: MiniHackGoldRoom, value_function: Callable[[dict, dict], float] = None, max_steps: int = 1000, temperature: Callable[[int, float, float], float] = None, k = 1, rng: Any = None, context: HeuristicContext = None, recorder: TrajectoryRecorder = None):
+
+    rng = policy_rng(env=env, rng=rng, algorithm='simulated_annealing')
     
     def energy(curr_value, next_value):
 
@@ -115,18 +136,32 @@ def simulated_annealing(env: MiniHackGoldRoom, value_function: Callable[[dict, d
         return np.exp(energy(curr_value=curr_value, next_value=next_value) / temperature(t))
     
     def selection_policy(values: List[float]) -> int:
-        indexes = [i for i, value in enumerate(values)]
-        return random.sample(population=indexes, k=1)[0]
+        return int(rng.integers(len(values)))
     
-    return online_search_f(env=env, value_function=value_function, max_steps=max_steps, selection_policy=selection_policy, prob_move=prob_move)
+    return online_search_f(env=env, value_function=value_function, max_steps=max_steps, selection_policy=selection_policy, prob_move=prob_move, rng=rng, context=context, recorder=recorder)
+
+def online_random_greedy_search(env: MiniHackGoldRoom, value_function: Callable[[dict, dict], float] = None, max_steps: int = 1000, prob_rand_move: float = 0.5, decay: float = 0, rng: Any = None, context: HeuristicContext = None, recorder: TrajectoryRecorder = None):
 
-def online_random_greedy_search(env: MiniHackGoldRoom, value_function: Callable[[dict, dict], float] = None, max_steps: int = 1000, prob_rand_move: float = 0.5, decay: float = 0):
+    rng = policy_rng(env=env, rng=rng, algorithm='online_random_greedy_search')
 
     def selection_policy(values: List[float]) -> int:
-        indexes = [i for i, value in enumerate(values)]
-        return random.sample(population=indexes, k=1)[0]
+        return int(rng.integers(len(values)))
     
     def prob_move(t, curr_value, next_value):
         return prob_rand_move * np.exp(-decay * t)
 
-    return online_search_f(env=env, value_function=value_function, max_steps=max_steps, selection_policy=selection_policy, prob_move=prob_move, greedy_alternative=True)
\ No newline at end of file
+    return online_search_f(env=env, value_function=value_function, max_steps=max_steps, selection_policy=selection_policy, prob_move=prob_move, greedy_alternative=True, rng=rng, context=context, recorder=recorder)
+
+# Reward of a what-if branch: the actions are applied from the current state of the environment, which is then
+# restored through its snapshot
+def rollout(env: MiniHackGoldRoom, actions: List[int]) -> Tuple[List[float], bool]:
+    token = env.snapshot()
+    rewards = []
+    done = False
+    for action in actions:
+        _, reward, done = env.mystep(action=action)
+        rewards.append(reward)
+        if done:
+            break
+    env.restore(token)
+    return rewards, done
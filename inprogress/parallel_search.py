@@ -0,0 +1,305 @@
+import heapq
+import math
+import multiprocessing as mp
+import os
+import queue
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Tuple
+from gold_room_env import MiniHackGoldRoom
+from distance_tables import PathTable, SUBPLAN_CACHE
+from planning import Plan, Node, State, StateSpace, successors, state_score, state_heuristic
+from utils import AllowedMovesFunction, AllowedSimpleMovesFunction, ALLOWED_SIMPLE_MOVES
+
+
+# Hash-distributed A* (Kishimoto, Fukunaga and Botea, 2009) over a pool of worker processes. Every state has an owner,
+# the worker hash((cell, gold mask)) % n_workers, which keeps its best g, its parent and its open entry: the children
+# generated by a worker are sent to their owners in batches, so duplicates are detected without any shared table.
+# Plans reaching the stair are reported to the main process, which broadcasts the best value as a bound that prunes
+# the open nodes of every worker. The search ends when all the workers are idle (no open node can beat the bound) and
+# no batch is in transit: two consecutive probe waves must find everybody idle with as many batches received as sent
+# and the same counters. The plan is then rebuilt asking each state of the path to its owner.
+#
+# g and h have the signatures of a_star_search and are sent to the workers, so they must be picklable (functions of a
+# module, functools.partial of them or instances like PatternDatabaseHeuristic, not lambdas).
+
+
+# Attributes of the env read by successors and by the default g and h: NLE environments cannot be sent to a process
+class PlanningRoom:
+
+    def __init__(self, env_dict: dict):
+        for name, value in env_dict.items():
+            setattr(self, name, value)
+
+
+def owner(cell: int, golds: int, n_workers: int) -> int:
+    return hash((cell, golds)) % n_workers
+
+
+def _hda_search(
+    worker_id: int,
+    n_workers: int,
+    room: PlanningRoom,
+    g: Callable[[State, State, float], float],
+    h: Callable[[State], float],
+    allowed_moves_function: AllowedMovesFunction,
+    batch_size: int,
+    expansions_per_round: int,
+    inboxes: list,
+    results: Any,
+    pending: list
+) -> None:
+
+    space = StateSpace(width=room.width, height=room.height, stair_coord=room.stair_coord, gold_coords=room.gold_coords)
+    path_table = PathTable(width=room.width, height=room.height, gold_coords=room.gold_coords, to_avoid=[room.stair_coord], cache=SUBPLAN_CACHE)
+    inbox = inboxes[worker_id]
+
+    # (cell, golds) -> (g, parent key, action) of the states owned by this worker
+    best: Dict[Tuple[int, int], Tuple[float, Tuple[int, int], List[int]]] = {}
+    open_list = []
+    outboxes = [[] for _ in range(n_workers)]
+    counters = {'bound': -math.inf, 'sent': 0, 'received': 0, 'expanded': 0, 'pushed': 0}
+
+    def insert(cell: int, golds: int, g_value: float, parent_key: Tuple[int, int], action: List[int]) -> None:
+        key = (cell, golds)
+        if key in best and best[key][0] >= g_value:
+            return
+        best[key] = (g_value, parent_key, action)
+        if cell == space.stair_cell:
+            if g_value > counters['bound']:
+                counters['bound'] = g_value
+                results.put(('solution', g_value, key))
+            return
+        f_value = g_value + h(state=State(space=space, cell=cell, golds=golds))
+        if f_value > counters['bound']:
+            heapq.heappush(open_list, (-f_value, counters['pushed'], g_value, key))
+            counters['pushed'] += 1
+
+    def flush(i: int) -> None:
+        if outboxes[i] != []:
+            inboxes[i].put(('nodes', outboxes[i]))
+            outboxes[i] = []
+            counters['sent'] += 1
+
+    # drops the outdated entries and those that cannot beat the bound
+    def has_work() -> bool:
+        while open_list != []:
+            f_value, _, g_value, key = open_list[0]
+            if best[key][0] == g_value and -f_value > counters['bound']:
+                return True
+            heapq.heappop(open_list)
+        return False
+
+    while True:
+        idle = not has_work()
+        while True:
+            try:
+                message = pending.pop(0) if pending != [] else inbox.get() if idle else inbox.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == 'nodes':
+                counters['received'] += 1
+                for entry in message[1]:
+                    insert(*entry)
+            elif message[0] == 'bound':
+                counters['bound'] = max(counters['bound'], message[1])
+            elif message[0] == 'probe':
+                results.put(('status', message[1], worker_id, not has_work(), counters['sent'], counters['received']))
+            elif message[0] == 'parent':
+                results.put(('parent', message[1], best[message[1]]))
+            elif message[0] == 'end':
+                results.put(('expanded', worker_id, counters['expanded']))
+                return
+            idle = not has_work()
+
+        for _ in range(expansions_per_round):
+            if not has_work():
+                break
+            _, _, g_value, key = heapq.heappop(open_list)
+            _, parent_key, action = best[key]
+            parent = None if parent_key == None else Node(state=State(space=space, cell=parent_key[0], golds=parent_key[1]))
+            node = Node(state=State(space=space, cell=key[0], golds=key[1]), g_value=g_value, parent=parent, action=action)
+            children, n_expanded_nodes = successors(env=room, node=node, space=space, g=g, allowed_moves_function=allowed_moves_function, path_table=path_table)
+            counters['expanded'] += 1 + n_expanded_nodes
+            for child in children:
+                entry = (child.state.cell, child.state.golds, child.g_value, key, child.action)
+                i = owner(cell=child.state.cell, golds=child.state.golds, n_workers=n_workers)
+                if i == worker_id:
+                    insert(*entry)
+                else:
+                    outboxes[i].append(entry)
+                    if len(outboxes[i]) >= batch_size:
+                        flush(i)
+        for i in range(n_workers):
+            flush(i)
+
+
+# The batches of the other workers can overtake the search command of the main process (the queues only keep the
+# order of each sender), so the messages received before it are kept for the search
+def _hda_worker(worker_id: int, n_workers: int, inboxes: list, results: Any) -> None:
+    pending = []
+    while True:
+        message = inboxes[worker_id].get()
+        if message[0] == 'close':
+            return
+        if message[0] == 'search':
+            _hda_search(worker_id, n_workers, *message[1:], inboxes=inboxes, results=results, pending=pending)
+            pending = []
+        else:
+            pending.append(message)
+
+
+# Worker processes kept alive between searches, so that a search does not pay for starting them
+class HdaStarPool:
+
+    def __init__(self, n_workers: int = None, start_method: str = 'spawn'):
+        self.n_workers = os.cpu_count() if n_workers == None else n_workers
+        if self.n_workers < 1:
+            raise ValueError(f'At least one worker is needed, not {self.n_workers}')
+        context = mp.get_context(start_method)
+        self.inboxes = [context.Queue() for _ in range(self.n_workers)]
+        self.results = context.Queue()
+        self.processes = []
+        for worker_id in range(self.n_workers):
+            process = context.Process(target=_hda_worker, args=(worker_id, self.n_workers, self.inboxes, self.results), daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def _broadcast(self, message: tuple) -> None:
+        for inbox in self.inboxes:
+            inbox.put(message)
+
+    # Next message of the workers, failing instead of waiting forever if one of them died
+    def _receive(self) -> tuple:
+        while True:
+            try:
+                return self.results.get(timeout=1)
+            except queue.Empty:
+                if not all([process.is_alive() for process in self.processes]):
+                    raise RuntimeError('A worker of the pool has stopped')
+
+    def search(
+        self,
+        env: MiniHackGoldRoom,
+        g: Callable[[State, State, float], float] = None,
+        h: Callable[[State], float] = None,
+        allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+        batch_size: int = 64,
+        expansions_per_round: int = 64
+    ) -> Tuple[Plan, int]:
+
+        start_time = time.perf_counter()
+
+        if not isinstance(allowed_moves_function, AllowedMovesFunction):
+            raise ValueError('Parameter allowed_moves_function must be of type AllowedMovesFunction')
+
+        if isinstance(allowed_moves_function, AllowedSimpleMovesFunction):
+            allowed_moves_function.width = env.width
+            allowed_moves_function.height = env.height
+
+        gold_score, stair_score, time_penalty = env.gold_score, env.stair_score, env.time_penalty
+
+        if g == None:
+            g = partial(state_score, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty)
+
+        if h == None:
+            h = partial(state_heuristic, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty)
+
+        _, init_g = env.myreset()
+        room = PlanningRoom(env_dict=env.to_dict())
+        space = StateSpace(width=env.width, height=env.height, stair_coord=env.stair_coord, gold_coords=env.gold_coords)
+        init_state = space.state(agent_coord=env.agent_coord, gold_coords=env.gold_coords)
+
+        self._broadcast(('search', room, g, h, allowed_moves_function, batch_size, expansions_per_round))
+        self.inboxes[owner(cell=init_state.cell, golds=init_state.golds, n_workers=self.n_workers)].put(('nodes', [(init_state.cell, init_state.golds, init_g, None, [])]))
+        n_sent = 1
+
+        bound = -math.inf
+        best_key = None
+        wave = 0
+        replies = {}
+        previous = None
+        self._broadcast(('probe', wave))
+        while True:
+            message = self._receive()
+            if message[0] == 'solution':
+                if message[1] > bound:
+                    bound, best_key = message[1], message[2]
+                    self._broadcast(('bound', bound))
+            elif message[0] == 'status' and message[1] == wave:
+                _, _, worker_id, idle, sent, received = message
+                replies[worker_id] = (idle, sent, received)
+                if len(replies) == self.n_workers:
+                    counters = tuple([replies[i] for i in range(self.n_workers)])
+                    quiet = all([idle for idle, _, _ in counters]) and n_sent + sum([sent for _, sent, _ in counters]) == sum([received for _, _, received in counters])
+                    if quiet and counters == previous:
+                        break
+                    previous = counters if quiet else None
+                    wave += 1
+                    replies = {}
+                    self._broadcast(('probe', wave))
+
+        plan = Plan()
+        key = best_key
+        while key != None:
+            self.inboxes[owner(cell=key[0], golds=key[1], n_workers=self.n_workers)].put(('parent', key))
+            message = self._receive()
+            while message[0] != 'parent':
+                message = self._receive()
+            _, parent_key, action = message[2]
+            plan.add_reverse(action=action, coords=space.coords[key[0]])
+            key = parent_key
+
+        self._broadcast(('end',))
+        expanded = [0] * self.n_workers
+        n_ended = 0
+        while n_ended < self.n_workers:
+            message = self._receive()
+            if message[0] == 'expanded':
+                expanded[message[1]] = message[2]
+                n_ended += 1
+
+        plan.outcome = {
+            'status': 'no_solution' if best_key == None else 'solved',
+            'limit': None,
+            'complete': best_key != None,
+            'seconds': time.perf_counter() - start_time
+        }
+        plan.parallel_stats = {
+            'workers': self.n_workers,
+            'expanded_per_worker': expanded,
+            'batches': n_sent + sum([sent for _, sent, _ in counters]),
+            'probe_waves': wave + 1
+        }
+        return plan, sum(expanded)
+
+    def close(self) -> None:
+        self._broadcast(('close',))
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# HDA* with the interface of a_star_search. Without a pool, one with n_workers processes (one per core by default) is
+# started for this search only.
+def hda_star_search(
+    env: MiniHackGoldRoom,
+    g: Callable[[State, State, float], float] = None,
+    h: Callable[[State], float] = None,
+    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+    n_workers: int = None,
+    batch_size: int = 64,
+    expansions_per_round: int = 64,
+    pool: HdaStarPool = None
+) -> Tuple[Plan, int]:
+
+    if pool != None:
+        return pool.search(env=env, g=g, h=h, allowed_moves_function=allowed_moves_function, batch_size=batch_size, expansions_per_round=expansions_per_round)
+    with HdaStarPool(n_workers=n_workers) as pool:
+        return pool.search(env=env, g=g, h=h, allowed_moves_function=allowed_moves_function, batch_size=batch_size, expansions_per_round=expansions_per_round)
@@ -0,0 +1,169 @@
+import math
+from typing import Callable, List, Tuple
+from gold_room_env import MiniHackGoldRoom
+from distance_tables import SubplanCache, SUBPLAN_CACHE, distance_field
+from planning import Plan, State, StateSpace, a_star_search
+from utils import AllowedMovesFunction, AllowedSimpleMovesFunction, ALLOWED_SIMPLE_MOVES
+
+
+# Pattern-database heuristic of a gold room, built on the grid distances of the room instead of the straight lines of
+# state_heuristic. A reverse Dijkstra per point of interest (stair and golds) gives the length of the shortest path from
+# every cell to it, avoiding the cells in to_avoid (and those of allowed_moves_function.to_avoid) and never crossing
+# the stair. The golds are split into patterns of at most pattern_size nearby golds, and for each pattern, cell and
+# subset of its golds still on the floor the table holds the exact best value of the plans that start from the cell,
+# collect some of those golds in any order and reach the stair.
+#
+# A plan collecting the golds S is at least as long as the shortest plan collecting the golds of S in one pattern, so
+# its value is at most gold_score for each gold outside the pattern plus the table value of the pattern. Every pattern
+# gives an upper bound and the heuristic is the smallest of them (and of state_heuristic on the grid distances): it is
+# admissible for the maximizing searches when time_penalty <= 0, and never looser than state_heuristic.
+class PatternDatabaseHeuristic:
+
+    def __init__(
+        self,
+        env: MiniHackGoldRoom,
+        allowed_moves_function: AllowedMovesFunction = None,
+        pattern_size: int = 3,
+        to_avoid: List[Tuple[int, int]] = []
+        ):
+
+        if pattern_size < 1:
+            raise ValueError(f'Parameter pattern_size must be positive, not {pattern_size}')
+
+        self.width = env.width
+        self.height = env.height
+        self.stair_coord = tuple(int(c) for c in env.stair_coord)
+        self.gold_coords = [tuple(int(c) for c in coord) for coord in env.gold_coords]
+        self.gold_score, self.stair_score, self.time_penalty = env.gold_score, env.stair_score, env.time_penalty
+        self.stair_cell = self.cell(self.stair_coord)
+
+        to_avoid = [tuple(coord) for coord in to_avoid]
+        if isinstance(allowed_moves_function, AllowedSimpleMovesFunction):
+            to_avoid += [tuple(coord) for coord in allowed_moves_function.to_avoid]
+        self.to_avoid = to_avoid
+
+        self.stair_field = distance_field(width=self.width, height=self.height, target=self.stair_coord, to_avoid=to_avoid)
+        self.gold_fields = [
+            distance_field(width=self.width, height=self.height, target=coord, to_avoid=to_avoid, blocked=[self.stair_coord])
+            for coord in self.gold_coords
+        ]
+        # shortest path from each gold to the stair
+        self.gold_stair_dists = [self.stair_field[self.cell(coord)] for coord in self.gold_coords]
+
+        # the gold on the stair is collected by every plan, so it is not part of any pattern
+        self.patterns = self._patterns(golds=[i for i, coord in enumerate(self.gold_coords) if coord != self.stair_coord], pattern_size=pattern_size)
+        self.tables = [self._table(pattern=pattern) for pattern in self.patterns]
+        self.space = None
+
+    def cell(self, coord: Tuple[int, int]) -> int:
+        return int(coord[1]) * self.width + int(coord[0])
+
+    # time_penalty times the length, -inf for the unreachable targets (also when time_penalty is 0)
+    def _path_score(self, length: float) -> float:
+        return -math.inf if length == math.inf else self.time_penalty * length
+
+    # Greedy clustering: the gold farthest from the stair with its pattern_size - 1 nearest golds, and so on
+    def _patterns(self, golds: List[int], pattern_size: int) -> List[List[int]]:
+        patterns = []
+        remaining = list(golds)
+        while remaining != []:
+            seed = max(remaining, key=lambda i: self.gold_stair_dists[i])
+            remaining.remove(seed)
+            field = self.gold_fields[seed]
+            remaining.sort(key=lambda i: field[self.cell(self.gold_coords[i])])
+            patterns.append([seed] + remaining[:pattern_size - 1])
+            remaining = remaining[pattern_size - 1:]
+        return patterns
+
+    # For each cell, the best value of the plans from the cell collecting a subset of the golds in mask (bit j is
+    # pattern[j]) and ending on the stair, for every mask
+    def _table(self, pattern: List[int]) -> List[List[float]]:
+        n = len(pattern)
+        n_masks = 1 << n
+        dists = [[self.gold_fields[j][self.cell(self.gold_coords[i])] for j in pattern] for i in pattern]
+
+        # shortest path from pattern[i] that collects all the golds of mask (which contains i) and reaches the stair
+        tails = [[math.inf] * n for _ in range(n_masks)]
+        for mask in range(1, n_masks):
+            for i in range(n):
+                if not mask >> i & 1:
+                    continue
+                rest = mask & ~(1 << i)
+                if rest == 0:
+                    tails[mask][i] = self.gold_stair_dists[pattern[i]]
+                else:
+                    tails[mask][i] = min([dists[i][j] + tails[rest][j] for j in range(n) if rest >> j & 1])
+
+        table = []
+        for cell in range(self.width * self.height):
+            values = [self._path_score(self.stair_field[cell])] + [0.0] * (n_masks - 1)
+            for mask in range(1, n_masks):
+                length = min([self.gold_fields[pattern[i]][cell] + tails[mask][i] for i in range(n) if mask >> i & 1])
+                value = self.gold_score * bin(mask).count('1') + self._path_score(length)
+                # best over the subsets of mask, which are all smaller than mask
+                for i in range(n):
+                    if mask >> i & 1:
+                        value = max(value, values[mask & ~(1 << i)])
+                values[mask] = value
+            table.append(values)
+        return table
+
+    # The states must come from a StateSpace of the same room, with the golds in the order of env.gold_coords
+    def _check_space(self, space: StateSpace) -> None:
+        if (space.width, space.height, space.stair_coord, space.gold_coords) != (self.width, self.height, self.stair_coord, self.gold_coords):
+            raise ValueError('The state space does not describe the room of the pattern database')
+        self.space = space
+
+    def __call__(self, state: State) -> float:
+        space = state.space
+        if space is not self.space:
+            self._check_space(space=space)
+        cell = state.cell
+        if cell == self.stair_cell:
+            return 0
+        stair_bits = space.cell_bits[self.stair_cell]
+        collected_on_stair = self.stair_score + self.gold_score * (state.golds & stair_bits != 0)
+        golds = state.golds & ~space.cell_bits[cell] & ~stair_bits
+        stair_score = self._path_score(self.stair_field[cell])
+        if golds == 0:
+            return stair_score + collected_on_stair
+        n_golds = bin(golds).count('1')
+
+        # state_heuristic with the grid distances
+        min_path_length = min([self.gold_fields[i][cell] + self.gold_stair_dists[i] for i in range(len(self.gold_coords)) if golds >> i & 1])
+        bound = max(stair_score, self.gold_score * n_golds + self._path_score(min_path_length))
+
+        for pattern, table in zip(self.patterns, self.tables):
+            mask = 0
+            n_pattern_golds = 0
+            for j, i in enumerate(pattern):
+                if golds >> i & 1:
+                    mask |= 1 << j
+                    n_pattern_golds += 1
+            if mask != 0:
+                bound = min(bound, self.gold_score * (n_golds - n_pattern_golds) + table[cell][mask])
+        return bound + collected_on_stair
+
+
+# a_star_search with the PatternDatabaseHeuristic of env (built for every call, as the heuristic depends on the room).
+# The heuristic is built after a reset, so that it describes the same golds of the state space of the search and not
+# the ones left by a previous episode.
+def pattern_database_search(
+    env: MiniHackGoldRoom,
+    g: Callable[[State, State, float], float] = None,
+    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+    pattern_size: int = 3,
+    subplan_cache: SubplanCache = SUBPLAN_CACHE,
+    heuristic_cache_size: int = None,
+    max_expansions: int = None,
+    max_seconds: float = None,
+    max_frontier: int = None
+) -> Tuple[Plan, int]:
+
+    env.myreset()
+    h = PatternDatabaseHeuristic(env=env, allowed_moves_function=allowed_moves_function, pattern_size=pattern_size)
+    return a_star_search(
+        env=env, g=g, h=h, allowed_moves_function=allowed_moves_function, subplan_cache=subplan_cache,
+        heuristic_cache_size=heuristic_cache_size, max_expansions=max_expansions, max_seconds=max_seconds,
+        max_frontier=max_frontier
+    )
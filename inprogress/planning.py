@@ -1,15 +1,28 @@
-import random
+import heapq
+import math
+import time
 import numpy as np
-from queue import PriorityQueue
 from gold_room_env import MiniHackGoldRoom
-from utils import action_to_string, action_to_move, move_to_action, allowed_moves, is_composite, AllowedMovesFunction, AllowedSimpleMovesFunction, ALLOWED_SIMPLE_MOVES, default_heuristic, default_score
-from typing import Callable, Tuple, List
+from distance_tables import PathTable, SubplanCache, SUBPLAN_CACHE
+from trajectory import record_step, TrajectoryRecorder
+from utils import action_to_string, action_to_move, move_to_action, policy_rng, allowed_moves, is_composite, HeuristicContext, MemoizedHeuristic, AllowedMovesFunction, AllowedSimpleMovesFunction, JumpPointMovesFunction, ALLOWED_SIMPLE_MOVES
+from typing import Any, Callable, Tuple, List
 import gym
 
 class Plan:
     def __init__(self):
         self.path = []
         self.action_sequence = []
+        # stats of the MemoizedHeuristic of the search, if it used one
+        self.heuristic_stats = None
+        # weight and bound of the plan returned by anytime_a_star_search
+        self.anytime_stats = None
+        # peak nodes and re-expansions of the searches of memory_bounded_search.py
+        self.memory_stats = None
+        # how the search of a_star_search ended: 'solved', 'limit_hit' or 'no_solution'
+        self.outcome = None
+        # workers, expansions per worker and batches exchanged by hda_star_search
+        self.parallel_stats = None
     
     def add_reverse(self, action: List[int], coords: Tuple[int, int]) -> None:
         self.action_sequence = action + self.action_sequence
@@ -31,35 +44,116 @@ class Plan:
     def stats(self, env: MiniHackGoldRoom) -> dict:
         total_score = sum([np.linalg.norm(action_to_move(action)) * env.time_penalty for action in self.action_sequence]) + env.gold_score * len([coord for coord in env.gold_coords if coord in self.path])
         total_score = round(total_score, 3)
-        return {
+        stats = {
             'path_len': len(self.path),
             'score': total_score
         }
+        if self.heuristic_stats != None:
+            stats['heuristic_cache'] = self.heuristic_stats
+        if self.anytime_stats != None:
+            stats['anytime'] = self.anytime_stats
+        if self.memory_stats != None:
+            stats['memory'] = self.memory_stats
+        if self.outcome != None:
+            stats['outcome'] = self.outcome
+        if self.parallel_stats != None:
+            stats['parallel'] = self.parallel_stats
+        return stats
+
+
+
+# Geometry shared by all the states of a search: cells are indexed as y * width + x and the golds of a state are a
+# bitmask over gold_coords (bit i is gold_coords[i]). Euclidean distances to the stair and to each gold are
+# precomputed for every cell, or taken from the HeuristicContext of the env when it describes the same room.
+class StateSpace:
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        stair_coord: Tuple[int, int],
+        gold_coords: List[Tuple[int, int]],
+        context: HeuristicContext = None
+        ):
+
+        self.width = width
+        self.height = height
+        self.stair_coord = tuple(stair_coord)
+        self.gold_coords = [tuple(coord) for coord in gold_coords]
+        self.coords = [(x, y) for y in range(height) for x in range(width)]
+        self.stair_cell = self.cell(self.stair_coord)
+
+        # bit of the gold lying on each cell (0 if there is none)
+        self.cell_bits = [0] * len(self.coords)
+        for i, coord in enumerate(self.gold_coords):
+            self.cell_bits[self.cell(coord)] |= 1 << i
+        self.all_golds = (1 << len(self.gold_coords)) - 1
+
+        if context != None and (context.width, context.height, context.stair_coord, context.gold_coords) == (width, height, self.stair_coord, self.gold_coords):
+            self.stair_dists = context.stair_dists
+            self.gold_dists = context.gold_dists
+            self.gold_stair_dists = context.gold_stair_dists
+        else:
+            self.stair_dists = [self.distance(coord, self.stair_coord) for coord in self.coords]
+            self.gold_dists = [[self.distance(coord, gold_coord) for coord in self.coords] for gold_coord in self.gold_coords]
+            self.gold_stair_dists = [self.distance(gold_coord, self.stair_coord) for gold_coord in self.gold_coords]
+
+    # same value of np.linalg.norm on the difference of the coordinates
+    def distance(self, a: Tuple[int, int], b: Tuple[int, int]) -> float:
+        return math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
+
+    def cell(self, coord: Tuple[int, int]) -> int:
+        return int(coord[1]) * self.width + int(coord[0])
+
+    def mask(self, gold_coords: List[Tuple[int, int]]) -> int:
+        mask = 0
+        for coord in gold_coords:
+            mask |= self.cell_bits[self.cell(coord)]
+        return mask
+
+    def golds(self, mask: int) -> List[Tuple[int, int]]:
+        return [coord for i, coord in enumerate(self.gold_coords) if mask >> i & 1]
+
+    def state(self, agent_coord: Tuple[int, int], gold_coords: List[Tuple[int, int]]) -> 'State':
+        return State(space=self, cell=self.cell(agent_coord), golds=self.mask(gold_coords))
 
 
-    
 class State:
+    __slots__ = ('space', 'cell', 'golds', 'hash')
+
     def __init__(
         self,
-        agent_coord: Tuple[int, int],
-        stair_coord: Tuple[int, int],
-        gold_coords: List[Tuple[int, int]]
+        space: StateSpace,
+        cell: int,
+        golds: int
         ):
 
-        self.agent_coord = agent_coord
-        self.gold_coords = gold_coords
-        self.stair_coord = stair_coord
+        self.space = space
+        self.cell = cell
+        self.golds = golds
+        self.hash = hash((cell, golds, space.stair_cell))
+
+    @property
+    def agent_coord(self) -> Tuple[int, int]:
+        return self.space.coords[self.cell]
+
+    @property
+    def stair_coord(self) -> Tuple[int, int]:
+        return self.space.stair_coord
+
+    @property
+    def gold_coords(self) -> List[Tuple[int, int]]:
+        return self.space.golds(self.golds)
 
     def __eq__(self, other) -> bool:
         if isinstance(other, State):
-            return self.agent_coord == other.agent_coord and self.gold_coords == other.gold_coords and self.stair_coord == other.stair_coord
+            return self.cell == other.cell and self.golds == other.golds and self.space.stair_cell == other.space.stair_cell
         return False
 
     def __ne__(self, other) -> bool:
         return not self.__eq__(other)
     
     def __hash__(self):
-        return hash((self.agent_coord, tuple(self.gold_coords), self.stair_coord))
+        return self.hash
     
     def to_dict(self) -> dict:
         return {
@@ -70,6 +164,42 @@ class State:
             }
 
 
+# default_score and default_heuristic of utils.py computed on the compact states, without converting them to dicts
+
+def state_score(next_state: State, curr_state: State, curr_g: float, gold_score: float, stair_score: float, time_penalty: float) -> float:
+    space = next_state.space
+    score = curr_g + gold_score * (next_state.golds & space.cell_bits[next_state.cell] != 0)
+    if curr_state == None:
+        return score
+    return score + \
+        stair_score * (next_state.cell == space.stair_cell) + \
+        time_penalty * space.distance(space.coords[next_state.cell], space.coords[curr_state.cell])
+
+
+def state_heuristic(state: State, gold_score: float, stair_score: float, time_penalty: float) -> float:
+    space = state.space
+    agent_stair_dist = space.stair_dists[state.cell]
+    if agent_stair_dist == 0:
+        return 0
+    stair_bits = space.cell_bits[space.stair_cell]
+    gold_in_stair = (state.golds & stair_bits != 0)
+    strategy1_score = time_penalty * agent_stair_dist + stair_score + gold_score * gold_in_stair
+    actual_golds = state.golds & ~space.cell_bits[state.cell] & ~stair_bits
+    if actual_golds == 0:
+        return strategy1_score
+    n_golds = 0
+    min_path_length = math.inf
+    i = 0
+    while actual_golds:
+        if actual_golds & 1:
+            n_golds += 1
+            min_path_length = min(min_path_length, space.gold_dists[i][state.cell] + space.gold_stair_dists[i])
+        actual_golds >>= 1
+        i += 1
+    strategy2_score = time_penalty * min_path_length + gold_score * n_golds + stair_score + gold_score * gold_in_stair
+    return max([strategy1_score, strategy2_score])
+
+
 class Node:
     def __init__(
         self,
@@ -85,6 +215,8 @@ class Node:
         self.priority = priority
         self.parent = parent
         self.action = action
+        # number of actions from the root
+        self.depth = 0 if parent == None else parent.depth + len(action)
 
     def __eq__(self, other):
         if isinstance(other, Node):
@@ -101,13 +233,180 @@ class Node:
         return hash(self.state)
 
 
+# A tie breaker orders the nodes with the same priority: nodes with a smaller key are expanded first.
+class TieBreaker:
+
+    def __init__(self):
+        pass
+
+    def __call__(self, node: Node) -> float:
+        pass
+
+
+# Insertion order
+class FifoTieBreaker(TieBreaker):
+
+    def __call__(self, node: Node) -> float:
+        return 0
+
+
+# Deeper nodes first: among nodes with the same priority they are the closest to the stair
+class DeeperFirstTieBreaker(TieBreaker):
+
+    def __call__(self, node: Node) -> float:
+        return -node.depth
+
+
+# Higher score so far first
+class HigherGTieBreaker(TieBreaker):
+
+    def __call__(self, node: Node) -> float:
+        return -node.g_value
+
+
+DEEPER_FIRST = DeeperFirstTieBreaker()
+
+
+# Binary heap of (-priority, tie breaker key, insertion counter, node) entries: the counter makes the keys unique, so
+# nodes are never compared. Improving a node pushes it again and the older entries become stale: they are skipped when
+# popped instead of being searched for in the heap. Its length is the number of live entries (the states queued), not
+# the size of the heap.
+class Frontier:
+
+    def __init__(self, tie_breaker: TieBreaker = None):
+        self.heap = []
+        self.best = {}
+        self.queued = set()
+        self.counter = 0
+        self.n_stale = 0
+        self.tie_breaker = DEEPER_FIRST if tie_breaker == None else tie_breaker
+
+    def __len__(self) -> int:
+        return len(self.queued)
+
+    # True if the node is new or has a higher g value than the one already pushed for its state
+    def improves(self, node: Node) -> bool:
+        best = self.best.get(node)
+        return best == None or node.g_value > best.g_value
+
+    def push(self, node: Node) -> None:
+        self.best[node] = node
+        self.queued.add(node)
+        heapq.heappush(self.heap, (-node.priority, self.tie_breaker(node), self.counter, node))
+        self.counter += 1
+
+    # Next node to expand, None if the frontier is exhausted
+    def pop(self) -> Node:
+        while self.heap != []:
+            node = heapq.heappop(self.heap)[-1]
+            if self.best[node] is node:
+                self.queued.discard(node)
+                return node
+            self.n_stale += 1
+        return None
+
+
+# Children of node with their g values (priorities are left to the search), and the number of cells expanded by the
+# PathTable to find their sub-paths. Composite moves towards a cell whose state without the golds of the sub-path is in
+# closed are skipped before looking the sub-path up. The moves of a JumpPointMovesFunction are runs of one action.
+def successors(
+    env: MiniHackGoldRoom,
+    node: Node,
+    space: StateSpace,
+    g: Callable[[State, State, float], float],
+    allowed_moves_function: AllowedMovesFunction,
+    path_table: PathTable,
+    closed: set = None
+) -> Tuple[List[Node], int]:
+
+    children = []
+    additional_expanded_nodes = 0
+
+    jump_points = isinstance(allowed_moves_function, JumpPointMovesFunction)
+    if jump_points:
+        # the runs are pruned on the direction of the last step, unless a gold was just collected (or at the root)
+        direction = None
+        if node.parent != None and node.parent.state.golds & space.cell_bits[node.state.cell] == 0:
+            direction = tuple(int(c) for c in action_to_move(node.action[-1]))
+        moves = allowed_moves_function(state=node.state.to_dict(), direction=direction)
+    else:
+        moves = allowed_moves_function(state=node.state.to_dict())
+    x, y = node.state.agent_coord
+    reachable_points = [(x + int(move[0]), y + int(move[1])) for move in moves]
+    actual_golds = node.state.golds & ~space.cell_bits[node.state.cell]
+
+    for move, point in zip(moves, reachable_points):
+        if jump_points:
+            # a run of identical steps, which crosses no gold still on the floor
+            n_steps = max(abs(int(move[0])), abs(int(move[1])))
+            reachable_state = State(space=space, cell=space.cell(point), golds=actual_golds)
+
+            children.append(Node(
+                state = reachable_state,
+                g_value = g(next_state=reachable_state, curr_state=node.state, curr_g=node.g_value),
+                parent = node,
+                action = [move_to_action(np.sign(move))] * n_steps
+            ))
+
+        elif is_composite(move):
+
+            if closed != None and Node(state=State(space=space, cell=space.cell(point), golds=actual_golds)) in closed:
+                continue
+
+            # the sub-path is a lookup in the table: the stair is avoided unless it is the destination
+            entry, n_expanded_nodes = path_table.lookup(source=node.state.agent_coord, target=point)
+            additional_expanded_nodes += n_expanded_nodes
+            if entry == None:
+                continue
+
+            in_stair = (point == env.stair_coord)
+
+            intersection = actual_golds & space.mask(entry['golds'])
+
+            reachable_state_golds = (actual_golds & ~intersection) | (actual_golds & space.cell_bits[space.cell(point)])
+
+            path_score = node.g_value + env.gold_score * bin(intersection).count('1') + env.stair_score * in_stair
+
+            for a in entry['actions']:
+                path_score += (np.linalg.norm(action_to_move(a)) * env.time_penalty)
+
+            children.append(Node(
+                state = State(space=space, cell=space.cell(point), golds=reachable_state_golds),
+                g_value = path_score,
+                parent = node,
+                action = entry['actions']
+            ))
+
+        else:
+            reachable_state = State(space=space, cell=space.cell(point), golds=actual_golds)
+
+            children.append(Node(
+                state = reachable_state,
+                g_value = g(next_state=reachable_state, curr_state=node.state, curr_g=node.g_value),
+                parent = node,
+                action = [move_to_action(move)]
+            ))
+
+    return children, additional_expanded_nodes
+
+
 def a_star_search(
     env: MiniHackGoldRoom,
     g: Callable[[dict, dict, dict, float], float] = None,
     h: Callable[[dict, dict], float] = None,
-    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES
+    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+    tie_breaker: TieBreaker = None,
+    frontier: Frontier = None,
+    subplan_cache: SubplanCache = SUBPLAN_CACHE,
+    context: HeuristicContext = None,
+    heuristic_cache_size: int = None,
+    max_expansions: int = None,
+    max_seconds: float = None,
+    max_frontier: int = None
 ) -> Tuple[Plan, int]:
 
+    start_time = time.perf_counter()
+
     if not isinstance(allowed_moves_function, AllowedMovesFunction):
         raise ValueError('Parameter allowed_moves_function must be of type AllowedMovesFunction')
     
@@ -115,19 +414,25 @@ def a_star_search(
         allowed_moves_function.width = env.width
         allowed_moves_function.height = env.height
     
+    gold_score, stair_score, time_penalty = env.gold_score, env.stair_score, env.time_penalty
+
     if g == None:
-        g = lambda next_state, curr_state, curr_g: default_score(next_state=next_state.to_dict(), curr_state=curr_state.to_dict(), env=env.to_dict(), curr_g=curr_g)
+        g = lambda next_state, curr_state, curr_g: state_score(next_state=next_state, curr_state=curr_state, curr_g=curr_g, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty)
 
     if h == None: 
-        h = lambda state: default_heuristic(state=state.to_dict(), env=env.to_dict())
+        h = lambda state: state_heuristic(state=state, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty)
+
+    # h (default or custom) is memoized on (cell, gold mask) when a cache size is given
+    if heuristic_cache_size != None:
+        h = MemoizedHeuristic(h=h, maxsize=heuristic_cache_size)
 
     _, init_g = env.myreset()
 
-    init_state = State(
-        agent_coord=env.agent_coord,
-        gold_coords=env.gold_coords,
-        stair_coord=env.stair_coord
-    )
+    space = StateSpace(width=env.width, height=env.height, stair_coord=env.stair_coord, gold_coords=env.gold_coords, context=context)
+    init_state = space.state(agent_coord=env.agent_coord, gold_coords=env.gold_coords)
+
+    # shortest paths between points of interest for the composite moves, computed on demand
+    path_table = PathTable(width=env.width, height=env.height, gold_coords=env.gold_coords, to_avoid=[env.stair_coord], cache=subplan_cache)
 
     init_node = Node(
         state = init_state,
@@ -138,186 +443,398 @@ def a_star_search(
     )
 
     expanded_nodes = set()
-    nodes_queue = PriorityQueue()
-    nodes_queue.put(init_node)
-
-    support_dict = {}
-    support_dict[init_node] = init_g
+    if frontier == None:
+        frontier = Frontier(tie_breaker=tie_breaker)
+    frontier.push(init_node)
 
     additional_expanded_nodes = 0
 
-    while not nodes_queue.empty():
-        node = nodes_queue.get()
+    # when the search does not reach the stair, the plan is the best one pushed to the stair if any, otherwise the
+    # path to the expanded node with the highest g
+    final_node = None
+    best_goal = None
+    best_partial = init_node
+    limit = None
+
+    while True:
+        if max_expansions != None and len(expanded_nodes) + additional_expanded_nodes >= max_expansions:
+            limit = 'max_expansions'
+        elif max_seconds != None and time.perf_counter() - start_time >= max_seconds:
+            limit = 'max_seconds'
+        elif max_frontier != None and len(frontier) > max_frontier:
+            limit = 'max_frontier'
+        if limit != None:
+            break
+
+        node = frontier.pop()
+        if node == None:
+            break
+        if node in expanded_nodes:
+            continue
         expanded_nodes.add(node)
-        stair_reached = (node.state.agent_coord == node.state.stair_coord)
+        stair_reached = (node.state.cell == space.stair_cell)
         if stair_reached:
             final_node = node
             break
+        if node.g_value > best_partial.g_value:
+            best_partial = node
 
-        moves = allowed_moves_function(state=node.state.to_dict())
-        reachable_points = [tuple(np.array(node.state.agent_coord) + move) for move in moves]
-        actual_golds = [gold_coords for gold_coords in node.state.gold_coords if gold_coords != node.state.agent_coord]
-
-        for move, point in zip(moves, reachable_points):
-            if is_composite(move):
-                
-                reachable_state = State(
-                    agent_coord=tuple(point),
-                    gold_coords=actual_golds,
-                    stair_coord=env.stair_coord
-                )
-
-                reachable_node = Node(
-                    state = reachable_state,
-                    g_value = g(next_state=reachable_state, curr_state=node.state, curr_g=node.g_value),
-                    priority = g(next_state=reachable_state, curr_state=node.state, curr_g=node.g_value) + h(state=reachable_state),
-                    parent = node
-                )
-                
-                if reachable_node not in expanded_nodes:
-
-                    env2 = gym.make(
-                        'MiniHack-MyTask-Custom-v0',
-                        width=env.width,
-                        height=env.height,
-                        n_leps=0,
-                        max_episode_steps=env.max_episode_steps,
-                        stair_score=env.gold_score,
-                        stair_coord=tuple(point),
-                        agent_coord=node.state.agent_coord,
-                        time_penalty=env.time_penalty
-                        )
-
-                    in_stair = (env2.stair_coord == env.stair_coord)
-                    if in_stair:
-                        to_avoid = []
-                    else:
-                        to_avoid = [env.stair_coord]
-                    
-                    sub_allowed_moves_function = AllowedSimpleMovesFunction(
-                        width=env2.width,
-                        height=env2.height,
-                        to_avoid=to_avoid
-                    )
-                    
-                    subplan, n_expanded_nodes = a_star_search(
-                        env=env2,
-                        allowed_moves_function=sub_allowed_moves_function,
-                        g=g,
-                        h=h
-                        )
-
-                    additional_expanded_nodes += n_expanded_nodes
-
-                    intersection = [gold for gold in actual_golds if gold in subplan.path]
-
-                    reachable_state_golds = [gold for gold in actual_golds if gold not in intersection or gold == tuple(point)]
-
-                    path_score = node.g_value + env.gold_score * len(intersection) + env.stair_score * in_stair
-
-                    for a in subplan.action_sequence:
-                        path_score += (np.linalg.norm(action_to_move(a)) * env.time_penalty)
-
-                    reachable_state = State(
-                        agent_coord=tuple(point),
-                        gold_coords=reachable_state_golds,
-                        stair_coord=env.stair_coord
-                    )   
-
-                    reachable_node = Node(
-                        state = reachable_state,
-                        g_value = path_score,
-                        parent = node,
-                        action = subplan.action_sequence
-                    )
-
-                    if reachable_node not in expanded_nodes:
-                        if reachable_node not in support_dict.keys() or (reachable_node in support_dict.keys() and reachable_node.g_value > support_dict[reachable_node]):
-                            reachable_node.priority = reachable_node.g_value + h(state=reachable_state)
-                            nodes_queue.put(reachable_node)
-                            support_dict[reachable_node] = reachable_node.g_value
-
-            else:
-                reachable_state = State(
-                    agent_coord=tuple(point),
-                    gold_coords=actual_golds,
-                    stair_coord=env.stair_coord
-                )
-
-                reachable_node = Node(
-                    state = reachable_state,
-                    g_value = g(next_state=reachable_state, curr_state=node.state, curr_g=node.g_value),
-                    parent = node,
-                    action = [move_to_action(move)]
-                )
-
-                if reachable_node not in expanded_nodes:
-                    if reachable_node not in support_dict.keys() or (reachable_node in support_dict.keys() and reachable_node.g_value > support_dict[reachable_node]):
-                            reachable_node.priority = reachable_node.g_value + h(state=reachable_state)
-                            nodes_queue.put(reachable_node)
-                            support_dict[reachable_node] = reachable_node.g_value
+        children, n_expanded_nodes = successors(env=env, node=node, space=space, g=g, allowed_moves_function=allowed_moves_function, path_table=path_table, closed=expanded_nodes)
+        additional_expanded_nodes += n_expanded_nodes
+
+        for reachable_node in children:
+            if reachable_node not in expanded_nodes and frontier.improves(reachable_node):
+                reachable_node.priority = reachable_node.g_value + h(state=reachable_node.state)
+                frontier.push(reachable_node)
+                if reachable_node.state.cell == space.stair_cell and (best_goal == None or reachable_node.g_value > best_goal.g_value):
+                    best_goal = reachable_node
+
+    if final_node != None:
+        status = 'solved'
+    else:
+        status = 'limit_hit' if limit != None else 'no_solution'
+        final_node = best_partial if best_goal == None else best_goal
 
     plan = Plan()
+    plan.outcome = {
+        'status': status,
+        'limit': limit,
+        'complete': final_node.state.cell == space.stair_cell,
+        'seconds': time.perf_counter() - start_time
+    }
     node = final_node
     while node != None:
         plan.add_reverse(action=node.action, coords=node.state.agent_coord)
         node = node.parent
 
+    if isinstance(h, MemoizedHeuristic):
+        plan.heuristic_stats = h.stats()
+
     return plan, len(expanded_nodes) + additional_expanded_nodes
 
 
 def weighted_a_star_search(
     env: MiniHackGoldRoom,
     w: float,
-    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES
+    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+    context: HeuristicContext = None,
+    heuristic_cache_size: int = None,
+    max_expansions: int = None,
+    max_seconds: float = None,
+    max_frontier: int = None
 ) -> Tuple[Plan, int]:
     
-    h = lambda state: w*default_heuristic(state=state.to_dict(), env=env.to_dict())
+    h = lambda state: w*state_heuristic(state=state, gold_score=env.gold_score, stair_score=env.stair_score, time_penalty=env.time_penalty)
+
+    return a_star_search(env=env, h=h, allowed_moves_function=allowed_moves_function, context=context, heuristic_cache_size=heuristic_cache_size, max_expansions=max_expansions, max_seconds=max_seconds, max_frontier=max_frontier)
+
+
+# Anytime weighted A* (ARA*). The weight is applied to the cost view of the problem: with K(n) the gold and stair
+# scores collected by n and C the total score available, g_c = K - g is the time penalty paid so far and h_c = C - K - h
+# the admissible estimate of the time penalty and of the scores still to be missed, so nodes are ordered by
+# g_c + w * h_c, i.e. by g + w * h + (w - 1) * K (w * h alone, as in weighted_a_star_search, would delay every gold).
+# A first search with a high w gives a plan quickly, then w is lowered by w_step down to w_final and the search goes on
+# from the nodes generated so far instead of restarting: nodes improved after their expansion are kept aside (incons)
+# and pushed back with the open ones when w changes. The search stops when w_final has been completed, or when the
+# wall-clock budget (max_seconds) or the expansion budget runs out, and returns the best plan found. The budgets hold
+# from the start: if they run out before a plan is found, or if the stair cannot be reached, the plan is the path to
+# the expanded node with the highest g, and plan.outcome is the one of a_star_search (limit_hit when a budget stopped
+# the search, even with a plan). Its anytime_stats hold the weight of the last search, for which
+# C - g <= w * (C - optimal g) once completed, and an upper bound of the optimal g (max g + h over the open and incons
+# nodes, with the admissible default h); g_value and gap are None without a plan.
+def anytime_a_star_search(
+    env: MiniHackGoldRoom,
+    w_start: float = 5.0,
+    w_step: float = 1.0,
+    w_final: float = 1.0,
+    max_seconds: float = None,
+    max_expansions: int = None,
+    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+    h: Callable[[State], float] = None,
+    tie_breaker: TieBreaker = None,
+    subplan_cache: SubplanCache = SUBPLAN_CACHE,
+    context: HeuristicContext = None
+) -> Tuple[Plan, int]:
+
+    if not isinstance(allowed_moves_function, AllowedMovesFunction):
+        raise ValueError('Parameter allowed_moves_function must be of type AllowedMovesFunction')
+    if w_start < w_final or w_step <= 0:
+        raise ValueError(f'Invalid weights w_start = {w_start}, w_step = {w_step}, w_final = {w_final}')
+
+    if isinstance(allowed_moves_function, AllowedSimpleMovesFunction):
+        allowed_moves_function.width = env.width
+        allowed_moves_function.height = env.height
+
+    start_time = time.perf_counter()
+    gold_score, stair_score, time_penalty = env.gold_score, env.stair_score, env.time_penalty
+    g = lambda next_state, curr_state, curr_g: state_score(next_state=next_state, curr_state=curr_state, curr_g=curr_g, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty)
+    if h == None:
+        h = lambda state: state_heuristic(state=state, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty)
 
-    return a_star_search(env=env, h=h, allowed_moves_function=allowed_moves_function)
+    _, init_g = env.myreset()
+    space = StateSpace(width=env.width, height=env.height, stair_coord=env.stair_coord, gold_coords=env.gold_coords, context=context)
+    path_table = PathTable(width=env.width, height=env.height, gold_coords=env.gold_coords, to_avoid=[env.stair_coord], cache=subplan_cache)
+    init_node = Node(state=space.state(agent_coord=env.agent_coord, gold_coords=env.gold_coords), g_value=init_g, action=[])
+
+    # best node found for each state, across the searches
+    nodes = {init_node: init_node}
+    h_values = {}
+    def h_value(node: Node) -> float:
+        if node.state not in h_values:
+            h_values[node.state] = h(state=node.state)
+        return h_values[node.state]
+
+    # g + w * h + (w - 1) * K, K up to a constant
+    n_golds = len(space.gold_coords)
+    def priority(node: Node) -> float:
+        state = node.state
+        collected = gold_score * (n_golds - bin(state.golds & ~space.cell_bits[state.cell]).count('1')) + stair_score * (state.cell == space.stair_cell)
+        return node.g_value + w * h_value(node) + (w - 1) * collected
+
+    w = w_start
+    open_nodes = [init_node]
+    incons = []
+    incumbent = init_node if init_node.state.cell == space.stair_cell else None
+    best_partial = init_node
+    n_expanded = 0
+    iterations = []
+    limit = None
+
+    while True:
+        frontier = Frontier(tie_breaker=tie_breaker)
+        for node in open_nodes + incons:
+            if nodes[node] is node and frontier.best.get(node) is not node:
+                node.priority = priority(node)
+                frontier.push(node)
+        closed = set()
+        incons = []
+
+        while True:
+            if max_expansions != None and n_expanded >= max_expansions:
+                limit = 'max_expansions'
+            elif max_seconds != None and time.perf_counter() - start_time >= max_seconds:
+                limit = 'max_seconds'
+            if limit != None:
+                break
+            node = frontier.pop()
+            if node == None:
+                break
+            if incumbent != None and node.priority <= priority(incumbent):
+                frontier.push(node)
+                break
+            closed.add(node)
+            n_expanded += 1
+            if node.g_value > best_partial.g_value:
+                best_partial = node
+
+            children, n_expanded_nodes = successors(env=env, node=node, space=space, g=g, allowed_moves_function=allowed_moves_function, path_table=path_table)
+            n_expanded += n_expanded_nodes
+            for child in children:
+                best = nodes.get(child)
+                if best != None and child.g_value <= best.g_value:
+                    continue
+                nodes[child] = child
+                # the stair ends the episode: its nodes are plans, not nodes to expand
+                if child.state.cell == space.stair_cell:
+                    if incumbent == None or child.g_value > incumbent.g_value:
+                        incumbent = child
+                elif child in closed:
+                    incons.append(child)
+                else:
+                    child.priority = priority(child)
+                    frontier.push(child)
+
+        open_nodes = [entry[-1] for entry in frontier.heap if frontier.best[entry[-1]] is entry[-1]]
+        g_value = None if incumbent == None else float(incumbent.g_value)
+        upper_bound = max(([] if incumbent == None else [incumbent.g_value]) + [node.g_value + h_value(node) for node in open_nodes + incons if nodes[node] is node], default=-math.inf)
+        iterations.append({'w': w, 'time': time.perf_counter() - start_time, 'expanded_nodes': n_expanded, 'g_value': g_value, 'upper_bound': float(upper_bound)})
+
+        # without a plan the frontier is exhausted (no w can find one) or a budget ran out
+        if limit != None or incumbent == None or w <= w_final or upper_bound <= incumbent.g_value:
+            break
+        w = max(w - w_step, w_final)
+
+    if limit != None:
+        status = 'limit_hit'
+    else:
+        status = 'solved' if incumbent != None else 'no_solution'
+
+    plan = Plan()
+    plan.outcome = {
+        'status': status,
+        'limit': limit,
+        'complete': incumbent != None,
+        'seconds': time.perf_counter() - start_time
+    }
+    node = incumbent if incumbent != None else best_partial
+    while node != None:
+        plan.add_reverse(action=node.action, coords=node.state.agent_coord)
+        node = node.parent
+    plan.anytime_stats = {
+        'w': w,
+        'upper_bound': float(upper_bound),
+        'g_value': g_value,
+        'gap': None if incumbent == None else float(upper_bound - incumbent.g_value),
+        'completed': limit == None,
+        'iterations': iterations
+    }
+
+    return plan, n_expanded
 
 
 def uniform_cost_search(
     env: MiniHackGoldRoom,
-    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES
+    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+    context: HeuristicContext = None,
+    heuristic_cache_size: int = None,
+    max_expansions: int = None,
+    max_seconds: float = None,
+    max_frontier: int = None
 ) -> Tuple[Plan, int]:
 
-    return a_star_search(env=env, h=(lambda state: 0), allowed_moves_function=allowed_moves_function)
+    return a_star_search(env=env, h=(lambda state: 0), allowed_moves_function=allowed_moves_function, context=context, heuristic_cache_size=heuristic_cache_size, max_expansions=max_expansions, max_seconds=max_seconds, max_frontier=max_frontier)
 
 
 def greedy_search(
     env: MiniHackGoldRoom,
-    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES
+    allowed_moves_function: AllowedMovesFunction = ALLOWED_SIMPLE_MOVES,
+    context: HeuristicContext = None,
+    heuristic_cache_size: int = None,
+    max_expansions: int = None,
+    max_seconds: float = None,
+    max_frontier: int = None
 ) -> Tuple[Plan, int]:
 
-    return a_star_search(env=env, g=(lambda next_state, curr_state, curr_g: 0), allowed_moves_function=allowed_moves_function)
+    return a_star_search(env=env, g=(lambda next_state, curr_state, curr_g: 0), allowed_moves_function=allowed_moves_function, context=context, heuristic_cache_size=heuristic_cache_size, max_expansions=max_expansions, max_seconds=max_seconds, max_frontier=max_frontier)
+
+
+# Exact planner: the score of a plan only depends on the golds it collects and on its length, so the best plan is the
+# best order of visit of a subset of golds. Held-Karp dynamic programming over the subsets of golds, with the shortest
+# paths of the PathTable (the stair is never crossed) between agent, golds and stair. Golds passed over on the way are
+# collected too, which can only make the plan better than its dp value, so the plan is optimal.
+# Returns the plan and the number of dp states. Measured on 30x30 rooms (shortest paths included): 15-17 golds take
+# 0.1-0.15 s, 18 golds 0.2 s, 19 golds 0.4 s and 20 golds 0.7-0.9 s with 80 MB of dp, so max_golds is 20 by default.
+def held_karp_search(
+    env: MiniHackGoldRoom,
+    max_golds: int = 20,
+    subplan_cache: SubplanCache = SUBPLAN_CACHE,
+    chunk_size: int = 65536
+) -> Tuple[Plan, int]:
 
+    env.myreset()
+    agent_coord, stair_coord = tuple(env.agent_coord), tuple(env.stair_coord)
+    # a gold on the stair is collected by every plan
+    golds = [tuple(coord) for coord in env.gold_coords if tuple(coord) != stair_coord and tuple(coord) != agent_coord]
+    n = len(golds)
+    if n > max_golds:
+        raise RuntimeError(f'Too many golds ({n}) for held_karp_search, max_golds = {max_golds}')
+
+    path_table = PathTable(width=env.width, height=env.height, gold_coords=env.gold_coords, to_avoid=[stair_coord], cache=subplan_cache)
+
+    def length(source: Tuple[int, int], target: Tuple[int, int]) -> float:
+        entry, _ = path_table.lookup(source=source, target=target)
+        return np.inf if entry == None else entry['length']
+
+    # value of the moves: reaching gold k from gold j, from the agent, reaching the stair from gold j
+    moves = np.array([[env.gold_score + env.time_penalty * length(golds[j], golds[k]) if j != k else -np.inf for k in range(n)] for j in range(n)]).reshape(n, n)
+    starts = np.array([env.gold_score + env.time_penalty * length(agent_coord, gold) for gold in golds])
+    ends = np.array([env.time_penalty * length(gold, stair_coord) for gold in golds])
+
+    # dp[mask, k]: best value of the plans visiting the golds of mask and ending on gold k, filled by increasing number
+    # of golds: dp[mask, k] = max_j dp[mask without k, j] + moves[j, k]. The masks with the same number of golds are a
+    # layer, stored as a contiguous (n, len(layer)) float32 array with the masks in increasing order (rank is the
+    # position of a mask in its layer). Each layer comes from the previous one through a (max, +) product with moves,
+    # without gathering the rows of a dense (1 << n, n) float64 table, which took 168 MB and 2.7 s at n = 20.
+    masks = np.arange(1 << n)
+    popcount = np.zeros(1 << n, dtype=np.int8)
+    for k in range(n):
+        popcount += (masks >> k) & 1
+    layer_masks = [masks[popcount == size] for size in range(n + 1)]
+    rank = np.zeros(1 << n, dtype=np.int64)
+    for layer in layer_masks:
+        rank[layer] = np.arange(len(layer))
+
+    moves = moves.astype(np.float32)
+    layers = [None, np.full((n, n), -np.inf, dtype=np.float32)]
+    for k in range(n):
+        layers[1][k, k] = starts[k]
+
+    for size in range(2, n + 1):
+        prev, prev_masks = layers[size - 1], layer_masks[size - 1]
+        # best[k, r]: best value of the plans visiting the golds of the r-th mask of the previous layer, then gold k
+        best = np.full(prev.shape, -np.inf, dtype=np.float32)
+        step = np.empty(prev.shape, dtype=np.float32)
+        for chunk in range(0, prev.shape[1], chunk_size):
+            columns = slice(chunk, chunk + chunk_size)
+            for j in range(n):
+                np.add(prev[j, None, columns], moves[j, :, None], out=step[:, columns])
+                np.maximum(best[:, columns], step[:, columns], out=best[:, columns])
+        layer = np.full((n, len(layer_masks[size])), -np.inf, dtype=np.float32)
+        for k in range(n):
+            without_k = (prev_masks >> k) & 1 == 0
+            layer[k, rank[prev_masks[without_k] | (1 << k)]] = best[k, without_k]
+        layers.append(layer)
+
+    # plan going straight to the stair against the best plan of each subset; the order of visit is recovered going
+    # back through the dp values (recomputed with the same operations, so they match exactly)
+    best_value = env.time_penalty * length(agent_coord, stair_coord)
+    sequence = []
+    mask, last = None, None
+    for size in range(1, n + 1):
+        values = layers[size] + ends.astype(np.float32)[:, None]
+        k, r = np.unravel_index(np.argmax(values), values.shape)
+        if values[k, r] > best_value:
+            best_value = values[k, r]
+            mask, last = int(layer_masks[size][r]), int(k)
+    if mask != None:
+        sequence.insert(0, golds[last])
+        while mask != 1 << last:
+            prev_mask = mask ^ (1 << last)
+            prev = layers[popcount[prev_mask]][:, rank[prev_mask]]
+            last = int(np.argmax(prev + moves[:, last]))
+            mask = prev_mask
+            sequence.insert(0, golds[last])
 
+    plan = Plan()
+    points = [agent_coord] + sequence + [stair_coord]
+    for source, target in reversed(list(zip(points[:-1], points[1:]))):
+        entry, _ = path_table.lookup(source=source, target=target)
+        plan.add_reverse(action=entry['actions'], coords=target)
+    plan.add_reverse(action=[], coords=agent_coord)
+
+    return plan, n * (1 << n)
+
+
+# Same recorder of apply
 def random_search(
     env: MiniHackGoldRoom,
     allowed_moves_function: AllowedMovesFunction, # TODO: adapt to CompositeMoves
-    max_steps=10
+    max_steps=10,
+    rng: Any = None,
+    recorder: TrajectoryRecorder = None
     ) -> Tuple[List[dict], List[float], bool]:
 
+    rng = policy_rng(env=env, rng=rng, algorithm='random_search')
+
     if isinstance(allowed_moves_function, AllowedSimpleMovesFunction):
         allowed_moves_function.width = env.width
         allowed_moves_function.height = env.height
 
     _, init_reward = env.myreset()
 
-    states = [env.state()]
+    states = [] if recorder == None else recorder
+    record_step(states=states, state=env.state(), reward=init_reward)
     rewards = [init_reward]
     stair_reached = (env.agent_coord == env.stair_coord)
 
+    space = StateSpace(width=env.width, height=env.height, stair_coord=env.stair_coord, gold_coords=env.gold_coords)
+
     for _ in range(0, max_steps):
-        mystate = State(
-            agent_coords=env.agent_coord,
-            gold_coords=env.gold_coords,
-            stair_coord=env.stair_coord
-        )
+        mystate = space.state(agent_coord=env.agent_coord, gold_coords=env.gold_coords)
         actions = [move_to_action(move) for move in allowed_moves_function(mystate.to_dict())]
-        state, reward, stair_reached = env.mystep(action=random.sample(population=actions, k=1)[0])
-        states.append(state)
+        action = actions[rng.integers(len(actions))]
+        state, reward, stair_reached = env.mystep(action=action)
+        record_step(states=states, state=state, reward=reward, action=action)
         rewards.append(reward)
         if stair_reached:
             break
@@ -325,16 +842,18 @@ def random_search(
     return states, rewards, stair_reached
 
 
-def apply(env: MiniHackGoldRoom, plan: Plan) -> Tuple[List[dict], List[float], bool]:
+# With a recorder, the steps are appended to it with their actions, and it is returned in place of the list of states
+def apply(env: MiniHackGoldRoom, plan: Plan, recorder: TrajectoryRecorder = None) -> Tuple[List[dict], List[float], bool]:
     if env.agent_coord in env.gold_coords:
         reward = env.gold_score
     else:
         reward = 0
-    states = [env.state()]
+    states = [] if recorder == None else recorder
+    record_step(states=states, state=env.state(), reward=reward)
     rewards = [reward]
     done = (env.agent_coord == env.stair_coord)
     for action in plan.action_sequence:
         state, reward, done = env.mystep(action=action)
-        states.append(state)
+        record_step(states=states, state=state, reward=reward, action=action)
         rewards.append(reward)
     return states, rewards, done
\ No newline at end of file
@@ -0,0 +1,457 @@
+import copy
+import numpy as np
+from typing import List, Tuple
+from utils import action_to_move, ACTIONS
+from layout import check_layout_arguments, sample_layout, layout_key
+
+# same char codes used by minihack, so that the 'map' of the symbolic state looks like the NLE one
+GOLD_CHAR = 36
+LEPRECHAUN_CHAR = 108
+AGENT_CHAR = 64
+STAIR_CHAR = 62
+FLOOR_CHAR = 46
+
+PURSE_MESSAGE = 'Your purse feels lighter.'
+GOLD_MESSAGE = '$ - a gold piece.'
+
+# attributes that describe the episode state
+SNAPSHOT_FIELDS = ['collected_gold', 'instant', 'steps', 'agent_coord', 'gold_coords', 'leprechaun_coords', 'floor_golds', 'message']
+
+# penalty_step of NLE, added to the reward of the steps in which the game time does not advance
+FROZEN_STEP_PENALTY = -0.01
+
+NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+
+
+def is_adjacent(a: Tuple[int, int], b: Tuple[int, int]) -> bool:
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1
+
+
+# A leprechaun movement model decides where a leprechaun goes at each step, given the cells it cannot enter.
+class LeprechaunMovementModel:
+
+    def __init__(self):
+        pass
+
+    def __call__(
+        self,
+        leprechaun_coord: Tuple[int, int],
+        agent_coord: Tuple[int, int],
+        blocked: List[Tuple[int, int]],
+        width: int,
+        height: int,
+        rng: np.random.Generator
+    ) -> Tuple[int, int]:
+        pass
+
+    def free_neighbours(self, coord: Tuple[int, int], blocked: List[Tuple[int, int]], width: int, height: int) -> List[Tuple[int, int]]:
+        x, y = coord
+        return [
+            (x + dx, y + dy) for dx, dy in NEIGHBOURS
+            if 0 <= x + dx < width and 0 <= y + dy < height and (x + dx, y + dy) not in blocked
+        ]
+
+
+class StaticLeprechaunModel(LeprechaunMovementModel):
+
+    def __call__(self, leprechaun_coord, agent_coord, blocked, width, height, rng) -> Tuple[int, int]:
+        return leprechaun_coord
+
+
+class RandomLeprechaunModel(LeprechaunMovementModel):
+
+    def __init__(self, prob_stay: float = 0.0):
+        self.prob_stay = prob_stay
+
+    def __call__(self, leprechaun_coord, agent_coord, blocked, width, height, rng) -> Tuple[int, int]:
+        candidates = self.free_neighbours(coord=leprechaun_coord, blocked=blocked, width=width, height=height)
+        if candidates == [] or rng.random() < self.prob_stay:
+            return leprechaun_coord
+        return candidates[rng.integers(len(candidates))]
+
+
+# Approximation of the NetHack behaviour: the leprechaun gets closer (chebyshev distance) to the agent, ties are broken
+# at random.
+class ChasingLeprechaunModel(LeprechaunMovementModel):
+
+    def __call__(self, leprechaun_coord, agent_coord, blocked, width, height, rng) -> Tuple[int, int]:
+        candidates = self.free_neighbours(coord=leprechaun_coord, blocked=blocked, width=width, height=height) + [leprechaun_coord]
+        dists = [max(abs(c[0] - agent_coord[0]), abs(c[1] - agent_coord[1])) for c in candidates]
+        min_dist = min(dists)
+        best = [c for c, d in zip(candidates, dists) if d == min_dist]
+        return best[rng.integers(len(best))]
+
+
+# Symbolic counterpart of MiniHackGoldRoom: the same myreset/mystep/state() contract, simulated on the grid only.
+# Rewards follow the NLE-backed environment: time penalty proportional to the move length, FROZEN_STEP_PENALTY more
+# when the move does not take game time (bumping into the walls of the room), gold_score for each picked gold, the
+# collected gold is lost when a leprechaun steals the purse, and stair_score once when the stair is reached. As in NLE,
+# the gold under the start cell is lost (the up stair is drawn there once the agent leaves): it is never on the floor.
+class SymbolicGoldRoom:
+
+    # Constructor ------------------------------------------------------------------------------------------------------
+    def __init__(
+        self,
+        width: int = 2,
+        height: int = 2,
+        gold_score: float = 1.0,
+        stair_score: float = 1.0,
+        time_penalty: float = -1.0,
+        agent_coord: Tuple[int, int] = None,
+        stair_coord: Tuple[int, int] = None,
+        gold_coords: List[Tuple[int, int]] = None,
+        leprechaun_coords: List[Tuple[int, int]] = None,
+        n_golds: int = 0,
+        n_leps: int = 0,
+        max_episode_steps: int = 100,
+        leprechaun_model: LeprechaunMovementModel = None,
+        theft_prob: float = 1.0,
+        seed: int = None
+    ):
+        check_layout_arguments(
+            width=width, height=height, gold_score=gold_score, stair_score=stair_score, time_penalty=time_penalty,
+            agent_coord=agent_coord, stair_coord=stair_coord, gold_coords=gold_coords,
+            leprechaun_coords=leprechaun_coords, n_golds=n_golds, n_leps=n_leps, max_episode_steps=max_episode_steps
+        )
+
+        if leprechaun_model != None and not isinstance(leprechaun_model, LeprechaunMovementModel):
+            raise TypeError(f'leprechaun_model parameter must be of type LeprechaunMovementModel, not {type(leprechaun_model)}')
+
+        if theft_prob < 0 or theft_prob > 1:
+            raise RuntimeError(f'Invalid argument theft_prob = {theft_prob}')
+
+        self.width = width
+        self.height = height
+        self.collected_gold = 0
+        self.instant = -1
+        self.gold_score = gold_score
+        self.stair_score = stair_score
+        self.time_penalty = time_penalty
+        self.max_episode_steps = max_episode_steps
+        self.leprechaun_model = ChasingLeprechaunModel() if leprechaun_model == None else leprechaun_model
+        self.theft_prob = theft_prob
+        # layout sampling, leprechaun moves and thefts are drawn from this stream only; the policies derive their own
+        # stream from the seed sequence (see utils.policy_rng)
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+
+        self.agent_coord, self.stair_coord, self.gold_coords, self.leprechaun_coords = sample_layout(
+            width=width, height=height, agent_coord=agent_coord, stair_coord=stair_coord,
+            gold_coords=gold_coords, leprechaun_coords=leprechaun_coords, n_golds=n_golds, n_leps=n_leps,
+            rng=self.rng
+        )
+
+        self.init_agent_coord = self.agent_coord
+        self.init_gold_coords = list(self.gold_coords)
+        self.init_leprechaun_coords = list(self.leprechaun_coords)
+
+        # golds lying on the floor
+        self.floor_golds = self._initial_floor_golds()
+        self.gold_coords = self._visible_golds()
+        self.steps = 0
+        self.message = None
+
+    # Copy method ----------------------------------------------------------------------------------------------------
+    def copy(self, **kwargs):
+        params = {
+            'width': self.width,
+            'height': self.height,
+            'max_episode_steps': self.max_episode_steps,
+            'gold_score': self.gold_score,
+            'stair_score': self.stair_score,
+            'time_penalty': self.time_penalty,
+            'agent_coord': self.init_agent_coord,
+            'stair_coord': self.stair_coord,
+            'gold_coords': self.init_gold_coords,
+            'leprechaun_coords': self.init_leprechaun_coords,
+            'leprechaun_model': self.leprechaun_model,
+            'theft_prob': self.theft_prob,
+            'seed': int(self.rng.integers(2**63))
+        }
+        params.update(kwargs)
+        return SymbolicGoldRoom(**params)
+
+    # Load a new layout in this instance, keeping the size of the room -------------------------------------------------
+    def relayout(
+        self,
+        agent_coord: Tuple[int, int] = None,
+        stair_coord: Tuple[int, int] = None,
+        gold_coords: List[Tuple[int, int]] = None,
+        leprechaun_coords: List[Tuple[int, int]] = None,
+        n_golds: int = 0,
+        n_leps: int = 0,
+        gold_score: float = None,
+        stair_score: float = None,
+        time_penalty: float = None,
+        max_episode_steps: int = None,
+        seed: int = None
+    ) -> None:
+        gold_score = self.gold_score if gold_score == None else gold_score
+        stair_score = self.stair_score if stair_score == None else stair_score
+        time_penalty = self.time_penalty if time_penalty == None else time_penalty
+        max_episode_steps = self.max_episode_steps if max_episode_steps == None else max_episode_steps
+
+        check_layout_arguments(
+            width=self.width, height=self.height, gold_score=gold_score, stair_score=stair_score,
+            time_penalty=time_penalty, agent_coord=agent_coord, stair_coord=stair_coord, gold_coords=gold_coords,
+            leprechaun_coords=leprechaun_coords, n_golds=n_golds, n_leps=n_leps, max_episode_steps=max_episode_steps
+        )
+
+        self.gold_score = gold_score
+        self.stair_score = stair_score
+        self.time_penalty = time_penalty
+        self.max_episode_steps = max_episode_steps
+        self.collected_gold = 0
+        self.instant = -1
+        if seed != None:
+            self.seed_sequence = np.random.SeedSequence(seed)
+            self.rng = np.random.default_rng(self.seed_sequence)
+
+        self.agent_coord, self.stair_coord, self.gold_coords, self.leprechaun_coords = sample_layout(
+            width=self.width, height=self.height, agent_coord=agent_coord, stair_coord=stair_coord,
+            gold_coords=gold_coords, leprechaun_coords=leprechaun_coords, n_golds=n_golds, n_leps=n_leps,
+            rng=self.rng
+        )
+
+        self.init_agent_coord = self.agent_coord
+        self.init_gold_coords = list(self.gold_coords)
+        self.init_leprechaun_coords = list(self.leprechaun_coords)
+        self.floor_golds = self._initial_floor_golds()
+        self.gold_coords = self._visible_golds()
+
+    # Reset the environment  -------------------------------------------------------------------------------------------
+    def myreset(self) -> Tuple[dict, float]:
+        self.agent_coord = self.init_agent_coord
+        self.floor_golds = self._initial_floor_golds()
+        self.leprechaun_coords = list(self.init_leprechaun_coords)
+        self.gold_coords = self._visible_golds()
+        self.collected_gold = 0
+        self.steps = 0
+        self.message = ''
+        self.instant += 1
+        return self.state(), 0.0
+
+    # Perform a step in the environment --------------------------------------------------------------------------------
+    def mystep(self, action: int) -> Tuple[dict, float, bool]:
+        move = action_to_move(action)
+        reward = self.time_penalty * np.linalg.norm(move)
+        messages = []
+
+        self.instant += 1
+        self.steps += 1
+
+        # the agent cannot leave the room, and bumping into a leprechaun is an attack: in both cases it does not move
+        x, y = self.agent_coord[0] + int(move[0]), self.agent_coord[1] + int(move[1])
+        moved = 0 <= x < self.width and 0 <= y < self.height and (x, y) not in self.leprechaun_coords
+        if moved:
+            self.agent_coord = (x, y)
+        elif (x, y) not in self.leprechaun_coords:
+            # attacking a leprechaun takes a turn, walking into a wall does not
+            reward += FROZEN_STEP_PENALTY
+
+        picked = moved and self.agent_coord in self.floor_golds
+        if picked:
+            self.floor_golds.remove(self.agent_coord)
+            messages.append(GOLD_MESSAGE)
+            reward += self.gold_score
+
+        done = (self.agent_coord == self.stair_coord)
+        if done:
+            reward += self.stair_score
+
+        stolen = False
+        if not done:
+            stolen = self._move_leprechauns()
+            if stolen:
+                messages.insert(0, PURSE_MESSAGE)
+                reward -= self.collected_gold
+
+        if self.steps >= self.max_episode_steps:
+            done = True
+
+        self.message = ' '.join(messages)
+
+        if not done:
+            self.gold_coords = self._visible_golds()
+        else:
+            self.agent_coord = self.stair_coord
+
+        if stolen:
+            self.collected_gold = 0
+
+        if picked:
+            self.collected_gold += self.gold_score
+
+        return self.state(), reward, done
+
+    # Snapshot of the current episode state: the whole state is on the python side, so restoring it is just a copy
+    def snapshot(self) -> dict:
+        return {
+            'level_key': self._level_key(),
+            'fields': {name: copy.copy(getattr(self, name)) for name in SNAPSHOT_FIELDS}
+        }
+
+    def restore(self, token: dict) -> dict:
+        if token['level_key'] != self._level_key():
+            raise RuntimeError('The snapshot has been taken on a different layout')
+        for name, value in token['fields'].items():
+            setattr(self, name, copy.copy(value))
+        return self.state()
+
+    def _level_key(self) -> str:
+        return layout_key(
+            width=self.width, height=self.height, agent_coord=self.init_agent_coord, stair_coord=self.stair_coord,
+            gold_coords=self.init_gold_coords, leprechaun_coords=self.init_leprechaun_coords
+        )
+
+    # Leprechauns next to an agent carrying gold try to steal it and teleport away, the others move according to the
+    # movement model and pick up the gold of the cell they move to. Returns True if the purse has been stolen.
+    def _move_leprechauns(self) -> bool:
+        stolen = False
+        for i, leprechaun_coord in enumerate(self.leprechaun_coords):
+            blocked = [self.agent_coord] + self.leprechaun_coords[:i] + self.leprechaun_coords[i+1:]
+            if self.collected_gold > 0 and not stolen and is_adjacent(leprechaun_coord, self.agent_coord):
+                if self.rng.random() < self.theft_prob:
+                    stolen = True
+                    free_cells = [
+                        (x, y) for x in range(self.width) for y in range(self.height)
+                        if (x, y) not in blocked and (x, y) != leprechaun_coord
+                    ]
+                    if free_cells != []:
+                        self.leprechaun_coords[i] = free_cells[self.rng.integers(len(free_cells))]
+                continue
+            self.leprechaun_coords[i] = self.leprechaun_model(
+                leprechaun_coord=leprechaun_coord,
+                agent_coord=self.agent_coord,
+                blocked=blocked,
+                width=self.width,
+                height=self.height,
+                rng=self.rng
+            )
+            if self.leprechaun_coords[i] != leprechaun_coord:
+                self.floor_golds.discard(self.leprechaun_coords[i])
+        return stolen
+
+    def _initial_floor_golds(self) -> set:
+        return set(self.init_gold_coords) - {self.init_agent_coord}
+
+    def _visible_golds(self) -> List[Tuple[int, int]]:
+        return [coord for coord in self.init_gold_coords if coord in self.floor_golds and coord != self.agent_coord]
+
+    def _map(self) -> np.ndarray:
+        env_map = np.full((self.height, self.width), FLOOR_CHAR, dtype=np.uint8)
+        x, y = self.stair_coord
+        env_map[self.height - y - 1, x] = STAIR_CHAR
+        for x, y in self.floor_golds:
+            env_map[self.height - y - 1, x] = GOLD_CHAR
+        for x, y in self.leprechaun_coords:
+            env_map[self.height - y - 1, x] = LEPRECHAUN_CHAR
+        x, y = self.agent_coord
+        env_map[self.height - y - 1, x] = AGENT_CHAR
+        return env_map
+
+    def get_agent_coord(self, env_map = None):
+        return self.agent_coord
+
+    def state(self):
+        env_state = {
+            'gold': self.collected_gold,
+            'time': self.instant,
+            'agent_coord': self.agent_coord,
+            'stair_coord': self.stair_coord,
+            'gold_coords': self.gold_coords,
+            'leprechaun_coords': list(self.leprechaun_coords),
+            'map': self._map(),
+            'pixel': None,
+            'glyphs': None,
+            'message': self.message
+        }
+        return env_state
+
+    def to_dict(self):
+        return {
+            'height': self.height,
+            'width': self.width,
+            'time_penalty': self.time_penalty,
+            'gold_score': self.gold_score,
+            'stair_score': self.stair_score,
+            'agent_coord': self.agent_coord,
+            'stair_coord': self.stair_coord,
+            'gold_coords': self.gold_coords
+        }
+
+
+# Replays random action sequences on the NLE-backed environment and on the symbolic one built from the same layout,
+# and returns the mismatches found in rewards, done flags and coordinates. Leprechauns are left out by default since
+# their NetHack AI is not deterministic.
+def check_parity(
+    width: int,
+    height: int,
+    n_golds: int,
+    n_sequences: int = 10,
+    sequence_length: int = 20,
+    gold_score: float = 1.0,
+    stair_score: float = 1.0,
+    time_penalty: float = -1.0,
+    n_leps: int = 0,
+    seed: int = None
+) -> List[dict]:
+
+    # imported here so that the symbolic environment does not need minihack/nle
+    from gold_room_env import MiniHackGoldRoom
+
+    rng = np.random.default_rng(seed)
+    mismatches = []
+
+    for sequence in range(n_sequences):
+        nle_env = MiniHackGoldRoom(
+            width=width,
+            height=height,
+            n_golds=n_golds,
+            n_leps=n_leps,
+            gold_score=gold_score,
+            stair_score=stair_score,
+            time_penalty=time_penalty,
+            max_episode_steps=sequence_length + 1,
+            observation_mode='symbolic',
+            seed=int(rng.integers(2**63))
+        )
+        sym_env = SymbolicGoldRoom(
+            width=width,
+            height=height,
+            gold_score=gold_score,
+            stair_score=stair_score,
+            time_penalty=time_penalty,
+            agent_coord=tuple(nle_env.agent_coord),
+            stair_coord=tuple(nle_env.stair_coord),
+            gold_coords=list(nle_env.gold_coords),
+            leprechaun_coords=list(nle_env.leprechaun_coords),
+            max_episode_steps=sequence_length + 1,
+            leprechaun_model=StaticLeprechaunModel()
+        )
+
+        nle_env.myreset()
+        sym_env.myreset()
+
+        for t in range(sequence_length):
+            action = ACTIONS[rng.integers(len(ACTIONS))]
+            nle_state, nle_reward, nle_done = nle_env.mystep(action=action)
+            sym_state, sym_reward, sym_done = sym_env.mystep(action=action)
+
+            checks = {
+                'reward': (round(float(nle_reward), 6), round(float(sym_reward), 6)),
+                'done': (bool(nle_done), bool(sym_done)),
+                'agent_coord': (tuple(int(c) for c in nle_state['agent_coord']), sym_state['agent_coord']),
+                'gold_coords': (
+                    sorted(tuple(int(c) for c in coord) for coord in nle_state['gold_coords']),
+                    sorted(sym_state['gold_coords'])
+                )
+            }
+            for key, (nle_value, sym_value) in checks.items():
+                if nle_value != sym_value:
+                    mismatches.append({'sequence': sequence, 'step': t, 'action': action, 'key': key, 'nle': nle_value, 'symbolic': sym_value})
+
+            if nle_done or sym_done:
+                break
+
+    return mismatches
@@ -0,0 +1,62 @@
+import pytest
+from functools import partial
+from batch_planning import plan_config, planner_kwargs
+from planning import a_star_search, state_heuristic, uniform_cost_search
+from symbolic_env import SymbolicGoldRoom
+from utils import design_plan, AllowedSimpleMovesFunction, GridMovesFunction, GridTables, HeuristicContext, ALLOWED_COMPOSITE_MOVES, ALLOWED_SIMPLE_MOVES
+
+
+CONFIG = {
+    'widths': [4, 5],
+    'heights': [4, 3],
+    'n_golds': [1, 3],
+    'n_leps': [0],
+    'gold_scores': [10],
+    'stair_scores': [5],
+    'time_penalties': [-1],
+    'max_steps': 100,
+    'n_episodes': 2,
+    'algorithms': [a_star_search, uniform_cost_search],
+    'alg_paramss': [
+        [{'allowed_moves_function': ALLOWED_SIMPLE_MOVES}, {'allowed_moves_function': ALLOWED_COMPOSITE_MOVES}],
+        [{'allowed_moves_function': ALLOWED_SIMPLE_MOVES}]
+    ]
+}
+
+
+# plan_many plans the layouts of design_plan on rebuilt rooms, in this process or in a pool, with the same results
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_plan_config_matches_design_plan(tmp_path, monkeypatch, n_workers):
+    monkeypatch.chdir(tmp_path)
+    plans = design_plan(**CONFIG, env_factory=SymbolicGoldRoom, seed=0)
+    result = plan_config(config=CONFIG, env_factory=SymbolicGoldRoom, seed=0, n_workers=n_workers)
+    assert len(result['plans']) == len(plans)
+    for record, plan in zip(result['plans'], plans):
+        assert record['init'] == plan['init']
+        assert record['algorithm'] == plan['algorithm']
+        assert record['results'] == plan['results']
+
+
+@pytest.mark.parametrize('to_avoid', [[], [(1, 1), (2, 3)]])
+def test_grid_moves_match_simple_moves(to_avoid):
+    width, height = 5, 4
+    grid_moves = GridMovesFunction(grid=GridTables(width=width, height=height), to_avoid=to_avoid)
+    simple_moves = AllowedSimpleMovesFunction(width=width, height=height, to_avoid=to_avoid)
+    for x in range(width):
+        for y in range(height):
+            for leprechaun_coords in [[], [(2, 2)]]:
+                state = {'agent_coord': (x, y), 'leprechaun_coords': leprechaun_coords}
+                assert [tuple(move) for move in grid_moves(state=state)] == [tuple(move) for move in simple_moves(state=state)]
+
+
+# The context is only added for the default heuristic
+def test_planner_kwargs_context():
+    grid = GridTables(width=4, height=4)
+    room = SymbolicGoldRoom(width=4, height=4, n_golds=2, seed=0)
+    room.myreset()
+    context = HeuristicContext(env=room.to_dict(), grid=grid)
+    kwargs = planner_kwargs(algorithm=a_star_search, kwargs={}, grid=grid, context=context, search_limits={})
+    assert kwargs['context'] is context
+    h = partial(state_heuristic, gold_score=room.gold_score, stair_score=room.stair_score, time_penalty=room.time_penalty)
+    kwargs = planner_kwargs(algorithm=a_star_search, kwargs={'h': h}, grid=grid, context=context, search_limits={})
+    assert 'context' not in kwargs
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from batched_env import BatchedGoldRoom
+from symbolic_env import SymbolicGoldRoom, StaticLeprechaunModel, ChasingLeprechaunModel, RandomLeprechaunModel
+from utils import ACTIONS, E, W
+
+
+# Random action sequences replayed on every SymbolicGoldRoom and on the batch built from them: rewards, done flags,
+# agent and visible golds must be the same. With static leprechauns and no thefts both are deterministic.
+@pytest.mark.parametrize('width, height, n_golds, n_leps', [(3, 3, 2, 0), (5, 4, 4, 1), (6, 6, 6, 2), (7, 3, 8, 0)])
+def test_batched_matches_symbolic(width, height, n_golds, n_leps):
+    rng = np.random.default_rng(width * height)
+    envs = [
+        SymbolicGoldRoom(
+            width=width, height=height, gold_score=100, stair_score=10, time_penalty=-1, n_golds=n_golds,
+            n_leps=n_leps, max_episode_steps=25, leprechaun_model=StaticLeprechaunModel(), theft_prob=0.0,
+            seed=int(rng.integers(2**63))
+        )
+        for _ in range(10)
+    ]
+    batch = BatchedGoldRoom.from_envs(envs=envs, leprechaun_model='static', theft_prob=0.0, auto_reset=False)
+    for env in envs:
+        env.myreset()
+    batch.myreset()
+
+    finished = np.zeros(len(envs), dtype=bool)
+    for _ in range(25):
+        actions = rng.integers(len(ACTIONS), size=len(envs))
+        state, rewards, dones = batch.mystep(actions=actions)
+        for i, env in enumerate(envs):
+            if finished[i]:
+                continue
+            env_state, env_reward, env_done = env.mystep(action=ACTIONS[actions[i]])
+            assert rewards[i] == pytest.approx(env_reward)
+            assert dones[i] == env_done
+            if not env_done:
+                assert tuple(state['agent_coord'][i]) == env_state['agent_coord']
+                assert sorted(map(tuple, state['gold_coords'][i][state['gold_mask'][i]])) == sorted(env_state['gold_coords'])
+            finished[i] = env_done
+
+
+# The thief teleports to one of the cells that are neither its own, nor the agent's, nor the other leprechauns'
+def test_theft_teleports_to_a_free_cell():
+    batch = BatchedGoldRoom(
+        width=2, height=3, gold_score=100, stair_score=10, time_penalty=-1, leprechaun_model='static',
+        layouts=[{'agent_coord': (0, 0), 'stair_coord': (0, 2), 'gold_coords': [(1, 0)], 'leprechaun_coords': [(1, 1), (0, 1), (1, 2)]}] * 32,
+        seed=0
+    )
+    batch.myreset()
+    batch.mystep(actions=np.full(32, ACTIONS.index(E)))
+    state, rewards, _ = batch.mystep(actions=np.full(32, ACTIONS.index(W)))
+    assert np.all(rewards == -1 - 100)
+    assert np.all(state['gold'] == 0)
+    assert set(map(tuple, state['leprechaun_coords'][:, 0])) == {(1, 0), (0, 2)}
+    assert np.all(state['leprechaun_coords'][:, 1:] == [(0, 1), (1, 2)])
+
+
+# A batch of one room draws from the random stream as SymbolicGoldRoom does, so with the same stream the moving
+# leprechauns and the thefts are the same
+@pytest.mark.parametrize('model, batch_model', [(ChasingLeprechaunModel(), 'chasing'), (RandomLeprechaunModel(), 'random')])
+def test_batched_leprechauns_match_symbolic(model, batch_model):
+    rng = np.random.default_rng(0)
+    for seed in range(20):
+        env = SymbolicGoldRoom(
+            width=5, height=4, gold_score=100, stair_score=10, time_penalty=-1, n_golds=4, n_leps=2,
+            max_episode_steps=30, leprechaun_model=model, theft_prob=0.7, seed=seed
+        )
+        batch = BatchedGoldRoom.from_envs(envs=[env], leprechaun_model=batch_model, theft_prob=0.7, auto_reset=False)
+        batch.rng.bit_generator.state = env.rng.bit_generator.state
+        env.myreset()
+        batch.myreset()
+        for _ in range(30):
+            action = rng.integers(len(ACTIONS))
+            state, rewards, dones = batch.mystep(actions=np.array([action]))
+            env_state, env_reward, env_done = env.mystep(action=ACTIONS[action])
+            assert rewards[0] == pytest.approx(env_reward)
+            assert dones[0] == env_done
+            assert state['gold'][0] == env_state['gold']
+            if env_done:
+                break
+            assert tuple(state['agent_coord'][0]) == env_state['agent_coord']
+            assert list(map(tuple, state['leprechaun_coords'][0])) == env_state['leprechaun_coords']
+            assert sorted(map(tuple, state['gold_coords'][0][state['gold_mask'][0]])) == sorted(env_state['gold_coords'])
+
+
+def test_same_seed_same_layouts():
+    batches = [BatchedGoldRoom(n_rooms=3, width=5, height=4, n_golds=3, n_leps=1, seed=7) for _ in range(2)]
+    assert batches[0].init_rooms.tobytes() == batches[1].init_rooms.tobytes()
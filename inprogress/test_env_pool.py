@@ -0,0 +1,28 @@
+from env_pool import EnvPool
+from symbolic_env import SymbolicGoldRoom
+
+LAYOUT = {'agent_coord': (0, 0), 'stair_coord': (4, 3), 'gold_coords': [(2, 1), (3, 3)], 'leprechaun_coords': [(1, 2)], 'seed': 3}
+ACTIONS = [1, 2, 5, 1, 6, 1, 0, 3]
+
+
+# A reused instance plays the layout it is given as a new one would
+def test_relayout_matches_a_new_env(play):
+    pool = EnvPool(env_factory=SymbolicGoldRoom)
+    env = pool.acquire(width=5, height=4, n_golds=3, n_leps=2, gold_score=10, stair_score=5, seed=0)
+    play(env, ACTIONS)
+    pool.release(env)
+    reused = pool.acquire(width=5, height=4, gold_score=10, stair_score=5, **LAYOUT)
+    assert reused is env
+    assert pool.stats()['relayouts'] == 1
+    assert play(reused, ACTIONS) == play(SymbolicGoldRoom(width=5, height=4, gold_score=10, stair_score=5, **LAYOUT), ACTIONS)
+
+
+# Constructor options that relayout cannot change select the instance instead of being passed to relayout
+def test_options_are_part_of_the_key():
+    pool = EnvPool(env_factory=SymbolicGoldRoom)
+    env = pool.make(width=5, height=4, theft_prob=1.0, **LAYOUT)
+    other = pool.make(width=5, height=4, theft_prob=0.5, **LAYOUT)
+    assert other is not env
+    assert other.theft_prob == 0.5
+    assert pool.make(width=5, height=4, theft_prob=1.0, **LAYOUT) is env
+    assert pool.stats() == {'created': 2, 'relayouts': 1, 'free': 0}
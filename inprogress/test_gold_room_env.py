@@ -0,0 +1,80 @@
+import numpy as np
+from benchmarks import benchmark_symbolic_env, legacy_parse, synthetic_chars, synthetic_message
+from gold_room_env import MiniHackGoldRoom, crop_window
+from env_pool import EnvPool
+
+LAYOUT = {'agent_coord': (0, 0), 'stair_coord': (4, 3), 'gold_coords': [(2, 1), (3, 3)], 'leprechaun_coords': [(1, 2)], 'seed': 3}
+ACTIONS = [1, 2, 5, 1, 6, 1, 0, 3]
+
+
+def make_room(width: int = 5, height: int = 4, **kwargs) -> MiniHackGoldRoom:
+    return MiniHackGoldRoom(width=width, height=height, gold_score=10, stair_score=5, observation_mode='symbolic', **kwargs)
+
+
+# An instance of the pool given a new layout plays it as a new instance would
+def test_relayout_matches_a_new_env(play):
+    pool = EnvPool(env_factory=make_room)
+    env = pool.acquire(width=5, height=4, n_golds=3, n_leps=2, seed=0)
+    play(env, ACTIONS)
+    pool.release(env)
+    reused = pool.acquire(width=5, height=4, **LAYOUT)
+    assert reused is env
+    assert play(reused, ACTIONS) == play(make_room(**LAYOUT), ACTIONS)
+    reused.close()
+
+
+# Every episode of an instance starts from the same reset: nothing of the previous episode is rewarded (the time of
+# the states counts the steps of the instance, across episodes)
+def test_episodes_of_an_instance_match(play):
+    env = make_room(agent_coord=(0, 0), stair_coord=(4, 3), gold_coords=[(2, 1), (3, 3)], leprechaun_coords=[], seed=3)
+    without_time = lambda steps: [({key: value for key, value in step[0].items() if key != 'time'},) + step[1:] for step in steps]
+    assert without_time(play(env, ACTIONS)) == without_time(play(env, ACTIONS))
+    env.close()
+
+
+# restore brings back the state of the snapshot, and the episode goes on from there as it did the first time
+def test_snapshot_restore():
+    env = make_room(**LAYOUT)
+    env.myreset()
+    env.mystep(action=1)
+    token = env.snapshot()
+    state = env.state()
+    following = [env.mystep(action=action)[1:] for action in ACTIONS[1:4]]
+    restored = env.restore(token)
+    for key in ['gold', 'time', 'agent_coord', 'gold_coords', 'leprechaun_coords']:
+        assert restored[key] == state[key]
+    assert np.array_equal(restored['map'], state['map'])
+    assert [env.mystep(action=action)[1:] for action in ACTIONS[1:4]] == following
+    env.close()
+
+
+# The crop window and the single-pass parse give what the legacy parse found, on NLE and on synthetic observations
+def test_fused_parse_matches_legacy_parse():
+    env = make_room(**LAYOUT)
+    env.myreset()
+    observations = [(env.observation['chars'].copy(), env.observation['message'].copy(), 4)]
+    for action in ACTIONS:
+        _, _, done = env.mystep(action=action)
+        if done:
+            break
+        observations.append((env.observation['chars'].copy(), env.observation['message'].copy(), 4))
+    env.close()
+    for seed in range(5):
+        observations.append((synthetic_chars(width=7, height=5, n_golds=3, n_leps=2, seed=seed), synthetic_message(), 5))
+
+    for chars, message, height in observations:
+        env.crop = crop_window(chars=chars)
+        env.height = height
+        parsed = env._parse_observation(chars=chars, message=message)
+        env_map, agent_coord, gold_coords, leprechaun_coords, _ = legacy_parse(chars=chars, message=message, height=height)
+        assert np.array_equal(parsed['map'], env_map)
+        assert parsed['agent_coord'] == agent_coord
+        assert parsed['gold_coords'] == gold_coords
+        assert parsed['leprechaun_coords'] == leprechaun_coords
+
+
+# Both rooms play the random episodes of the benchmark; the margin is far below the measured one to keep it stable
+def test_symbolic_env_is_faster_than_nle():
+    result = benchmark_symbolic_env(width=5, height=5, n_golds=2, n_steps=300, n_episodes=3, max_episode_steps=50)
+    assert result['step_speedup'] > 2
+    assert result['episode_speedup'] > 2
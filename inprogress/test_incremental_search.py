@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from distance_tables import distance_field
+from incremental_search import IncrementalDistanceField, IncrementalPlanner, incremental_online_search
+from planning import a_star_search
+from symbolic_env import SymbolicGoldRoom
+
+
+# The LPA* repairs give the distances of a reverse Dijkstra from scratch with the new obstacles (but on the stair, which
+# ends the episode: its distance is never used)
+@pytest.mark.parametrize('seed', range(3))
+def test_repaired_distances_match_distance_field(seed):
+    rng = np.random.default_rng(seed)
+    width, height, target, stair = 8, 6, (1, 1), (6, 4)
+    field = IncrementalDistanceField(width=width, height=height, target=target, blocked=[stair])
+    for _ in range(10):
+        obstacles = set((int(rng.integers(width)), int(rng.integers(height))) for _ in range(8))
+        obstacles.discard(target)
+        field.set_obstacles(obstacles=obstacles)
+        dists = distance_field(width=width, height=height, target=target, to_avoid=obstacles, blocked=[stair])
+        stair_cell = stair[1] * width + stair[0]
+        assert field.g[:stair_cell] + field.g[stair_cell + 1:] == pytest.approx(dists[:stair_cell] + dists[stair_cell + 1:])
+
+
+# Without leprechauns the plan of the planner is the optimal plan of the room (Plan.stats leaves out the stair score)
+@pytest.mark.parametrize('seed', range(4))
+def test_planner_value_matches_a_star(seed):
+    env = SymbolicGoldRoom(width=6, height=5, n_golds=3, gold_score=10, stair_score=5, time_penalty=-1, seed=seed)
+    state, reward = env.myreset()
+    value = IncrementalPlanner(env=env).plan(state=state)['value']
+    a_star_plan, _ = a_star_search(env=env)
+    assert reward + value == pytest.approx(a_star_plan.stats(env=env)['score'] + env.stair_score, abs=1e-3)
+
+
+def test_incremental_online_search_without_steps():
+    env = SymbolicGoldRoom(width=6, height=5, n_golds=3, seed=0)
+    states, rewards, done, n_steps, _ = incremental_online_search(env=env, max_steps=0)
+    assert len(rewards) == 1
+    assert not done
+    assert n_steps == 0
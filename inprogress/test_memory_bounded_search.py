@@ -0,0 +1,58 @@
+import pytest
+from memory_bounded_search import ida_star_search, sma_star_search
+from planning import a_star_search
+from symbolic_env import SymbolicGoldRoom
+from utils import AllowedSimpleMovesFunction
+
+
+def corridor() -> SymbolicGoldRoom:
+    return SymbolicGoldRoom(width=3, height=1, agent_coord=(0, 0), stair_coord=(2, 0), gold_coords=[], time_penalty=-1, seed=0)
+
+
+def test_sma_star_solves_with_enough_memory():
+    env = SymbolicGoldRoom(width=6, height=6, n_golds=5, gold_score=10, stair_score=5, time_penalty=-1, seed=0)
+    plan, _ = sma_star_search(env=env, max_nodes=40)
+    a_star_plan, _ = a_star_search(env=env)
+    assert plan.outcome['status'] == 'solved'
+    assert plan.stats(env=env)['score'] == pytest.approx(a_star_plan.stats(env=env)['score'])
+
+
+# The path to the stair needs 3 nodes: with 2 the nodes below the root are cut and the search fails
+def test_sma_star_depth_cutoff():
+    plan, _ = sma_star_search(env=corridor(), max_nodes=2)
+    assert plan.outcome['status'] == 'no_solution'
+    assert not plan.outcome['complete']
+    plan, _ = sma_star_search(env=corridor(), max_nodes=3)
+    assert plan.outcome['status'] == 'solved'
+
+
+def test_sma_star_stops_when_the_stair_is_walled_off():
+    env = SymbolicGoldRoom(width=5, height=5, agent_coord=(0, 0), stair_coord=(4, 4), gold_coords=[(2, 2)], seed=0)
+    walls = AllowedSimpleMovesFunction(to_avoid=[(3, 3), (3, 4), (4, 3)])
+    plan, n_expanded = sma_star_search(env=env, allowed_moves_function=walls, max_nodes=20, max_expansions=2000)
+    assert plan.outcome['status'] == 'limit_hit'
+    assert plan.outcome['limit'] == 'max_expansions'
+    assert n_expanded <= 2000 + 8
+
+
+def test_ida_star_matches_a_star():
+    env = SymbolicGoldRoom(width=5, height=5, n_golds=3, gold_score=10, stair_score=5, time_penalty=-1, seed=0)
+    plan, n_expanded = ida_star_search(env=env)
+    a_star_plan, _ = a_star_search(env=env)
+    assert plan.outcome['status'] == 'solved'
+    assert plan.stats(env=env)['score'] == pytest.approx(a_star_plan.stats(env=env)['score'])
+    assert plan.memory_stats['reexpansions'] <= n_expanded
+
+
+def test_ida_star_stops_when_the_stair_is_walled_off():
+    env = SymbolicGoldRoom(width=5, height=5, agent_coord=(0, 0), stair_coord=(4, 4), gold_coords=[(2, 2)], seed=0)
+    walls = AllowedSimpleMovesFunction(to_avoid=[(3, 3), (3, 4), (4, 3)])
+    plan, _ = ida_star_search(env=env, allowed_moves_function=walls)
+    assert plan.outcome['status'] == 'no_solution'
+    assert not plan.outcome['complete']
+    plan, n_expanded = ida_star_search(env=env, allowed_moves_function=walls, max_expansions=2000)
+    assert plan.outcome['status'] == 'limit_hit'
+    assert plan.outcome['limit'] == 'max_expansions'
+    assert n_expanded <= 2000 + 8
+    plan, _ = ida_star_search(env=env, allowed_moves_function=walls, max_seconds=0)
+    assert plan.outcome['limit'] == 'max_seconds'
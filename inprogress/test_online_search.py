@@ -0,0 +1,15 @@
+from online_search import online_random_greedy_search, simulated_annealing
+
+
+# The policy stream is derived from the env seed, so an episode does not depend on what ran on the env before it. The
+# env is reset before every algorithm, as run_episodes does.
+def test_policy_stream_is_independent_of_previous_runs(room):
+    env = room(width=6, height=6, n_golds=4, max_episode_steps=40, leprechaun_model=None, seed=5)
+    env.myreset()
+    _, rewards, _, _, _ = online_random_greedy_search(env=env)
+    env = room(width=6, height=6, n_golds=4, max_episode_steps=40, leprechaun_model=None, seed=5)
+    env.myreset()
+    simulated_annealing(env=env)
+    env.myreset()
+    _, rewards_after, _, _, _ = online_random_greedy_search(env=env)
+    assert rewards_after == rewards
@@ -0,0 +1,38 @@
+import pytest
+from parallel_search import hda_star_search, HdaStarPool
+from planning import a_star_search
+from symbolic_env import SymbolicGoldRoom
+from utils import AllowedSimpleMovesFunction
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with HdaStarPool(n_workers=3) as pool:
+        yield pool
+
+
+# HDA* is exact whatever the partition of the states, so its plans score as the ones of a_star_search
+@pytest.mark.parametrize('seed', range(3))
+def test_hda_star_matches_a_star(pool, seed):
+    env = SymbolicGoldRoom(width=6, height=5, n_golds=3, gold_score=10, stair_score=5, time_penalty=-1, seed=seed)
+    a_star_plan, _ = a_star_search(env=env)
+    plan, _ = hda_star_search(env=env, pool=pool)
+    assert plan.outcome['status'] == 'solved'
+    assert plan.parallel_stats['workers'] == 3
+    assert plan.stats(env=env)['score'] == pytest.approx(a_star_plan.stats(env=env)['score'])
+
+
+def test_hda_star_with_one_worker():
+    env = SymbolicGoldRoom(width=6, height=5, n_golds=3, gold_score=10, stair_score=5, time_penalty=-1, seed=0)
+    a_star_plan, _ = a_star_search(env=env)
+    plan, _ = hda_star_search(env=env, n_workers=1)
+    assert plan.outcome['status'] == 'solved'
+    assert plan.stats(env=env)['score'] == pytest.approx(a_star_plan.stats(env=env)['score'])
+
+
+def test_hda_star_without_solution(pool):
+    env = SymbolicGoldRoom(width=5, height=5, agent_coord=(0, 0), stair_coord=(4, 4), gold_coords=[(2, 2)], seed=0)
+    walls = AllowedSimpleMovesFunction(to_avoid=[(3, 3), (3, 4), (4, 3)])
+    plan, _ = hda_star_search(env=env, allowed_moves_function=walls, pool=pool)
+    assert plan.outcome['status'] == 'no_solution'
+    assert not plan.outcome['complete']
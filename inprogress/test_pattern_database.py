@@ -0,0 +1,47 @@
+import math
+import pytest
+from pattern_database import pattern_database_search
+from planning import a_star_search
+from symbolic_env import SymbolicGoldRoom
+from distance_tables import distance_field
+from utils import AllowedSimpleMovesFunction, E
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_pattern_database_matches_a_star(seed):
+    env = SymbolicGoldRoom(width=7, height=4, n_golds=3, gold_score=10, stair_score=5, time_penalty=-1, seed=seed)
+    plan, _ = pattern_database_search(env=env)
+    a_star_plan, _ = a_star_search(env=env)
+    assert plan.outcome['status'] == 'solved'
+    assert plan.stats(env=env)['score'] == pytest.approx(a_star_plan.stats(env=env)['score'])
+
+
+# An env used before the search (a gold already collected) is planned from its initial layout
+def test_pattern_database_after_an_episode():
+    env = SymbolicGoldRoom(width=7, height=4, agent_coord=(0, 0), stair_coord=(6, 3), gold_coords=[(1, 0), (4, 2)], gold_score=10, stair_score=5, time_penalty=-1)
+    env.myreset()
+    env.mystep(action=E)
+    plan, _ = pattern_database_search(env=env)
+    assert plan.outcome['status'] == 'solved'
+    assert (1, 0) in plan.path
+
+
+# A wall of avoided cells: the distances of the pattern database must go around it, as the moves of the search do
+@pytest.mark.parametrize('seed', range(4))
+def test_pattern_database_with_avoided_cells(seed):
+    walls = [(3, 0), (3, 1), (3, 2)]
+    env = SymbolicGoldRoom(
+        width=7, height=4, agent_coord=(0, 0), stair_coord=(6, 0), gold_coords=[(1, 3), (5, 1), (4, 0)][:seed],
+        gold_score=10, stair_score=5, time_penalty=-1
+    )
+    plan, _ = pattern_database_search(env=env, allowed_moves_function=AllowedSimpleMovesFunction(to_avoid=walls))
+    a_star_plan, _ = a_star_search(env=env, allowed_moves_function=AllowedSimpleMovesFunction(to_avoid=walls))
+    assert plan.outcome['status'] == 'solved'
+    assert not any(coord in walls for coord in plan.path)
+    assert plan.stats(env=env)['score'] == pytest.approx(a_star_plan.stats(env=env)['score'])
+
+
+def test_distance_field_goes_around_avoided_cells():
+    dists = distance_field(width=3, height=3, target=(2, 0), to_avoid=[(1, 0), (1, 1)])
+    assert dists[0] == pytest.approx(2 + 2 * math.sqrt(2))
+    assert dists[1] == math.inf
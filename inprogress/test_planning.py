@@ -0,0 +1,84 @@
+import pytest
+from distance_tables import PathTable, SubplanCache
+from planning import a_star_search, anytime_a_star_search, greedy_search, held_karp_search, uniform_cost_search, Frontier, Node
+from symbolic_env import SymbolicGoldRoom
+from utils import AllowedSimpleMovesFunction
+
+
+# held_karp_search is exact, so its plans score as the ones of a_star_search
+@pytest.mark.parametrize('n_golds', [0, 1, 3, 5])
+def test_held_karp_matches_a_star(n_golds):
+    for seed in range(4):
+        env = SymbolicGoldRoom(width=5, height=4, n_golds=n_golds, gold_score=10, stair_score=5, time_penalty=-1, seed=seed)
+        plan, _ = held_karp_search(env=env)
+        a_star_plan, _ = a_star_search(env=env)
+        assert plan.stats(env=env)['score'] == pytest.approx(a_star_plan.stats(env=env)['score'], abs=1e-3)
+
+
+def test_held_karp_rejects_too_many_golds():
+    env = SymbolicGoldRoom(width=5, height=5, n_golds=4, seed=0)
+    with pytest.raises(RuntimeError):
+        held_karp_search(env=env, max_golds=2)
+
+
+def test_held_karp_accepts_twenty_golds_by_default():
+    env = SymbolicGoldRoom(width=30, height=30, n_golds=20, seed=0)
+    plan, n_states = held_karp_search(env=env)
+    assert n_states > 0
+    assert plan.path[-1] == tuple(env.stair_coord)
+
+
+def test_anytime_a_star_matches_a_star():
+    env = SymbolicGoldRoom(width=5, height=5, n_golds=3, gold_score=10, stair_score=5, time_penalty=-1, seed=0)
+    plan, _ = anytime_a_star_search(env=env)
+    a_star_plan, _ = a_star_search(env=env)
+    assert plan.outcome['status'] == 'solved'
+    assert plan.stats(env=env)['score'] == pytest.approx(a_star_plan.stats(env=env)['score'])
+
+
+# The budgets hold before a plan is found, and a stair that cannot be reached is an outcome, not an error
+def test_anytime_a_star_outcomes():
+    env = SymbolicGoldRoom(width=5, height=5, agent_coord=(0, 0), stair_coord=(4, 4), gold_coords=[(2, 2)], seed=0)
+    plan, n_expanded = anytime_a_star_search(env=env, max_expansions=1)
+    assert plan.outcome['status'] == 'limit_hit'
+    assert plan.outcome['limit'] == 'max_expansions'
+    assert not plan.outcome['complete']
+    assert plan.anytime_stats['g_value'] == None
+    plan, _ = anytime_a_star_search(env=env, max_seconds=0)
+    assert plan.outcome['limit'] == 'max_seconds'
+    walls = AllowedSimpleMovesFunction(to_avoid=[(3, 3), (3, 4), (4, 3)])
+    plan, _ = anytime_a_star_search(env=env, allowed_moves_function=walls)
+    assert plan.outcome['status'] == 'no_solution'
+    assert not plan.outcome['complete']
+
+
+# The subplan cache holds at most max_cells cells of shortest path trees, and the paths do not depend on it
+def test_subplan_cache_is_bounded_by_cells():
+    cache = SubplanCache(max_cells=100)
+    table = PathTable(width=6, height=6, gold_coords=[(2, 3)], to_avoid=[(5, 5)], cache=cache)
+    uncached_table = PathTable(width=6, height=6, gold_coords=[(2, 3)], to_avoid=[(5, 5)])
+    for source in [(0, 0), (1, 4), (3, 2), (0, 0)]:
+        assert table.lookup(source=source, target=(5, 5)) == uncached_table.lookup(source=source, target=(5, 5))
+        assert cache.stats()['cells'] <= 100
+    assert cache.evictions > 0
+    cache.clear()
+    assert cache.n_cells == 0
+
+
+# Improved nodes leave stale entries in the heap, which are not counted in the frontier
+def test_frontier_counts_live_entries():
+    frontier = Frontier()
+    frontier.push(Node(state=(0, 0), g_value=0, priority=0))
+    frontier.push(Node(state=(0, 0), g_value=1, priority=1))
+    frontier.push(Node(state=(0, 1), g_value=0, priority=0))
+    assert len(frontier.heap) == 3
+    assert len(frontier) == 2
+    assert frontier.pop().g_value == 1
+    assert len(frontier) == 1
+
+
+def test_uniform_cost_and_greedy_forward_the_heuristic_cache():
+    env = SymbolicGoldRoom(width=5, height=5, n_golds=3, seed=0)
+    for search in [uniform_cost_search, greedy_search]:
+        plan, _ = search(env=env, heuristic_cache_size=100)
+        assert plan.heuristic_stats != None
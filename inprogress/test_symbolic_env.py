@@ -0,0 +1,59 @@
+import pytest
+from symbolic_env import ChasingLeprechaunModel, FROZEN_STEP_PENALTY, check_parity
+from utils import N, S, W, E
+
+
+def test_stair_paid_once(room):
+    env = room(agent_coord=(0, 0), stair_coord=(1, 0), gold_coords=[])
+    env.myreset()
+    _, reward, done = env.mystep(action=E)
+    assert done
+    assert reward == -1 + 10
+
+
+def test_wall_bump_is_a_frozen_step(room):
+    env = room(agent_coord=(0, 0), stair_coord=(3, 2), gold_coords=[])
+    env.myreset()
+    state, reward, _ = env.mystep(action=W)
+    assert state['agent_coord'] == (0, 0)
+    assert reward == -1 + FROZEN_STEP_PENALTY
+
+
+def test_attacking_a_leprechaun_takes_a_turn(room):
+    env = room(agent_coord=(0, 0), stair_coord=(3, 2), gold_coords=[], leprechaun_coords=[(1, 0)])
+    env.myreset()
+    state, reward, _ = env.mystep(action=E)
+    assert state['agent_coord'] == (0, 0)
+    assert reward == -1
+
+
+def test_gold_under_the_start_is_lost(room):
+    env = room(agent_coord=(0, 0), stair_coord=(3, 2), gold_coords=[(0, 0), (2, 0)])
+    assert env.gold_coords == [(2, 0)]
+    state, _ = env.myreset()
+    assert state['gold_coords'] == [(2, 0)]
+    env.mystep(action=N)
+    state, reward, _ = env.mystep(action=S)
+    assert state['agent_coord'] == (0, 0)
+    assert reward == -1
+    assert state['gold'] == 0
+
+
+def test_leprechaun_picks_up_gold(room):
+    env = room(width=1, height=4, agent_coord=(0, 0), stair_coord=(0, 3), gold_coords=[(0, 1)], leprechaun_coords=[(0, 2)], leprechaun_model=ChasingLeprechaunModel(), seed=0)
+    env.myreset()
+    state, _, _ = env.mystep(action=W)
+    assert state['leprechaun_coords'] == [(0, 1)]
+    assert state['gold_coords'] == []
+
+
+# Random action sequences replayed on MiniHackGoldRoom: rewards, done flags, agent and golds must be the same. The rooms
+# have no leprechauns, whose NetHack AI cannot be reproduced.
+@pytest.mark.parametrize('width, height, n_golds', [(3, 3, 2), (5, 4, 4), (6, 6, 6), (7, 3, 8)])
+def test_parity_with_nle(width, height, n_golds):
+    pytest.importorskip('minihack')
+    mismatches = check_parity(
+        width=width, height=height, n_golds=n_golds, n_sequences=10, sequence_length=25,
+        gold_score=100, stair_score=10, time_penalty=-1, seed=width * height
+    )
+    assert mismatches == []
@@ -0,0 +1,29 @@
+from online_search import online_greedy_search
+from planning import apply, Plan
+from trajectory import TrajectoryRecorder, NO_ACTION
+from utils import N, E, W
+
+
+# The recorder keeps the real actions, also those that do not move the agent
+def test_apply_records_the_actions(room):
+    env = room(agent_coord=(0, 0), stair_coord=(3, 0), gold_coords=[(1, 0), (2, 2)], max_episode_steps=100)
+    state, _ = env.myreset()
+    plan = Plan()
+    plan.add_reverse(action=[W, E, E, E], coords=(3, 0))
+    recorder = TrajectoryRecorder.from_state(state=state, width=env.width, height=env.height)
+    states, rewards, done = apply(env=env, plan=plan, recorder=recorder)
+    assert states is recorder
+    assert done
+    assert recorder.column('action').tolist() == [NO_ACTION, W, E, E, E]
+    assert recorder.column('gold').tolist() == [0, 0, 100, 100, 100]
+    assert [state['agent_coord'] for state in recorder.states()] == [(0, 0), (0, 0), (1, 0), (2, 0), (3, 0)]
+
+
+def test_recorder_matches_the_states(room):
+    env = room(agent_coord=(0, 0), stair_coord=(3, 0), gold_coords=[(1, 0), (2, 2)], max_episode_steps=100)
+    states, rewards, done, _, _ = online_greedy_search(env=env, rng=0)
+    state, _ = env.myreset()
+    recorder = TrajectoryRecorder.from_state(state=state, width=env.width, height=env.height)
+    recorded, recorded_rewards, recorded_done, _, _ = online_greedy_search(env=env, rng=0, recorder=recorder)
+    assert (recorded_rewards, recorded_done) == (rewards, done)
+    assert [(s['agent_coord'], s['gold_coords'], s['gold']) for s in recorded.states()] == [(s['agent_coord'], s['gold_coords'], s['gold']) for s in states]
@@ -0,0 +1,16 @@
+from symbolic_env import SymbolicGoldRoom
+from online_search import online_random_greedy_search
+from vector_env import SubprocVectorGoldRoom, observation_shapes
+
+
+def test_symbolic_env_has_no_raw_observations():
+    assert observation_shapes(env=SymbolicGoldRoom()) == {'chars': (0,), 'blstats': (0,), 'message': (256,)}
+
+
+# The slot carries the seed sequence of its worker env, so a policy run on it is seeded as on the env itself
+def test_slot_policies_are_seeded():
+    kwargs = {'width': 6, 'height': 6, 'n_golds': 4, 'gold_score': 100, 'stair_score': 10, 'time_penalty': -1, 'max_episode_steps': 40, 'seed': 5}
+    _, rewards, done, steps, _ = online_random_greedy_search(env=SymbolicGoldRoom(**kwargs))
+    with SubprocVectorGoldRoom(env_kwargs=[kwargs], env_factory=SymbolicGoldRoom) as vector_env:
+        _, slot_rewards, slot_done, slot_steps, _ = vector_env.map(online_random_greedy_search)[0]
+    assert (slot_rewards, slot_done, slot_steps) == (rewards, done, steps)
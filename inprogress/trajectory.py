@@ -0,0 +1,193 @@
+import os
+import numpy as np
+from typing import Iterator, List, Tuple, Union
+from utils import move_to_action
+
+FLOOR_CHAR = 46
+GOLD_CHAR = 36
+LEPRECHAUN_CHAR = 108
+AGENT_CHAR = 64
+STAIR_CHAR = 62
+
+# colors of the frames replayed by show_episode
+PALETTE = {
+    FLOOR_CHAR: (40, 40, 40),
+    STAIR_CHAR: (200, 200, 200),
+    GOLD_CHAR: (255, 215, 0),
+    LEPRECHAUN_CHAR: (0, 170, 0),
+    AGENT_CHAR: (220, 40, 40)
+}
+
+NO_ACTION = -1
+MAX_GOLDS = 64
+
+
+# Per-step columns of one episode, preallocated and doubled when full. Golds never move, so the golds still on the
+# floor are stored as a bitmask over the initial ones (bit i is gold_coords[i]); missing leprechauns are padded with -1.
+class TrajectoryRecorder:
+
+    def __init__(self, width: int, height: int, stair_coord: Tuple[int, int], gold_coords: List[Tuple[int, int]], n_leps: int = 0, capacity: int = 1024):
+        if len(gold_coords) > MAX_GOLDS:
+            raise ValueError(f'At most {MAX_GOLDS} golds can be recorded, not {len(gold_coords)}')
+        self.width = width
+        self.height = height
+        self.stair_coord = tuple(int(c) for c in stair_coord)
+        self.gold_coords = [tuple(int(c) for c in coord) for coord in gold_coords]
+        self.gold_bits = {coord: 1 << i for i, coord in enumerate(self.gold_coords)}
+        self.size = 0
+        capacity = max(capacity, 1)
+        self.columns = {
+            'agent_coord': np.zeros((capacity, 2), dtype=np.int16),
+            'gold_mask': np.zeros(capacity, dtype=np.uint64),
+            'leprechaun_coords': np.full((capacity, n_leps, 2), -1, dtype=np.int16),
+            'gold': np.zeros(capacity, dtype=np.float32),
+            'reward': np.zeros(capacity, dtype=np.float32),
+            'action': np.zeros(capacity, dtype=np.int8),
+            'time': np.zeros(capacity, dtype=np.int32)
+        }
+
+    def __len__(self) -> int:
+        return self.size
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[name][:self.size]
+
+    def _grow(self, n_leps: int) -> None:
+        capacity = len(self.columns['gold'])
+        if self.size == capacity:
+            for name, column in self.columns.items():
+                grown = np.full((2 * capacity,) + column.shape[1:], -1 if name == 'leprechaun_coords' else 0, dtype=column.dtype)
+                grown[:capacity] = column
+                self.columns[name] = grown
+        column = self.columns['leprechaun_coords']
+        if n_leps > column.shape[1]:
+            grown = np.full((column.shape[0], n_leps, 2), -1, dtype=column.dtype)
+            grown[:, :column.shape[1]] = column
+            self.columns['leprechaun_coords'] = grown
+
+    def append(self, state: dict, reward: float, action: int = NO_ACTION) -> None:
+        leprechaun_coords = state['leprechaun_coords']
+        self._grow(n_leps=len(leprechaun_coords))
+        i = self.size
+        gold_mask = 0
+        for coord in state['gold_coords']:
+            gold_mask |= self.gold_bits.get(tuple(coord), 0)
+        self.columns['agent_coord'][i] = state['agent_coord']
+        self.columns['gold_mask'][i] = gold_mask
+        self.columns['leprechaun_coords'][i] = -1
+        if len(leprechaun_coords) > 0:
+            self.columns['leprechaun_coords'][i, :len(leprechaun_coords)] = leprechaun_coords
+        self.columns['gold'][i] = state['gold']
+        self.columns['reward'][i] = reward
+        self.columns['action'][i] = action
+        self.columns['time'][i] = state['time']
+        self.size += 1
+
+    # Empty recorder for an episode starting from state, to be given as recorder to the rollout loops of the search
+    # algorithms
+    @classmethod
+    def from_state(cls, state: dict, width: int, height: int, capacity: int = 1024) -> 'TrajectoryRecorder':
+        return cls(
+            width=width, height=height, stair_coord=state['stair_coord'], gold_coords=state['gold_coords'],
+            n_leps=len(state['leprechaun_coords']), capacity=capacity
+        )
+
+    # Recorder of the states and rewards returned by the algorithms that take no recorder. The actions are recovered
+    # from the moves of the agent, so the steps in which it did not move (e.g. bumping into a wall) get NO_ACTION.
+    @classmethod
+    def from_states(cls, states: List[dict], rewards: List[float], width: int, height: int) -> 'TrajectoryRecorder':
+        recorder = cls(
+            width=width, height=height, stair_coord=states[0]['stair_coord'], gold_coords=states[0]['gold_coords'],
+            n_leps=max([len(state['leprechaun_coords']) for state in states]), capacity=len(states)
+        )
+        prev_coord = None
+        for state, reward in zip(states, rewards):
+            action = NO_ACTION
+            if prev_coord != None and tuple(state['agent_coord']) != prev_coord:
+                action = move_to_action(np.array(state['agent_coord']) - np.array(prev_coord))
+                action = NO_ACTION if action == None else action
+            recorder.append(state=state, reward=reward, action=action)
+            prev_coord = tuple(state['agent_coord'])
+        return recorder
+
+    def state(self, i: int) -> dict:
+        gold_mask = int(self.columns['gold_mask'][i])
+        leprechaun_coords = [tuple(coord) for coord in self.columns['leprechaun_coords'][i].tolist() if coord[0] >= 0]
+        env_state = {
+            'gold': float(self.columns['gold'][i]),
+            'time': int(self.columns['time'][i]),
+            'agent_coord': tuple(self.columns['agent_coord'][i].tolist()),
+            'stair_coord': self.stair_coord,
+            'gold_coords': [coord for coord in self.gold_coords if gold_mask & self.gold_bits[coord]],
+            'leprechaun_coords': leprechaun_coords,
+            'map': None,
+            'pixel': None,
+            'glyphs': None,
+            'message': None
+        }
+        env_state['map'] = self.render_map(state=env_state)
+        return env_state
+
+    def states(self) -> Iterator[dict]:
+        for i in range(self.size):
+            yield self.state(i)
+
+    def render_map(self, state: dict) -> np.ndarray:
+        env_map = np.full((self.height, self.width), FLOOR_CHAR, dtype=np.uint8)
+        for coords, char in [([state['stair_coord']], STAIR_CHAR), (state['gold_coords'], GOLD_CHAR), (state['leprechaun_coords'], LEPRECHAUN_CHAR), ([state['agent_coord']], AGENT_CHAR)]:
+            for x, y in coords:
+                env_map[self.height - y - 1, x] = char
+        return env_map
+
+    # RGB frame of step i, one block of scale x scale pixels per cell
+    def image(self, i: int, scale: int = 16) -> np.ndarray:
+        env_map = self.state(i)['map']
+        frame = np.zeros(env_map.shape + (3,), dtype=np.uint8)
+        for char, color in PALETTE.items():
+            frame[env_map == char] = color
+        return np.kron(frame, np.ones((scale, scale, 1), dtype=np.uint8))
+
+    # Saved as a single .npz archive if the path ends with .npz, otherwise as a directory of .npy files that load
+    # opens memory-mapped
+    def save(self, path: str) -> str:
+        arrays = {name: self.column(name) for name in self.columns}
+        arrays['shape'] = np.array([self.width, self.height])
+        arrays['stair_coord'] = np.array(self.stair_coord)
+        arrays['gold_coords'] = np.array(self.gold_coords, dtype=np.int16).reshape(-1, 2)
+        if path.endswith('.npz'):
+            directory = os.path.dirname(path)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            np.savez(path, **arrays)
+        else:
+            os.makedirs(path, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(path, f'{name}.npy'), array)
+        return path
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r') -> 'TrajectoryRecorder':
+        if path.endswith('.npz'):
+            with np.load(path) as archive:
+                arrays = {name: archive[name] for name in archive.files}
+        else:
+            arrays = {
+                name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+                for name in os.listdir(path) if name.endswith('.npy')
+            }
+        width, height = arrays['shape'].tolist()
+        recorder = cls(
+            width=width, height=height, stair_coord=arrays['stair_coord'].tolist(),
+            gold_coords=[tuple(coord) for coord in arrays['gold_coords'].tolist()], capacity=1
+        )
+        recorder.columns = {name: arrays[name] for name in recorder.columns}
+        recorder.size = len(recorder.columns['gold'])
+        return recorder
+
+
+# Step of a rollout loop: appended with its action to the recorder, or kept as a state dict when states is a list
+def record_step(states: Union[List[dict], TrajectoryRecorder], state: dict, reward: float, action: int = NO_ACTION) -> None:
+    if isinstance(states, TrajectoryRecorder):
+        states.append(state=state, reward=reward, action=action)
+    else:
+        states.append(state)
@@ -5,11 +5,15 @@ import IPython.display as display
 import random
 import numpy as np
 from queue import PriorityQueue
-from typing import List, Tuple, Callable
+from typing import Any, List, Tuple, Callable
+import inspect
 import json
+import math
+import os
 
 import gym
 from tqdm import tqdm
+from layout import LevelCache, stream_seed
 
 N_ARR = np.array([0, 1])
 S_ARR = np.array([0, -1])
@@ -76,8 +80,131 @@ class AllowedCompositeMovesFunction(AllowedMovesFunction):
             [np.array(state['stair_coord']) - np.array(state['agent_coord'])] \
                 + [np.array(g_coord) - np.array(state['agent_coord']) for g_coord in state['gold_coords'] if state['agent_coord'] != g_coord]
 
+
+# Jump point search (Harabor and Grastien, 2011) over the simple moves: each move is a run of identical steps, to the
+# next cell where the optimal paths can change direction, so the searches do not expand the many equivalent orderings
+# of the straight and diagonal steps of an open room. Runs stop on the golds still on the floor and on the stair, and
+# around the cells that cannot be crossed (to_avoid, the leprechauns and the stair, which ends the episode), where
+# they make forced neighbours. Given the direction of the last step, only the natural and forced directions are
+# followed; without it (at the start, or after collecting a gold) all the directions are. The moves are meant for the
+# offline searches (successors in planning.py), which expand each run into its steps.
+class JumpPointMovesFunction(AllowedSimpleMovesFunction):
+
+    def __call__(self, state: dict, direction: Tuple[int, int] = None) -> List[np.ndarray[int]]:
+        origin = tuple(int(c) for c in state['agent_coord'])
+        stair_coord = tuple(int(c) for c in state['stair_coord'])
+        goals = set(tuple(int(c) for c in coord) for coord in state['gold_coords']) | {stair_coord}
+        goals.discard(origin)
+        blocked = set(tuple(int(c) for c in coord) for coord in self.to_avoid + state['leprechaun_coords'])
+        # the stair can be entered but not crossed
+        walls = blocked | {stair_coord}
+
+        if direction == None:
+            directions = [tuple(int(c) for c in move) for move in MOVES]
+        else:
+            directions = self._pruned_directions(cell=origin, direction=(int(np.sign(direction[0])), int(np.sign(direction[1]))), walls=walls, blocked=blocked)
+
+        moves = []
+        for dx, dy in directions:
+            point = self._jump(cell=origin, direction=(dx, dy), goals=goals, walls=walls, blocked=blocked)
+            if point != None:
+                moves.append(np.array([point[0] - origin[0], point[1] - origin[1]]))
+        return moves
+
+    def _inside(self, cell: Tuple[int, int]) -> bool:
+        return 0 <= cell[0] < self.width and 0 <= cell[1] < self.height
+
+    # A wall inside the grid with a free cell beyond it (out of the grid there is no neighbour to force)
+    def _forces(self, wall: Tuple[int, int], beyond: Tuple[int, int], walls: set, blocked: set) -> bool:
+        return wall in walls and self._inside(beyond) and beyond not in blocked
+
+    # Directions of the forced neighbours of cell, reached moving in direction
+    def _forced_directions(self, cell: Tuple[int, int], direction: Tuple[int, int], walls: set, blocked: set) -> List[Tuple[int, int]]:
+        x, y = cell
+        dx, dy = direction
+        forced = []
+        if dx != 0 and dy != 0:
+            if self._forces(wall=(x - dx, y), beyond=(x - dx, y + dy), walls=walls, blocked=blocked):
+                forced.append((-dx, dy))
+            if self._forces(wall=(x, y - dy), beyond=(x + dx, y - dy), walls=walls, blocked=blocked):
+                forced.append((dx, -dy))
+        elif dx != 0:
+            for side in [1, -1]:
+                if self._forces(wall=(x, y + side), beyond=(x + dx, y + side), walls=walls, blocked=blocked):
+                    forced.append((dx, side))
+        else:
+            for side in [1, -1]:
+                if self._forces(wall=(x + side, y), beyond=(x + side, y + dy), walls=walls, blocked=blocked):
+                    forced.append((side, dy))
+        return forced
+
+    def _pruned_directions(self, cell: Tuple[int, int], direction: Tuple[int, int], walls: set, blocked: set) -> List[Tuple[int, int]]:
+        dx, dy = direction
+        natural = [direction] if dx == 0 or dy == 0 else [direction, (dx, 0), (0, dy)]
+        return natural + self._forced_directions(cell=cell, direction=direction, walls=walls, blocked=blocked)
+
+    # Next jump point from cell in direction, None if the run ends without one
+    def _jump(self, cell: Tuple[int, int], direction: Tuple[int, int], goals: set, walls: set, blocked: set) -> Tuple[int, int]:
+        dx, dy = direction
+        x, y = cell
+        while True:
+            x, y = x + dx, y + dy
+            if not self._inside((x, y)) or (x, y) in blocked:
+                return None
+            if (x, y) in goals or self._forced_directions(cell=(x, y), direction=direction, walls=walls, blocked=blocked) != []:
+                return (x, y)
+            if dx != 0 and dy != 0:
+                # a diagonal run stops where one of its straight components finds a jump point
+                if self._jump(cell=(x, y), direction=(dx, 0), goals=goals, walls=walls, blocked=blocked) != None or \
+                        self._jump(cell=(x, y), direction=(0, dy), goals=goals, walls=walls, blocked=blocked) != None:
+                    return (x, y)
+
+
+# What only depends on the size of a room, shared by all the layouts of that size: the coordinates of the cells
+# (indexed as y * width + x), the simple moves of allowed_moves from each cell, in the same order, and the euclidean
+# distances from a cell to all the others, computed the first time they are asked for
+class GridTables:
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.coords = [(x, y) for y in range(height) for x in range(width)]
+        self.moves = [allowed_moves(width=width, height=height, state={'agent_coord': coord, 'leprechaun_coords': []}) for coord in self.coords]
+        self.cells = np.array(self.coords).reshape(-1, 2)
+        self.rows = {}
+
+    def cell(self, coord: Tuple[int, int]) -> int:
+        return int(coord[1]) * self.width + int(coord[0])
+
+    # same values of HeuristicContext, which computes them with np.linalg.norm
+    def distances(self, coord: Tuple[int, int]) -> List[float]:
+        cell = self.cell(coord)
+        if cell not in self.rows:
+            self.rows[cell] = np.linalg.norm(self.cells - np.array(self.coords[cell]), axis=1).tolist()
+        return self.rows[cell]
+
+
+# allowed_moves read from the moves of GridTables, filtering the cells to avoid only when there are some
+class GridMovesFunction(AllowedSimpleMovesFunction):
+
+    def __init__(self, grid: GridTables, to_avoid: List[Tuple[int, int]] = []):
+        super().__init__(width=grid.width, height=grid.height, to_avoid=to_avoid)
+        self.grid = grid
+
+    def __call__(self, state: dict) -> List[np.ndarray[int]]:
+        if (self.width, self.height) != (self.grid.width, self.grid.height):
+            raise ValueError(f'The grid tables are {self.grid.width}x{self.grid.height}, not {self.width}x{self.height}')
+        moves = self.grid.moves[self.grid.cell(state['agent_coord'])]
+        to_avoid = self.to_avoid + state['leprechaun_coords']
+        if to_avoid == []:
+            return moves
+        x, y = state['agent_coord']
+        return [m for m in moves if (x + int(m[0]), y + int(m[1])) not in to_avoid]
+
+
 ALLOWED_SIMPLE_MOVES = AllowedSimpleMovesFunction()
 ALLOWED_COMPOSITE_MOVES = AllowedCompositeMovesFunction()
+ALLOWED_JUMP_POINT_MOVES = JumpPointMovesFunction()
 
 
 def move_to_action(move: np.ndarray[int]) -> List[int]:
@@ -122,16 +249,54 @@ def action_to_string(action: int) -> str:
     return ACTION_NAMES[action]
 
 
-def show_episode(states: dict, clear_output: bool = True) -> None:
-    image = plt.imshow(states[0]['pixel'][100:300, 500:750])
-    for state in states[1:]:
+GLYPH_MAPPER = None
+
+
+def glyphs_to_pixel(glyphs: np.ndarray) -> np.ndarray:
+    global GLYPH_MAPPER
+    if GLYPH_MAPPER == None:
+        # loading the tiles is slow, so it is done only the first time pixels are needed
+        from minihack.tiles import GlyphMapper
+        GLYPH_MAPPER = GlyphMapper()
+    return GLYPH_MAPPER.to_rgb(glyphs)
+
+
+# Pixels of a state of an environment with observation_mode 'full' (already rendered) or 'on_demand' (rendered here)
+def state_pixel(state: dict) -> np.ndarray:
+    if state.get('pixel') is not None:
+        return state['pixel']
+    if state.get('glyphs') is not None:
+        return glyphs_to_pixel(glyphs=state['glyphs'])
+    raise RuntimeError("The state has no pixels, use observation_mode='on_demand' or 'full'")
+
+
+# states is either the list of states returned by a search algorithm or a TrajectoryRecorder
+def show_episode(states: Any, clear_output: bool = True) -> None:
+    from trajectory import TrajectoryRecorder
+    if isinstance(states, TrajectoryRecorder):
+        frames = (states.image(i) for i in range(len(states)))
+    else:
+        frames = (np.array(state_pixel(state=state))[100:300, 500:750] for state in states)
+    image = plt.imshow(next(frames))
+    for frame in frames:
         display.display(plt.gcf())
         if clear_output:
             display.clear_output(wait=True)
-        image.set_data(np.array(state['pixel'])[100:300, 500:750])
+        image.set_data(frame)
         time.sleep(0.3)
 
 
+# Random stream of a policy: the given seed or generator, otherwise a stream derived from the seed sequence of the
+# environment and the name of the algorithm. A seeded environment gives reproducible episodes, and the draws of the
+# policy never consume the stream of the environment, so they do not depend on what ran on it before.
+def policy_rng(env: Any, rng: Any = None, algorithm: str = None) -> np.random.Generator:
+    if rng == None:
+        seed_sequence = getattr(env, 'seed_sequence', None)
+        if seed_sequence != None:
+            rng = stream_seed(seed_sequence.entropy, 'policy', algorithm)
+    return np.random.default_rng(rng)
+
+
 def allowed_moves(width: int, height: int, state: dict, to_avoid: List[Tuple[int, int]] = []) -> List[np.ndarray[int]]:
     x, y = state['agent_coord']
     n = 0b1000
@@ -226,6 +391,134 @@ def scaled_default_score(next_state: dict, curr_state: dict, env: dict, curr_g:
         return 0
     return (default_score(next_state=next_state, curr_state=curr_state, env=env, curr_g=curr_g) - min_g_value) / (max_g_value - min_g_value)
 
+
+# What default_heuristic, default_score and their scaled versions need of an env, computed once from its to_dict():
+# cells are indexed as y * width + x, with the distance of every cell to the stair and to each gold, and the constants
+# of the scaled versions. The methods return the same values of those functions with env as argument. With the
+# GridTables of the size of env, the distances are those of the grid, shared with the other layouts of that size.
+class HeuristicContext:
+
+    def __init__(self, env: dict, grid: GridTables = None):
+        self.width = env['width']
+        self.height = env['height']
+        self.time_penalty = env['time_penalty']
+        self.gold_score = env['gold_score']
+        self.stair_score = env['stair_score']
+        self.stair_coord = tuple(env['stair_coord'])
+        self.gold_coords = [tuple(coord) for coord in env['gold_coords']]
+        self.coords = [(x, y) for y in range(self.height) for x in range(self.width)]
+        self.stair_cell = self.cell(self.stair_coord)
+
+        # index of the gold lying on each cell (-1 if there is none)
+        self.cell_golds = [-1] * len(self.coords)
+        for i, coord in enumerate(self.gold_coords):
+            self.cell_golds[self.cell(coord)] = i
+
+        if grid != None and (grid.width, grid.height) == (self.width, self.height):
+            self.stair_dists = grid.distances(self.stair_coord)
+            self.gold_dists = [grid.distances(coord) for coord in self.gold_coords]
+        else:
+            cells = np.array(self.coords).reshape(-1, 2)
+            self.stair_dists = np.linalg.norm(cells - np.array(self.stair_coord), axis=1).tolist()
+            self.gold_dists = [np.linalg.norm(cells - np.array(coord), axis=1).tolist() for coord in self.gold_coords]
+        self.gold_stair_dists = [self.stair_dists[self.cell(coord)] for coord in self.gold_coords]
+
+        vertices = [(0, 0), (0, self.height - 1), (self.width - 1, 0), (self.width - 1, self.height - 1)]
+        self.min_h_value = self.time_penalty * max([self.stair_dists[self.cell(v)] for v in vertices])
+        self.max_h_golds = self.gold_score * len(self.gold_coords)
+        self.max_g_value = self.time_penalty + self.gold_score + self.stair_score
+        self.min_g_value = self.time_penalty
+
+    def cell(self, coord: Tuple[int, int]) -> int:
+        return int(coord[1]) * self.width + int(coord[0])
+
+    # distance between the gold on coord and the agent on agent_cell, also for golds not in the env (moved ones)
+    def gold_dist(self, coord: Tuple[int, int], cell: int, agent_cell: int) -> float:
+        i = self.cell_golds[cell]
+        if i >= 0 and self.gold_coords[i] == tuple(coord):
+            return self.gold_dists[i][agent_cell]
+        agent_coord = self.coords[agent_cell]
+        return math.sqrt((coord[0] - agent_coord[0]) ** 2 + (coord[1] - agent_coord[1]) ** 2)
+
+    def heuristic(self, state: dict) -> float:
+        agent_cell = self.cell(state['agent_coord'])
+        agent_stair_dist = self.stair_dists[agent_cell]
+        if agent_stair_dist == 0:
+            return 0
+        gold_in_stair = (self.stair_coord in state['gold_coords'])
+        strategy1_score = self.time_penalty * agent_stair_dist + self.stair_score + self.gold_score * gold_in_stair
+        n_golds = 0
+        min_path_length = math.inf
+        for coord in state['gold_coords']:
+            cell = self.cell(coord)
+            if cell == agent_cell or cell == self.stair_cell:
+                continue
+            n_golds += 1
+            min_path_length = min(min_path_length, self.gold_dist(coord=coord, cell=cell, agent_cell=agent_cell) + self.stair_dists[cell])
+        if n_golds == 0:
+            return strategy1_score
+        strategy2_score = self.time_penalty * min_path_length + self.gold_score * n_golds + self.stair_score + self.gold_score * gold_in_stair
+        return max(strategy1_score, strategy2_score)
+
+    def score(self, next_state: dict, curr_state: dict = None, curr_g: float = 0.0) -> float:
+        score = curr_g + self.gold_score * (next_state['agent_coord'] in next_state['gold_coords'])
+        if curr_state == None:
+            return score
+        (x, y), (curr_x, curr_y) = next_state['agent_coord'], curr_state['agent_coord']
+        return score + \
+            self.stair_score * (self.cell(next_state['agent_coord']) == self.stair_cell) + \
+            self.time_penalty * math.sqrt((x - curr_x) ** 2 + (y - curr_y) ** 2)
+
+    def scaled_heuristic(self, state: dict) -> float:
+        agent_stair_dist = self.stair_dists[self.cell(state['agent_coord'])]
+        if len(state['gold_coords']) == 0:
+            return self.time_penalty * agent_stair_dist + self.stair_score
+        min_gold_stair_dist = min([self.stair_dists[self.cell(coord)] for coord in state['gold_coords']])
+        max_h_value = max(
+            self.time_penalty + self.time_penalty * min_gold_stair_dist + self.max_h_golds + self.stair_score,
+            self.time_penalty * agent_stair_dist + self.stair_score
+        )
+        if max_h_value == self.min_h_value:
+            return 0
+        return (self.heuristic(state=state) - self.min_h_value) / (max_h_value - self.min_h_value)
+
+    def scaled_score(self, next_state: dict, curr_state: dict, curr_g: float = 0.0) -> float:
+        if self.max_g_value == self.min_g_value:
+            return 0
+        return (self.score(next_state=next_state, curr_state=curr_state, curr_g=curr_g) - self.min_g_value) / (self.max_g_value - self.min_g_value)
+
+
+# Opt-in memo of a heuristic h(state=...), with a bounded LRU (LevelCache) keyed on a compact key of the state:
+# (cell, gold mask) for the states of the planners, (agent_coord, gold_coords) for the dict states of the online
+# policies. The key leaves out the room, so a memo must only be used on one env.
+class MemoizedHeuristic:
+
+    def __init__(self, h: Callable[[Any], float], maxsize: int = 100000):
+        self.h = h
+        self.cache = LevelCache(maxsize=maxsize)
+
+    def key(self, state: Any) -> tuple:
+        if isinstance(state, dict):
+            return (tuple(state['agent_coord']), tuple([tuple(coord) for coord in state['gold_coords']]))
+        return (state.cell, state.golds)
+
+    def __call__(self, state: Any) -> float:
+        key = self.key(state)
+        value = self.cache.get(key)
+        if value == None:
+            value = self.h(state=state)
+            self.cache.put(key, value)
+        return value
+
+    def stats(self) -> dict:
+        calls = self.cache.hits + self.cache.misses
+        return {
+            'hits': self.cache.hits,
+            'misses': self.cache.misses,
+            'evictions': self.cache.evictions,
+            'hit_ratio': self.cache.hits / calls if calls > 0 else 0.0
+        }
+
 def run_episodes(
     widths: List[int],
     heights: List[int],
@@ -239,9 +532,20 @@ def run_episodes(
     max_steps: int,
     n_episodes: int,
     max_fraction = 0.8,
-    return_states: bool = False
+    return_states: bool = False,
+    env_factory: Callable[..., Any] = None,
+    trajectory_dir: str = 'trajectories',
+    seed: int = None,
+    observation_mode: str = 'symbolic'
     ) -> List[dict]:
 
+    from trajectory import TrajectoryRecorder
+    from layout import stream_seed
+
+    # observation_mode of the default env_factory: 'on_demand' or 'full' keep what the states need to be rendered
+    if env_factory == None:
+        env_factory = lambda **kwargs: gym.make('MiniHack-MyTask-Custom-v0', observation_mode=observation_mode, **kwargs)
+
     episodes = []
 
     for width, height in zip(widths, heights):
@@ -262,9 +566,13 @@ def run_episodes(
                                         'time_penalty': time_penalty
                                     }
 
-                                    for _ in range(n_episodes):
-                                        env = gym.make(
-                                            'MiniHack-MyTask-Custom-v0',
+                                    for episode_index in range(n_episodes):
+                                        # every (cell, episode) has its own stream, whatever process runs it
+                                        env_kwargs = {}
+                                        if seed != None:
+                                            env_kwargs['seed'] = stream_seed(seed, width, height, time_penalty, gold_score, stair_score, nl, ng, episode_index)
+
+                                        env = env_factory(
                                             width=width,
                                             height=height,
                                             n_leps=nl,
@@ -272,7 +580,8 @@ def run_episodes(
                                             max_episode_steps=max_steps,
                                             gold_score=gold_score,
                                             stair_score=stair_score,
-                                            time_penalty=time_penalty
+                                            time_penalty=time_penalty,
+                                            **env_kwargs
                                             )
 
                                         for search_algorithm, alg_params in zip(algorithms, alg_paramss):
@@ -283,14 +592,22 @@ def run_episodes(
                                                     'params': [(key, str(value)) for key, value in kwargs.items()]
                                                 }
 
-                                                env.myreset()
-                                                states, rewards, done, iters, steps = search_algorithm(env=env, max_steps=max_steps, **kwargs)
-
-                                                gold_gains = [states[0]['gold']]
+                                                # the algorithms that take a recorder fill it step by step, without keeping the state dicts
+                                                state, _ = env.myreset()
+                                                recorder_kwargs = {}
+                                                if 'recorder' in inspect.signature(search_algorithm).parameters:
+                                                    recorder_kwargs['recorder'] = TrajectoryRecorder.from_state(state=state, width=width, height=height)
+                                                states, rewards, done, iters, steps = search_algorithm(env=env, max_steps=max_steps, **kwargs, **recorder_kwargs)
+                                                if isinstance(states, TrajectoryRecorder):
+                                                    golds = states.column('gold').tolist()
+                                                else:
+                                                    golds = [state['gold'] for state in states]
+
+                                                gold_gains = [golds[0]]
                                                 gold_thefts = [0]
-                                                for state in states[1:]:
+                                                for gold in golds[1:]:
                                                     prev = gold_gains[-1]
-                                                    diff = state['gold']-prev
+                                                    diff = gold-prev
                                                     if diff >= 0:
                                                         gold_gains.append(diff)
                                                         gold_thefts.append(0)
@@ -307,8 +624,12 @@ def run_episodes(
                                                     'done': done
                                                 }
 
+                                                # the states are stored as a TrajectoryRecorder file, results only keep its path
                                                 if return_states:
-                                                    results['states'] = states
+                                                    trajectory = states
+                                                    if not isinstance(trajectory, TrajectoryRecorder):
+                                                        trajectory = TrajectoryRecorder.from_states(states=states, rewards=rewards, width=width, height=height)
+                                                    results['trajectory'] = trajectory.save(path=os.path.join(trajectory_dir, f'episode_{len(episodes)}.npz'))
 
                                                 episode = {
                                                     'init': init,
@@ -376,6 +697,37 @@ def get_plot(
     return handles, labels
 
 
+# Parameters of a planner as stored in the results of design_plan, with the moves functions named by their kind
+def algorithm_params(kwargs: dict) -> List[Tuple[str, str]]:
+    params = []
+    for key, value in kwargs.items():
+        if not isinstance(value, AllowedMovesFunction):
+            params.append((key, str(value)))
+        elif isinstance(value, JumpPointMovesFunction):
+            params.append((key, 'jump_point_moves'))
+        elif isinstance(value, AllowedSimpleMovesFunction):
+            params.append((key, 'simple_moves'))
+        else:
+            params.append((key, 'composite_moves'))
+    return params
+
+
+# Results of a plan as stored by design_plan, from its Plan.stats
+def plan_results(plan_stats: dict, expanded_nodes: int) -> dict:
+    results = {
+        'expanded_nodes': expanded_nodes,
+        'path_len': plan_stats['path_len'],
+        'score': plan_stats['score']
+    }
+    if 'heuristic_cache' in plan_stats:
+        results['heuristic_cache'] = plan_stats['heuristic_cache']
+    if 'outcome' in plan_stats:
+        results['status'] = plan_stats['outcome']['status']
+        results['limit'] = plan_stats['outcome']['limit']
+        results['complete'] = plan_stats['outcome']['complete']
+    return results
+
+
 def design_plan(
     widths: List[int],
     heights: List[int],
@@ -389,9 +741,28 @@ def design_plan(
     max_steps: int,
     n_episodes: int,
     max_fraction = 0.8,
-    return_states: bool = False
+    env_factory: Callable[..., Any] = None,
+    seed: int = None,
+    subplan_cache_path: str = None,
+    search_limits: dict = None,
+    observation_mode: str = 'symbolic'
     ) -> List[dict]:
 
+    from layout import stream_seed
+    from distance_tables import SUBPLAN_CACHE
+
+    # limits (max_expansions, max_seconds, max_frontier) given to every algorithm that accepts them, so that a slow
+    # configuration ends with a 'limit_hit' outcome instead of stalling the sweep
+    search_limits = {} if search_limits == None else search_limits
+
+    # subplans computed by previous runs of the sweep
+    if subplan_cache_path != None:
+        SUBPLAN_CACHE.load(path=subplan_cache_path)
+
+    # observation_mode of the default env_factory: the planners only read the layout, so 'symbolic' is enough
+    if env_factory == None:
+        env_factory = lambda **kwargs: gym.make('MiniHack-MyTask-Custom-v0', observation_mode=observation_mode, **kwargs)
+
     plans = []
 
     i = 0
@@ -413,10 +784,13 @@ def design_plan(
                                         'time_penalty': time_penalty
                                     }
 
-                                    for _ in range(n_episodes):
+                                    for episode_index in range(n_episodes):
+                                        # every (cell, episode) has its own stream, whatever process runs it
+                                        env_kwargs = {}
+                                        if seed != None:
+                                            env_kwargs['seed'] = stream_seed(seed, width, height, time_penalty, gold_score, stair_score, nl, ng, episode_index)
 
-                                        env = gym.make(
-                                            'MiniHack-MyTask-Custom-v0',
+                                        env = env_factory(
                                             width=width,
                                             height=height,
                                             n_leps=nl,
@@ -424,40 +798,27 @@ def design_plan(
                                             max_episode_steps=max_steps,
                                             gold_score=gold_score,
                                             stair_score=stair_score,
-                                            time_penalty=time_penalty
+                                            time_penalty=time_penalty,
+                                            **env_kwargs
                                             )
 
                                     
                                         for search_algorithm, alg_params in zip(algorithms, alg_paramss):
                                             for kwargs in alg_params:
 
-                                                params = []
-                                                for key, value in kwargs.items():
-                                                    if 'Moves' not in str(value):
-                                                        params.append((key, str(value)))
-                                                    elif 'Simple' in str(value):
-                                                        params.append((key, 'simple_moves'))
-                                                    else:
-                                                        params.append((key, 'composite_moves'))
-                                                        
-
                                                 algorithm = {
                                                     'name': search_algorithm.__name__,
-                                                    'params': params
+                                                    'params': algorithm_params(kwargs=kwargs)
                                                 }
 
-                                                plan, expanded_nodes = search_algorithm(env=env, **kwargs)
-
-                                                plan_stats = plan.stats(env=env)
+                                                parameters = inspect.signature(search_algorithm).parameters
+                                                limits = {key: value for key, value in search_limits.items() if key in parameters and key not in kwargs}
+                                                plan, expanded_nodes = search_algorithm(env=env, **kwargs, **limits)
 
                                                 curr_plan = {
                                                     'init': init,
                                                     'algorithm': algorithm,
-                                                    'results': {
-                                                        'expanded_nodes': expanded_nodes,
-                                                        'path_len': plan_stats['path_len'],
-                                                        'score': plan_stats['score']
-                                                    }
+                                                    'results': plan_results(plan_stats=plan.stats(env=env), expanded_nodes=expanded_nodes)
                                                 }
 
                                                 plans.append(curr_plan)
@@ -465,4 +826,7 @@ def design_plan(
                                     with open(f'plans.json', 'w') as f:
                                         json.dump(plans, f)
 
+    if subplan_cache_path != None:
+        SUBPLAN_CACHE.save(path=subplan_cache_path)
+
     return plans        
\ No newline at end of file
@@ -0,0 +1,316 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from typing import Any, Callable, List, Tuple
+
+# raw NLE observations copied to the shared buffer; their shapes are read from the observation space of the worker env,
+# since they change across NLE versions (e.g. 26 or 27 blstats)
+RAW_OBSERVATION_KEYS = ['chars', 'blstats']
+
+# bytes of the message buffer when the env has no 'message' observation (the size of the NLE one)
+DEFAULT_MESSAGE_SHAPE = (256,)
+
+
+def make_nle_gold_room(**kwargs):
+    # imported here so that the main process does not need to boot NLE
+    import gym
+    import gold_room_env
+    return gym.make('MiniHack-MyTask-Custom-v0', **kwargs)
+
+
+# Shapes of the raw observations and of the message of env, empty for the observations it does not have (e.g. the
+# symbolic environment)
+def observation_shapes(env: Any) -> dict:
+    spaces = getattr(getattr(env, 'observation_space', None), 'spaces', {})
+    shapes = {key: tuple(spaces[key].shape) if key in spaces else (0,) for key in RAW_OBSERVATION_KEYS}
+    shapes['message'] = tuple(spaces['message'].shape) if 'message' in spaces else DEFAULT_MESSAGE_SHAPE
+    return shapes
+
+
+# Layout of the shared buffer of one slot: raw NLE observations first, then the parsed gold room state and the
+# outcome of the last step. Golds and leprechauns are padded to their initial number.
+def slot_layout(width: int, height: int, n_golds: int, n_leps: int, shapes: dict) -> List[Tuple[str, Any, Tuple[int, ...]]]:
+    return [
+        ('chars', np.uint8, shapes['chars']),
+        ('blstats', np.int64, shapes['blstats']),
+        ('message', np.uint8, shapes['message']),
+        ('map', np.uint8, (height, width)),
+        ('agent_coord', np.int64, (2,)),
+        ('gold_coords', np.int64, (n_golds, 2)),
+        ('n_golds', np.int64, (1,)),
+        ('leprechaun_coords', np.int64, (n_leps, 2)),
+        ('n_leps', np.int64, (1,)),
+        ('gold', np.float64, (1,)),
+        ('time', np.int64, (1,)),
+        ('reward', np.float64, (1,)),
+        ('done', np.bool_, (1,))
+    ]
+
+
+def slot_buffers(buffer: memoryview, layout: List[Tuple[str, Any, Tuple[int, ...]]]) -> dict:
+    buffers = {}
+    offset = 0
+    for name, dtype, shape in layout:
+        array = np.ndarray(shape=shape, dtype=dtype, buffer=buffer, offset=offset)
+        buffers[name] = array
+        offset += array.nbytes
+        offset += -offset % 8
+    return buffers
+
+
+def slot_size(layout: List[Tuple[str, Any, Tuple[int, ...]]]) -> int:
+    size = 0
+    for _, dtype, shape in layout:
+        size += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        size += -size % 8
+    return max(size, 1)
+
+
+def _write_state(buffers: dict, env: Any, state: dict, reward: float, done: bool) -> None:
+    # raw observations are only available for the NLE-backed environment
+    observation = getattr(env, 'observation', None)
+    if observation is not None:
+        for key in RAW_OBSERVATION_KEYS:
+            if key in observation and buffers[key].size > 0:
+                buffers[key][...] = observation[key]
+
+    message = ('' if state['message'] == None else state['message']).encode('utf-8')[:buffers['message'].shape[0]]
+    buffers['message'][...] = 0
+    buffers['message'][:len(message)] = np.frombuffer(message, dtype=np.uint8)
+
+    env_map = state['map']
+    if env_map is not None and env_map.shape == buffers['map'].shape:
+        buffers['map'][...] = env_map
+
+    buffers['agent_coord'][...] = state['agent_coord']
+    for key, count in [('gold_coords', 'n_golds'), ('leprechaun_coords', 'n_leps')]:
+        coords = state[key][:buffers[key].shape[0]]
+        buffers[count][0] = len(coords)
+        if len(coords) > 0:
+            buffers[key][:len(coords)] = coords
+    buffers['gold'][0] = state['gold']
+    buffers['time'][0] = state['time']
+    buffers['reward'][0] = reward
+    buffers['done'][0] = done
+
+
+def _worker(conn, env_factory: Callable[..., Any], env_kwargs: dict) -> None:
+    env = env_factory(**env_kwargs)
+    conn.send({
+        'width': env.width,
+        'height': env.height,
+        'gold_score': env.gold_score,
+        'stair_score': env.stair_score,
+        'time_penalty': env.time_penalty,
+        'max_episode_steps': env.max_episode_steps,
+        'agent_coord': tuple(int(c) for c in env.agent_coord),
+        'stair_coord': tuple(int(c) for c in env.stair_coord),
+        'gold_coords': [tuple(int(c) for c in coord) for coord in env.gold_coords],
+        'leprechaun_coords': [tuple(int(c) for c in coord) for coord in env.leprechaun_coords],
+        'observation_shapes': observation_shapes(env=env),
+        'rng_state': env.rng.bit_generator.state,
+        'seed_sequence': getattr(env, 'seed_sequence', None)
+    })
+
+    shm_name, offset, layout = conn.recv()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffers = slot_buffers(buffer=shm.buf[offset:offset + slot_size(layout)], layout=layout)
+
+    try:
+        while True:
+            command, arg = conn.recv()
+            if command == 'reset':
+                state, reward = env.myreset()
+                _write_state(buffers=buffers, env=env, state=state, reward=reward, done=False)
+            elif command == 'step':
+                state, reward, done = env.mystep(action=arg)
+                _write_state(buffers=buffers, env=env, state=state, reward=reward, done=done)
+            elif command == 'close':
+                break
+            else:
+                raise RuntimeError(f'Unknown command {command}')
+            conn.send(None)
+    finally:
+        del buffers
+        shm.close()
+        conn.close()
+
+
+# Proxy of a MiniHackGoldRoom living in a subprocess: it exposes the same myreset/mystep/state()/to_dict() contract,
+# so the algorithms of online_search.py can drive it unchanged. Observations are read back from the shared buffer. The
+# slot has the seed sequence and its own copy of the random stream of the worker env, so the policies run on it are
+# seeded as on the env itself.
+class GoldRoomSlot:
+
+    def __init__(self, conn, buffers: dict, info: dict):
+        self.conn = conn
+        self.buffers = buffers
+        self.width = info['width']
+        self.height = info['height']
+        self.gold_score = info['gold_score']
+        self.stair_score = info['stair_score']
+        self.time_penalty = info['time_penalty']
+        self.max_episode_steps = info['max_episode_steps']
+        self.agent_coord = info['agent_coord']
+        self.stair_coord = info['stair_coord']
+        self.gold_coords = info['gold_coords']
+        self.leprechaun_coords = info['leprechaun_coords']
+        self.rng = np.random.default_rng()
+        self.rng.bit_generator.state = info['rng_state']
+        self.seed_sequence = info['seed_sequence']
+        self.collected_gold = 0
+        self.instant = -1
+        self.matrix_map = None
+        self.message = None
+
+    def send(self, command: str, arg: Any = None) -> None:
+        self.conn.send((command, arg))
+
+    def receive(self) -> None:
+        self.conn.recv()
+        buffers = self.buffers
+        self.agent_coord = tuple(int(c) for c in buffers['agent_coord'])
+        self.gold_coords = [tuple(coord) for coord in buffers['gold_coords'][:buffers['n_golds'][0]].tolist()]
+        self.leprechaun_coords = [tuple(coord) for coord in buffers['leprechaun_coords'][:buffers['n_leps'][0]].tolist()]
+        self.collected_gold = float(buffers['gold'][0])
+        self.instant = int(buffers['time'][0])
+        self.matrix_map = buffers['map'].copy()
+        self.message = bytes(buffers['message']).decode('utf-8').rstrip('\x00')
+
+    def myreset(self) -> Tuple[dict, float]:
+        self.send(command='reset')
+        self.receive()
+        return self.state(), float(self.buffers['reward'][0])
+
+    def mystep(self, action: int) -> Tuple[dict, float, bool]:
+        self.send(command='step', arg=int(action))
+        self.receive()
+        return self.state(), float(self.buffers['reward'][0]), bool(self.buffers['done'][0])
+
+    def chars(self) -> np.ndarray:
+        return self.buffers['chars'].copy()
+
+    def blstats(self) -> np.ndarray:
+        return self.buffers['blstats'].copy()
+
+    def state(self):
+        env_state = {
+            'gold': self.collected_gold,
+            'time': self.instant,
+            'agent_coord': self.agent_coord,
+            'stair_coord': self.stair_coord,
+            'gold_coords': self.gold_coords,
+            'leprechaun_coords': self.leprechaun_coords,
+            'map': self.matrix_map,
+            'pixel': None,
+            'glyphs': None,
+            'message': self.message
+        }
+        return env_state
+
+    def to_dict(self):
+        return {
+            'height': self.height,
+            'width': self.width,
+            'time_penalty': self.time_penalty,
+            'gold_score': self.gold_score,
+            'stair_score': self.stair_score,
+            'agent_coord': self.agent_coord,
+            'stair_coord': self.stair_coord,
+            'gold_coords': self.gold_coords
+        }
+
+
+# Pool of subprocesses, each hosting one gold room. All the slots share a single preallocated shared memory block,
+# so observations never go through pickling: the pipes only carry the commands and the acknowledgements.
+class SubprocVectorGoldRoom:
+
+    def __init__(
+        self,
+        env_kwargs: List[dict],
+        env_factory: Callable[..., Any] = make_nle_gold_room,
+        start_method: str = 'spawn'
+    ):
+        if env_kwargs == []:
+            raise RuntimeError('At least one environment is needed')
+
+        context = mp.get_context(start_method)
+        self.conns = []
+        self.processes = []
+        for kwargs in env_kwargs:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker, args=(child_conn, env_factory, kwargs), daemon=True)
+            process.start()
+            child_conn.close()
+            self.conns.append(parent_conn)
+            self.processes.append(process)
+
+        infos = [conn.recv() for conn in self.conns]
+        layouts = [
+            slot_layout(
+                width=info['width'], height=info['height'], n_golds=len(info['gold_coords']),
+                n_leps=len(info['leprechaun_coords']), shapes=info['observation_shapes']
+            )
+            for info in infos
+        ]
+        sizes = [slot_size(layout) for layout in layouts]
+        self.shm = shared_memory.SharedMemory(create=True, size=sum(sizes))
+
+        self.slots = []
+        offset = 0
+        for conn, info, layout, size in zip(self.conns, infos, layouts, sizes):
+            conn.send((self.shm.name, offset, layout))
+            buffers = slot_buffers(buffer=self.shm.buf[offset:offset + size], layout=layout)
+            self.slots.append(GoldRoomSlot(conn=conn, buffers=buffers, info=info))
+            offset += size
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __getitem__(self, i: int) -> GoldRoomSlot:
+        return self.slots[i]
+
+    def myreset(self) -> List[Tuple[dict, float]]:
+        for slot in self.slots:
+            slot.send(command='reset')
+        results = []
+        for slot in self.slots:
+            slot.receive()
+            results.append((slot.state(), float(slot.buffers['reward'][0])))
+        return results
+
+    def mystep(self, actions: List[int]) -> List[Tuple[dict, float, bool]]:
+        if len(actions) != len(self.slots):
+            raise RuntimeError(f'Expected {len(self.slots)} actions, got {len(actions)}')
+        for slot, action in zip(self.slots, actions):
+            slot.send(command='step', arg=int(action))
+        results = []
+        for slot in self.slots:
+            slot.receive()
+            results.append((slot.state(), float(slot.buffers['reward'][0]), bool(slot.buffers['done'][0])))
+        return results
+
+    # Runs fn(slot, **kwargs) on every slot concurrently, e.g. one online search algorithm per slot. The environments
+    # step in their own processes, so the threads only serialize on the (cheap) policy computations.
+    def map(self, fn: Callable[..., Any], **kwargs) -> list:
+        with ThreadPoolExecutor(max_workers=len(self.slots)) as executor:
+            futures = [executor.submit(fn, env=slot, **kwargs) for slot in self.slots]
+            return [future.result() for future in futures]
+
+    def close(self) -> None:
+        for slot in self.slots:
+            slot.send(command='close')
+        for process in self.processes:
+            process.join()
+        for slot in self.slots:
+            slot.buffers = None
+        self.slots = []
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()